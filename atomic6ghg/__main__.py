@@ -1,11 +1,273 @@
 """"Console API for atomic6ghg"""
 # __main__.py
+import argparse
+import collections
+import csv
+import functools
+import io
+import itertools
+import logging
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 
+from atomic6ghg import json_backend, schemas
+from atomic6ghg.runner import CHUNKS_PER_WORKER, FORMULAS, document_type, initialize_worker
 
-def main() -> None:
-    """Reflect a description of the current package"""
-    print("Package under construction.")
+logger = logging.getLogger(__name__)
+
+# Worksheets sent to a worker at a time. With runner.CHUNKS_PER_WORKER chunks in flight per worker, this bounds how
+# much of the input and output is held in memory, however many worksheets the input has.
+CHUNK_SIZE = 256
+
+
+def parse_value(value: str, types=None):
+    """ CSV cell as a JSON value. types are the JSON schema types of its column, if known: a column that cannot hold
+    numbers keeps its cells as strings, and an empty cell is null unless the column is only a string. Otherwise
+    empty cells are null, finite numerals are numbers and anything else is a string. """
+    if types is not None and 'number' not in types and 'integer' not in types:
+        if value == '' and 'null' in types:
+            return None
+        return value
+    if value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    return number if math.isfinite(number) else value
+
+
+def property_types(properties: dict) -> dict:
+    """ JSON schema types of each of a schema's properties, as tuples; properties without a type are left out """
+    types = {}
+    for name, property_schema in properties.items():
+        property_type = property_schema.get('type')
+        if property_type:
+            types[name] = (property_type,) if isinstance(property_type, str) else tuple(property_type)
+    return types
+
+
+def column_types(wks_type: str, table: str) -> dict:
+    """ JSON schema types of each column of a row table, as tuples, from the worksheet schema. Empty if the worksheet
+    type has no schema or it does not describe the table. """
+    try:
+        schema = schemas.load_schema(wks_type)
+    except ValueError:
+        return {}
+    return property_types(schema.get('properties', {}).get(table, {}).get('items', {}).get('properties', {}))
+
+
+def field_types(wks_type: str) -> dict:
+    """ JSON schema types of each top level field of a worksheet, as tuples. Empty if the worksheet type has no
+    schema. """
+    try:
+        schema = schemas.load_schema(wks_type)
+    except ValueError:
+        return {}
+    return property_types(schema.get('properties', {}))
+
+
+def parse_fields(assignments, types=None) -> dict:
+    """ Worksheet fields from KEY=VALUE strings, each value parsed as a CSV cell of the field's JSON schema types.
+    Raises ValueError for a string without '='. """
+    types = types or {}
+    fields = {}
+    for assignment in assignments:
+        key, sep, value = assignment.partition('=')
+        if not sep or not key:
+            raise ValueError(f'expected KEY=VALUE, got {assignment!r}')
+        fields[key] = parse_value(value, types.get(key))
+    return fields
+
+
+def read_jsonl(stream):
+    """ Non-blank lines of a binary stream of newline-delimited JSON documents, left encoded for the workers """
+    for line in stream:
+        if line.strip():
+            yield line
+
+
+def read_csv(stream, types=None):
+    """ Rows of a binary stream of CSV with a header line, as dicts of JSON values. types optionally maps columns to
+    their JSON schema types, as given by column_types. """
+    types = types or {}
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    for row in csv.DictReader(text):
+        yield {key: parse_value(value, types.get(key)) for key, value in row.items()}
+
+
+def group_rows(rows, column=None, drop=False):
+    """ Lists of rows that make up one worksheet each: without column all the rows, otherwise each run of consecutive
+    rows with the same value in column, which is removed from the rows if drop. Raises ValueError if a row has no
+    such column. """
+    if column is None:
+        group = list(rows)
+        if group:
+            yield group
+        return
+
+    def key(row):
+        try:
+            return row[column]
+        except KeyError:
+            raise ValueError(f'CSV has no column {column!r}') from None
+
+    for _, group in itertools.groupby(rows, key):
+        if drop:
+            yield [{name: value for name, value in row.items() if name != column} for row in group]
+        else:
+            yield list(group)
+
+
+def compute_document(item, wks_type=None, table=None, validate=False, fields=None) -> bytes:
+    """ Compact JSON output of one input item: an encoded worksheet document, or with table a list of CSV rows
+    computed as that row table of one worksheet, along with the worksheet fields given by fields """
+    if table:
+        wks_data = {**(fields or {}), table: item}
+    else:
+        wks_data = json_backend.loads(item)
+    item_type = wks_type or document_type(wks_data)
+    if validate and table:
+        for field, value in (fields or {}).items():
+            schemas.validate_field(value, item_type, field)
+        for row in item:
+            schemas.validate_row(row, item_type, table)
+    elif validate:
+        schemas.validate(wks_data, item_type)
+    encoded = FORMULAS[item_type](wks_data).to_json_bytes()
+    if encoded is None:
+        raise TypeError('output is not JSON serializable')
+    return encoded
+
+
+def compute_chunk(items, **kwargs):
+    """ JSONL outputs of a list of input items, and the number of them that could not be computed. Each of those
+    gives an {"error": ...} line, so that output lines stay aligned with the inputs. """
+    lines = []
+    errors = 0
+    for item in items:
+        try:
+            lines.append(compute_document(item, **kwargs))
+        except Exception as e:  # pylint: disable=broad-except
+            lines.append(json_backend.dumpb({'error': f'{e.__class__.__name__}: {e}'}))
+            errors += 1
+    lines.append(b'')
+    return b'\n'.join(lines), errors
+
+
+def compute_chunks(chunks, compute, workers=1):
+    """ Apply compute to each chunk, yielding results in input order. With several workers chunks are computed in a
+    pool of processes, submitting a new chunk only as results are taken so that at most CHUNKS_PER_WORKER chunks per
+    worker are in flight. """
+    if workers == 1:
+        initialize_worker()
+        yield from map(compute, chunks)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initialize_worker) as executor:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(executor.submit(compute, chunk))
+            if len(pending) >= workers * CHUNKS_PER_WORKER:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def parse_args(argv=None):
+    """ Command line arguments """
+    parser = argparse.ArgumentParser(
+        prog='python -m atomic6ghg',
+        description='Compute greenhouse gas worksheets in bulk, writing one JSON output per input worksheet (JSONL).')
+    parser.add_argument('input', nargs='?', default='-',
+                        help='JSONL worksheet documents or CSV rows of one row table; - or omitted for stdin')
+    parser.add_argument('-o', '--output', default='-', help='JSONL output file; - or omitted for stdout')
+    parser.add_argument('--format', choices=('jsonl', 'csv'),
+                        help='input format, by default csv for .csv files and jsonl otherwise')
+    parser.add_argument('--type', choices=sorted(FORMULAS), dest='wks_type',
+                        help='worksheet type of every input, by default the type named by each document version; '
+                             'required for CSV')
+    parser.add_argument('--table', help='row table that CSV rows belong to, if the worksheet type has several')
+    parser.add_argument('--group-by', metavar='COLUMN',
+                        help='make a CSV worksheet of each run of consecutive rows with the same value in COLUMN, '
+                             'giving one output line per run; by default the whole CSV is one worksheet. COLUMN is '
+                             'removed from the rows unless it is a column of the row table')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', dest='fields',
+                        help='worksheet field given to every CSV worksheet, e.g. --set version=mobile-sources.1.0.0; '
+                             'may be repeated')
+    parser.add_argument('--validate', action='store_true',
+                        help='validate inputs against the worksheet schema, or CSV rows against their row table')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes, 0 for one per CPU (default 1)')
+    args = parser.parse_args(argv)
+
+    if args.format is None:
+        args.format = 'csv' if args.input.lower().endswith('.csv') else 'jsonl'
+    args.workers = args.workers or os.cpu_count() or 1
+    if args.workers < 0:
+        parser.error('--workers must not be negative')
+    if args.format == 'csv':
+        if args.wks_type is None:
+            parser.error('--type is required for CSV input')
+        row_tables = FORMULAS[args.wks_type].row_tables
+        if args.table is None and len(row_tables) == 1:
+            args.table = row_tables[0]
+        if args.table not in row_tables:
+            parser.error(f'--table must be one of {", ".join(row_tables)} for {args.wks_type}')
+        try:
+            args.fields = parse_fields(args.fields, field_types(args.wks_type))
+        except ValueError as e:
+            parser.error(f'--set {e}')
+        if args.table in args.fields:
+            parser.error(f'--set cannot give the row table {args.table}, which comes from the CSV rows')
+    else:
+        for option, value in (('--table', args.table), ('--group-by', args.group_by), ('--set', args.fields)):
+            if value:
+                parser.error(f'{option} only applies to CSV input')
+    return args
+
+
+def main(argv=None) -> int:
+    """ Stream worksheets from a file or stdin through their formulas and write the outputs as JSONL, in input
+    order. Returns 1 if any input gave an error output, otherwise 0. """
+    args = parse_args(argv)
+    source = sys.stdin.buffer if args.input == '-' else open(args.input, 'rb')  # pylint: disable=consider-using-with
+    sink = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')  # pylint: disable=consider-using-with
+    if args.format == 'csv':
+        types = column_types(args.wks_type, args.table)
+        compute = functools.partial(compute_chunk, wks_type=args.wks_type, table=args.table, validate=args.validate,
+                                    fields=args.fields)
+
+        def read(stream):
+            return group_rows(read_csv(stream, types), args.group_by, drop=args.group_by not in types)
+    else:
+        compute = functools.partial(compute_chunk, wks_type=args.wks_type, validate=args.validate)
+        read = read_jsonl
+
+    errors = 0
+    try:
+        items = read(source)
+        chunks = iter(lambda: list(itertools.islice(items, CHUNK_SIZE)), [])
+        for outputs, chunk_errors in compute_chunks(chunks, compute, workers=args.workers):
+            sink.write(outputs)
+            errors += chunk_errors
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        if sink is sys.stdout.buffer:
+            sink.flush()
+        else:
+            sink.close()
+
+    if errors:
+        logger.warning('%d inputs could not be computed', errors)
+    return 1 if errors else 0
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,170 @@
+""" asyncio front-end for formula computation, so that services can compute worksheets without blocking their event
+loop:
+
+    output = await compute(MobileSources, wks_data)
+
+Computations run in a bounded pool of threads, or of processes with processes=True, since formulas hold the GIL.
+Concurrent requests for the same formula are gathered for batch_delay seconds, up to batch_size of them, into one
+compute_many call. """
+import asyncio
+import functools
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from atomic6ghg.runner import FORMULAS, initialize_worker
+
+
+def compute_batch(formula_cls, documents, kwargs) -> list:
+    """ (output, exception) of each document, computed with formula_cls.compute_many. A document that raises gives
+    its exception and compute_many resumes with the next one. """
+    results = []
+    while len(results) < len(documents):
+        try:
+            for output in formula_cls.compute_many(documents[len(results):], **kwargs):
+                results.append((output, None))
+        except Exception as e:  # pylint: disable=broad-except
+            results.append((None, e))
+    return results
+
+
+def batch_key(formula_cls, kwargs, future) -> tuple:
+    """ Key of the batches a request can join: its formula and keyword arguments, or a key of its own when they are
+    not hashable """
+    key = (formula_cls, tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return (*key, id(future))
+    return key
+
+
+class FormulaPool:
+    """ Computes worksheets in a pool of max_workers threads (or processes), by default one per CPU.
+
+    At most max_pending requests, by default four per worker, are queued or running at once; further callers wait
+    for a slot, which applies backpressure to whatever feeds the pool. A caller that is cancelled gets CancelledError
+    at once: its document is dropped if its batch has not started, and a batch whose callers are all cancelled is
+    cancelled in the pool if it has not started either. """
+    def __init__(self, max_workers=None, processes=False, max_pending=None, batch_size=32, batch_delay=0.001):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.processes = processes
+        self.max_pending = max_pending or self.max_workers * 4
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+
+        self._executor = None
+        self._slots = None
+        self._batches = {}
+
+        # Number of requests queued or running
+        self.pending = 0
+
+    @property
+    def executor(self):
+        """ The thread or process pool, started on first use """
+        if self._executor is None:
+            if self.processes:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=initialize_worker)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='atomic6ghg')
+        return self._executor
+
+    async def compute(self, formula_cls, wks_data: dict, **kwargs):
+        """ to_dict() of formula_cls(wks_data, **kwargs), where formula_cls is a Formula subclass or a worksheet
+        type. Exceptions of the formula are raised here. """
+        if isinstance(formula_cls, str):
+            formula_cls = FORMULAS[formula_cls]
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        async with self._slots:
+            self.pending += 1
+            try:
+                future = asyncio.get_running_loop().create_future()
+                self._add_to_batch(batch_key(formula_cls, kwargs, future), wks_data, future)
+                return await future
+            finally:
+                self.pending -= 1
+
+    def _add_to_batch(self, key, wks_data, future):
+        """ Queue a document in the open batch of key, opening one if there is none """
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = []
+            asyncio.get_running_loop().call_later(self.batch_delay, self._dispatch, key, batch)
+        batch.append((wks_data, future))
+        if len(batch) >= self.batch_size:
+            self._dispatch(key, batch)
+
+    def _dispatch(self, key, batch):
+        """ Send a batch to the pool, leaving out the documents of cancelled callers """
+        if self._batches.get(key) is not batch:
+            return
+        del self._batches[key]
+        batch = [(wks_data, future) for wks_data, future in batch if not future.done()]
+        if not batch:
+            return
+
+        formula_cls, kwargs = key[:2]
+        documents = [wks_data for wks_data, _ in batch]
+        futures = [future for _, future in batch]
+        running = asyncio.get_running_loop().run_in_executor(self.executor, compute_batch, formula_cls, documents,
+                                                             dict(kwargs))
+        running.add_done_callback(functools.partial(self._resolve, futures))
+        for future in futures:
+            future.add_done_callback(functools.partial(self._cancel_if_abandoned, running, futures))
+
+    @staticmethod
+    def _resolve(futures, running):
+        """ Hand the results of a batch to its callers """
+        if running.cancelled():
+            return
+        if running.exception() is not None:
+            results = [(None, running.exception())] * len(futures)
+        else:
+            results = running.result()
+        for future, (output, exception) in zip(futures, results):
+            if future.done():
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(output)
+
+    @staticmethod
+    def _cancel_if_abandoned(running, futures, _):
+        """ Cancel a batch that has not started once every caller waiting on it is cancelled """
+        if all(future.cancelled() for future in futures):
+            running.cancel()
+
+    async def close(self):
+        """ Shut the pool down, cancelling batches that have not started and waiting for running ones """
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(executor.shutdown, wait=True, cancel_futures=True))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+# Default pool of each running event loop, used by compute
+_default_pools = weakref.WeakKeyDictionary()
+
+
+def default_pool() -> FormulaPool:
+    """ FormulaPool of the running event loop, created with the default settings on first use """
+    loop = asyncio.get_running_loop()
+    pool = _default_pools.get(loop)
+    if pool is None:
+        pool = _default_pools[loop] = FormulaPool()
+    return pool
+
+
+async def compute(formula_cls, wks_data: dict, **kwargs):
+    """ to_dict() of formula_cls(wks_data, **kwargs), computed in the default pool of the running event loop; see
+    FormulaPool.compute """
+    return await default_pool().compute(formula_cls, wks_data, **kwargs)
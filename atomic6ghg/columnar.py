@@ -0,0 +1,74 @@
+""" Columnar export of the row tables of formula outputs, for bulk loads that would otherwise explode the JSON back
+into columns """
+from array import array
+
+from atomic6ghg.compact_table import CompactTable, typed_column
+from atomic6ghg.optional import require_pyarrow
+
+# Names of the pyarrow types of typed array columns, by typecode
+ARROW_TYPES = {'d': 'float64', 'q': 'int64'}
+
+
+def output_columns(output: dict) -> dict:
+    """ Every row table of a formula output as {table: {column: values}}. Row tables are the values of output that
+    are lists of row dicts, CompactTables, or dicts of equal length columns as left by columnar recalcs. """
+    tables = {}
+    for key, value in output.items():
+        columns = table_columns(value)
+        if columns is not None:
+            tables[key] = columns
+    return tables
+
+
+def table_columns(table):
+    """ {column: values} of a row table, or None if table is not one. Columns present in every row whose values are
+    all floats, or all ints, are typed arrays; the others are lists with None for rows without the column. The
+    typed columns of a CompactTable and the array columns of columnar recalcs are returned without copying. """
+    if isinstance(table, CompactTable):
+        return compact_table_columns(table)
+    if isinstance(table, list) and all(isinstance(row, dict) for row in table):
+        keys = dict.fromkeys(key for row in table for key in row)
+        return {key: typed_column([row[key] for row in table]) if all(key in row for row in table)
+                else [row.get(key) for row in table] for key in keys}
+    if isinstance(table, dict) and table and all(is_column(column) for column in table.values()):
+        if len({len(column) for column in table.values()}) == 1:
+            return {key: column if hasattr(column, 'dtype') or isinstance(column, array) else typed_column(column)
+                    for key, column in table.items()}
+    return None
+
+
+def compact_table_columns(table: CompactTable) -> dict:
+    """ {column: values} of a CompactTable, sharing the columns that every row has """
+    columns = {}
+    for key, column in table.columns.items():
+        present = [key in shape for shape in table.shapes]
+        if all(present):
+            columns[key] = column
+        else:
+            columns[key] = [column[i] if present[code] else None for i, code in enumerate(table.shape_codes)]
+    return columns
+
+
+def is_column(value) -> bool:
+    """ Whether value is a sequence of row values: a list, tuple, typed array or numpy array """
+    return isinstance(value, (list, tuple, array)) or hasattr(value, 'dtype') and getattr(value, 'ndim', 0) == 1
+
+
+def arrow_table(columns: dict):
+    """ {column: values} as a pyarrow.Table (requires pyarrow). Typed arrays are copied once into Arrow buffers and
+    numpy arrays without nulls are converted without copying. """
+    pa = require_pyarrow('arrow_table')
+    return pa.table({key: arrow_array(pa, column) for key, column in columns.items()})
+
+
+def arrow_array(pa, column):
+    """ One column as a pyarrow.Array. Typed arrays are copied into an immutable buffer rather than shared, since a
+    typed array that exports its buffer cannot be resized, e.g. by apply_delta on a CompactTable. Columns mixing
+    strings and other values, which Arrow cannot type, become strings. """
+    if isinstance(column, array):
+        arrow_type = getattr(pa, ARROW_TYPES[column.typecode])()
+        return pa.Array.from_buffers(arrow_type, len(column), [None, pa.py_buffer(column.tobytes())])
+    try:
+        return pa.array(column)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if value is None else str(value) for value in column], type=pa.string())
@@ -0,0 +1,123 @@
+""" Column store for the calculated row tables of formula outputs, a compact stand-in for a list of row dicts """
+from array import array
+
+# Python type of the values held by each typecode of typed columns
+TYPECODES = {'d': float, 'q': int}
+
+
+class CompactTable:
+    """ List of row dicts stored column-wise. Columns of only floats or only ints are typed arrays of 8 bytes per row
+    and other columns are lists sharing the row values, so a row costs a small fraction of a dict. Each row keeps its
+    own keys, in order, through a code into the distinct key tuples (shapes) of the table.
+
+    Rows are materialized as dicts when read: by index, slice or iteration, and by tolist(), through which the JSON
+    backends serialize the table. Rows can also be replaced, deleted and appended, which is how recalc stages build
+    the table one row at a time and how apply_delta edits it. """
+    __slots__ = ('columns', 'shapes', 'shape_codes', '_shape_lookup')
+
+    def __init__(self, rows=()):
+        rows = list(rows)
+        self.shapes = []
+        self._shape_lookup = {}
+        self.shape_codes = array('H', [self._shape_code(tuple(row)) for row in rows])
+
+        self.columns = {}
+        for shape in self.shapes:
+            for key in shape:
+                if key not in self.columns:
+                    self.columns[key] = typed_column([row.get(key, _ABSENT) for row in rows])
+
+    def _shape_code(self, shape):
+        """ Code of a key tuple, added to shapes if new """
+        code = self._shape_lookup.get(shape)
+        if code is None:
+            code = self._shape_lookup[shape] = len(self.shapes)
+            self.shapes.append(shape)
+        return code
+
+    def _row(self, i):
+        """ Row i as a dict """
+        columns = self.columns
+        return {key: columns[key][i] for key in self.shapes[self.shape_codes[i]]}
+
+    def _store(self, i, row):
+        """ Write row into position i, adding columns for new keys, typed by the value of row, and widening typed
+        columns that cannot hold a value to lists """
+        for key, value in row.items():
+            column = self.columns.get(key)
+            if column is None:
+                values = [_ABSENT] * len(self)
+                values[i] = value
+                column = self.columns[key] = typed_column(values)
+            elif isinstance(column, array) and type(value) is not TYPECODES[column.typecode]:
+                column = self.columns[key] = column.tolist()
+            try:
+                column[i] = value
+            except OverflowError:
+                column = self.columns[key] = column.tolist()
+                column[i] = value
+        self.shape_codes[i] = self._shape_code(tuple(row))
+
+    def __len__(self):
+        return len(self.shape_codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._row(i) for i in range(len(self))[index]]
+        return self._row(range(len(self))[index])
+
+    def __setitem__(self, index, row):
+        self._store(range(len(self))[index], row)
+
+    def __delitem__(self, index):
+        index = range(len(self))[index]
+        del self.shape_codes[index]
+        for column in self.columns.values():
+            del column[index]
+
+    def __iter__(self):
+        return map(self._row, range(len(self)))
+
+    def __eq__(self, other):
+        if isinstance(other, (CompactTable, list)):
+            return self.tolist() == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f'CompactTable({self.tolist()!r})'
+
+    def append(self, row):
+        """ Add a row at the end """
+        self.shape_codes.append(0)
+        for column in self.columns.values():
+            column.append(TYPECODES[column.typecode]() if isinstance(column, array) else None)
+        self._store(len(self) - 1, row)
+
+    def extend(self, rows):
+        """ Add rows at the end """
+        for row in rows:
+            self.append(row)
+
+    def tolist(self) -> list:
+        """ The rows as a list of dicts, the shape they are serialized in """
+        return list(self)
+
+
+class _Absent:
+    """ Placeholder for the value of a key that a row does not have """
+
+
+_ABSENT = _Absent()
+
+
+def typed_column(values):
+    """ values as a typed array when every value present is a float, or every one an int that fits in 64 bits, and
+    otherwise as a list. Absent values become zeros or None. """
+    present = [value for value in values if value is not _ABSENT]
+    for typecode, value_type in TYPECODES.items():
+        if present and all(type(value) is value_type for value in present):
+            try:
+                return array(typecode, [value_type() if value is _ABSENT else value for value in values])
+            except OverflowError:
+                break
+    return [None if value is _ABSENT else value for value in values]
@@ -5,26 +5,27 @@ from .refrigerants_gwp_factors import RefrigerantsGwpFactors
 from .refrigeration_and_ac_equipment_emission_factors import RefrigerationAndAcEquipmentEmissionFactors
 from .unit_conversions_factors import UnitConversionsFactors
 from .molecular_weights_factors import MolecularWeightsFactors
-from .electricity_emission_factors import ElectricityFactors
-from .refrigerants_gwp_factors import RefrigerantsGwpFactors
+from .electricity_emission_factors import ElectricityFactors, HourlyElectricityFactors
 from .fire_suppression_leak_rates_factors import FireSuppressionFactors
 from .business_travel_factors import BusinessTravelFactors
 from .product_transport_emission_factors import ProductTransportEmissionFactors
 from .waste_emission_factors import WasteEmissionFactors
 from .mobile_combustion_ch4_and_n2o_emission_factors import MobileCombustionCh4AndN2oEmissionFactors
 from .mobile_combustion_co2_emission_factors import MobileCombustionCo2EmissionFactors
+from .lazy_factors import LazyFactors
+from .factor_set import FactorSet, register_edition, unregister_edition, get_factor_set, editions, use_factor_set
 
-heat_content_factors = HeatContentFactors()
-stationary_combustion_emission_factors = StationaryCombustionEmissionFactors()
-refrigerants_gwp_factors = RefrigerantsGwpFactors()
-unit_conversions_factors = UnitConversionsFactors()
-molecular_weights_factors = MolecularWeightsFactors()
-electricity_emission_factors = ElectricityFactors()
-refrigerants_gwp_factors = RefrigerantsGwpFactors()
-refrigeration_and_ac_equipment_emission_factors = RefrigerationAndAcEquipmentEmissionFactors()
-fire_suppression_leak_rates_factors = FireSuppressionFactors()
-business_travel_factors = BusinessTravelFactors()
-product_transport_emission_factors = ProductTransportEmissionFactors()
-waste_emission_factors = WasteEmissionFactors()
-mobile_combustion_ch4_and_n2o_emission_factors = MobileCombustionCh4AndN2oEmissionFactors()
-mobile_combustion_co2_emission_factors = MobileCombustionCo2EmissionFactors()
+# Factor singletons are loaded on first access, so that importing atomic6ghg only parses the tables that are used
+heat_content_factors = LazyFactors(HeatContentFactors)
+stationary_combustion_emission_factors = LazyFactors(StationaryCombustionEmissionFactors)
+refrigerants_gwp_factors = LazyFactors(RefrigerantsGwpFactors)
+unit_conversions_factors = LazyFactors(UnitConversionsFactors)
+molecular_weights_factors = LazyFactors(MolecularWeightsFactors)
+electricity_emission_factors = LazyFactors(ElectricityFactors)
+refrigeration_and_ac_equipment_emission_factors = LazyFactors(RefrigerationAndAcEquipmentEmissionFactors)
+fire_suppression_leak_rates_factors = LazyFactors(FireSuppressionFactors)
+business_travel_factors = LazyFactors(BusinessTravelFactors)
+product_transport_emission_factors = LazyFactors(ProductTransportEmissionFactors)
+waste_emission_factors = LazyFactors(WasteEmissionFactors)
+mobile_combustion_ch4_and_n2o_emission_factors = LazyFactors(MobileCombustionCh4AndN2oEmissionFactors)
+mobile_combustion_co2_emission_factors = LazyFactors(MobileCombustionCo2EmissionFactors)
@@ -1,13 +1,127 @@
 """ Module to wrap factors in class """
-import json
-import pkgutil
+import bisect
+from array import array
+
+from atomic6ghg.factors.loader import load_factors
+from atomic6ghg.optional import require_numpy
 
 
 class ElectricityFactors:
     """ Wrapper class for electricity_emissions_factors.json """
+    source_file = 'electricity_emission_factors.json'
+    gases = ('co2', 'ch4', 'n2o')
+
     def __init__(self):
-        self.factors = json.loads(pkgutil.get_data('atomic6ghg.factors',
-            'source_data/electricity_emission_factors.json'))
+        self.factors = load_factors(self.source_file)
+
+        # (co2, ch4, n2o) factors of each subregion, so that a row looks up all three gases at once
+        self.factor_vectors = {subregion: tuple(factors[gas] for gas in self.gases)
+                               for subregion, factors in self.factors.items()}
+        self.subregion_codes = {subregion: code for code, subregion in enumerate(self.factor_vectors)}
+        self._factor_array = None
 
     def __getitem__(self, item):
         return self.factors.get(item)
+
+    @property
+    def factor_array(self):
+        """ factor_vectors as a (subregions, gases) numpy array, with rows in the order of subregion_codes """
+        if self._factor_array is None:
+            np = require_numpy('ElectricityFactors.factor_array')
+            self._factor_array = np.array(list(self.factor_vectors.values()), dtype=float).reshape(-1, len(self.gases))
+        return self._factor_array
+
+
+class HourlyElectricityFactors:
+    """ Time-resolved electricity emission factors, e.g. hourly average or marginal factors by subregion. Each
+    subregion owns a contiguous run of the flat times and factors arrays, sorted by time, where times are the
+    starts of periods in seconds since the epoch (UTC) and factors holds (co2, ch4, n2o) per period. The factors of a
+    time are those of the last period starting at or before it, found by binary search; times before the first or
+    after the last period of a subregion take its first or last factors. """
+    gases = ElectricityFactors.gases
+
+    def __init__(self):
+        self.subregion_codes = {}
+        self.offsets = array('q')
+        self.lengths = array('q')
+        self.times = array('q')
+        self.factors = array('d')
+
+        self._search_keys = None
+
+    @classmethod
+    def from_columns(cls, subregions, times, co2, ch4, n2o):
+        """ Build from equal length columns with one entry per subregion and period, in any order (requires numpy).
+        times are datetime64 values, ISO 8601 strings or integer seconds since the epoch. """
+        np = require_numpy('HourlyElectricityFactors.from_columns')
+        subregions = np.asarray(subregions).astype(str)
+        times = epoch_seconds(times)
+        order = np.lexsort((times, subregions))
+        subregions, times = subregions[order], times[order]
+        if ((subregions[1:] == subregions[:-1]) & (times[1:] == times[:-1])).any():
+            raise ValueError('More than one factor for a subregion and period')
+
+        hourly_factors = cls()
+        names, offsets, lengths = np.unique(subregions, return_index=True, return_counts=True)
+        hourly_factors.subregion_codes = {name: code for code, name in enumerate(names.tolist())}
+        hourly_factors.offsets = array('q', offsets.tolist())
+        hourly_factors.lengths = array('q', lengths.tolist())
+        hourly_factors.times = array('q', times.tolist())
+        gas_columns = [np.asarray(column, dtype=float)[order] for column in (co2, ch4, n2o)]
+        hourly_factors.factors = array('d', np.column_stack(gas_columns).ravel().tolist())
+        return hourly_factors
+
+    def index(self, subregion_code, time):
+        """ Period of a subregion code and a time in seconds since the epoch, as a position in the flat arrays """
+        offset = self.offsets[subregion_code]
+        last = offset + self.lengths[subregion_code] - 1
+        return min(max(bisect.bisect_right(self.times, time, offset, last + 1) - 1, offset), last)
+
+    def lookup(self, subregion, time) -> tuple:
+        """ (co2, ch4, n2o) factors of a subregion at a time, given like the times of from_columns """
+        if not isinstance(time, int):
+            time = int(epoch_seconds([time])[0])
+        i = self.index(self.subregion_codes[subregion], time) * len(self.gases)
+        return tuple(self.factors[i:i + len(self.gases)])
+
+    def gather(self, subregion_codes, times):
+        """ Vectorized lookup over arrays of subregion codes and times, as a (rows, gases) array (requires numpy).
+        All rows are searched at once with a single np.searchsorted over keys that order by subregion, then time. """
+        np = require_numpy('HourlyElectricityFactors.gather')
+        subregion_codes = np.asarray(subregion_codes, dtype=np.int64)
+        first_time, span, search_keys = self.search_keys
+        times = np.clip(epoch_seconds(times), first_time, first_time + span - 1)
+        positions = np.searchsorted(search_keys, subregion_codes * span + (times - first_time), side='right') - 1
+        offsets = np.frombuffer(self.offsets, dtype=np.int64)[subregion_codes]
+        lengths = np.frombuffer(self.lengths, dtype=np.int64)[subregion_codes]
+        return self.factor_array[np.clip(positions, offsets, offsets + lengths - 1)]
+
+    @property
+    def factor_array(self):
+        """ factors as a (periods, gases) numpy array sharing memory with the flat array """
+        np = require_numpy('HourlyElectricityFactors.factor_array')
+        return np.frombuffer(self.factors, dtype=np.float64).reshape(-1, len(self.gases))
+
+    @property
+    def search_keys(self):
+        """ (first_time, span, keys): the period starts as subregion_code * span + (time - first_time), which sort
+        in the same order as the flat arrays """
+        if self._search_keys is None:
+            np = require_numpy('HourlyElectricityFactors.search_keys')
+            times = np.frombuffer(self.times, dtype=np.int64)
+            first_time = int(times.min()) if len(times) else 0
+            span = int(times.max()) - first_time + 1 if len(times) else 1
+            subregion_codes = np.repeat(np.arange(len(self.offsets), dtype=np.int64),
+                                        np.frombuffer(self.lengths, dtype=np.int64))
+            self._search_keys = (first_time, span, subregion_codes * span + (times - first_time))
+        return self._search_keys
+
+
+def epoch_seconds(times):
+    """ Integer seconds since the epoch of an array of datetime64 values, ISO 8601 strings or integers (requires
+    numpy) """
+    np = require_numpy('epoch_seconds')
+    times = np.asarray(times)
+    if times.dtype.kind in 'iu':
+        return times.astype(np.int64)
+    return times.astype('datetime64[s]').astype(np.int64)
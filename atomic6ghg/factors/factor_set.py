@@ -0,0 +1,177 @@
+""" Named editions of the factor tables, loaded side by side in one process, e.g. to restate prior years """
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import threading
+
+from atomic6ghg import json_backend
+from atomic6ghg.factors.loader import replacing_tables, source_digest
+
+DEFAULT_EDITION = 'default'
+
+_active_factor_set = contextvars.ContextVar('atomic6ghg_factor_set', default=None)
+
+# Number of open use_factor_set blocks whose edition replaces any table, and the functions told whether there are any
+# whenever that changes; see watch_editions_in_use
+_editions_in_use = 0
+_editions_in_use_watchers = []
+_editions_in_use_lock = threading.Lock()
+
+# Replacement tables by digest of their contents, and the factors built from them by (factors class, digest), shared
+# by every edition
+_shared_tables = {}
+_shared_factors = {}
+_shared_lock = threading.Lock()
+
+
+class FactorSet:
+    """ An edition of the factor tables: the tables in source_data, some of them replaced by tables of the edition,
+    e.g. AR4 GWPs in refrigerants_gwp_factors.json. tables maps file names to parsed tables or to paths of JSON files,
+    and every .json file in directory replaces the table of the same name.
+
+    Factors are built on first use. Factors whose table the edition does not replace are those of the default
+    edition, and replacement tables with the same contents are parsed once and shared, with their factors, between
+    editions. """
+    def __init__(self, name: str, tables: dict = None, directory: str = None):
+        self.name = name
+        self.sources = {}
+        if directory is not None:
+            self.sources.update({file_name: os.path.join(directory, file_name)
+                                 for file_name in sorted(os.listdir(directory)) if file_name.endswith('.json')})
+        self.sources.update(tables or {})
+
+        self._factors = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> str:
+        """ sha256 over the tables in source_data and the replacement tables, which changes whenever any factor of
+        the edition may change, e.g. to key cached results """
+        if self._version is None:
+            digest = hashlib.sha256(source_digest().encode())
+            for file_name in sorted(self.sources):
+                digest.update(f'{file_name}:{parse_table(self.sources[file_name])[1]}'.encode())
+            self._version = digest.hexdigest()
+        return self._version
+
+    def replaces(self, file_name: str) -> bool:
+        """ Whether the edition replaces the table of source_data/file_name """
+        return file_name in self.sources
+
+    def factors(self, factors_class):
+        """ Factors of factors_class (a wrapper class such as RefrigerantsGwpFactors) in this edition, or None if
+        the edition does not replace its table """
+        factors = self._factors.get(factors_class)
+        if factors is None and self.replaces(factors_class.source_file):
+            with self._lock:
+                factors = self._factors.get(factors_class)
+                if factors is None:
+                    factors = shared_factors(factors_class, self.sources[factors_class.source_file])
+                    self._factors[factors_class] = factors
+        return factors
+
+    def __repr__(self):
+        return f'<FactorSet {self.name} replacing {", ".join(self.sources) or "nothing"}>'
+
+
+_editions = {DEFAULT_EDITION: FactorSet(DEFAULT_EDITION)}
+_editions_lock = threading.Lock()
+
+
+def parse_table(source):
+    """ (table, sha256 of its canonical JSON) of a parsed table or the path of a JSON file """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as source_file:
+            source = json_backend.loads(source_file.read())
+    return source, hashlib.sha256(json.dumps(source, sort_keys=True).encode()).hexdigest()
+
+
+def shared_factors(factors_class, source):
+    """ Factors of factors_class built from source, a parsed table or the path of a JSON file, reusing the table and
+    factors of an edition whose table has the same contents """
+    table, digest = parse_table(source)
+    with _shared_lock:
+        table = _shared_tables.setdefault(digest, table)
+        if (factors_class, digest) not in _shared_factors:
+            with replacing_tables({factors_class.source_file: table}):
+                _shared_factors[(factors_class, digest)] = factors_class()
+        return _shared_factors[(factors_class, digest)]
+
+
+def register_edition(name: str, tables: dict = None, directory: str = None) -> FactorSet:
+    """ Register and return the edition name; see FactorSet. Raises ValueError if name is already registered. """
+    with _editions_lock:
+        if name in _editions:
+            raise ValueError(f'Factor edition {name} is already registered')
+        factor_set = _editions[name] = FactorSet(name, tables=tables, directory=directory)
+    return factor_set
+
+
+def unregister_edition(name: str):
+    """ Forget the edition name. Factors built for it stay cached for editions with the same tables. """
+    if name == DEFAULT_EDITION:
+        raise ValueError('The default factor edition cannot be unregistered')
+    with _editions_lock:
+        _editions.pop(name, None)
+
+
+def get_factor_set(name: str) -> FactorSet:
+    """ Registered edition name. Raises ValueError if there is none. """
+    try:
+        return _editions[name]
+    except KeyError:
+        raise ValueError(f'No factor edition {name}; registered editions are {", ".join(editions())}') from None
+
+
+def editions() -> list:
+    """ Names of the registered editions """
+    return list(_editions)
+
+
+def active_factor_set():
+    """ FactorSet the factor singletons of atomic6ghg.factors resolve to in this context, None for the default """
+    return _active_factor_set.get()
+
+
+@contextlib.contextmanager
+def use_factor_set(factor_set):
+    """ Have the factor singletons of atomic6ghg.factors, and so every formula, use factor_set, a FactorSet or the
+    name of a registered edition, within this context. Yields the FactorSet. Contexts copied inside the block, e.g. by
+    tasks, should not outlive it, since the singletons only look up the edition while such a block is open. """
+    if isinstance(factor_set, str):
+        factor_set = get_factor_set(factor_set)
+    replacing = factor_set is not None and bool(factor_set.sources)
+    if replacing:
+        _count_editions_in_use(1)
+    token = _active_factor_set.set(factor_set)
+    try:
+        yield factor_set
+    finally:
+        _active_factor_set.reset(token)
+        if replacing:
+            _count_editions_in_use(-1)
+
+
+def watch_editions_in_use(watcher):
+    """ Call watcher(in_use) now and whenever use_factor_set blocks with an edition that replaces tables are first
+    opened (True) or all closed (False), so that a factor singleton can skip looking up the active edition while none
+    is in use. watcher is called with a lock held and must not call back into this module. """
+    with _editions_in_use_lock:
+        if watcher not in _editions_in_use_watchers:
+            _editions_in_use_watchers.append(watcher)
+        watcher(_editions_in_use > 0)
+
+
+def _count_editions_in_use(change):
+    """ Add change to the number of open use_factor_set blocks with a replacing edition, telling the watchers when
+    there come to be some or none """
+    global _editions_in_use  # pylint: disable=global-statement
+    with _editions_in_use_lock:
+        was_in_use = _editions_in_use > 0
+        _editions_in_use += change
+        if (_editions_in_use > 0) != was_in_use:
+            for watcher in _editions_in_use_watchers:
+                watcher(not was_in_use)
@@ -1,13 +1,13 @@
 """ Module to wrap factors in class """
-import json
-import pkgutil
+from atomic6ghg.factors.loader import load_factors
 
 
 class HeatContentFactors:
     """ Wrapper class for heat_content_factors.json """
+    source_file = 'heat_content_factors.json'
+
     def __init__(self):
-        self.factors = json.loads(pkgutil.get_data('atomic6ghg.factors',
-            'source_data/heat_content_factors.json'))
+        self.factors = load_factors(self.source_file)
 
     def __getitem__(self, item):
         return self.factors.get(item)
@@ -0,0 +1,68 @@
+""" Module to defer loading of factors until first use """
+import threading
+
+from atomic6ghg.factors.factor_set import active_factor_set, watch_editions_in_use
+
+
+class LazyFactors:
+    """ Stand-in for a factor wrapper singleton that builds the wrapper, and parses its JSON, on first access. Within
+    use_factor_set, it stands in for the factors of that edition instead.
+
+    While no edition that replaces tables is in use, which is the common case, item and attribute access go straight
+    to the built factors after a single attribute check, without looking up the active edition per access. """
+    def __init__(self, factors_class):
+        self._factors_class = factors_class
+        self._factors = None
+        # _factors once built while no edition is in use, otherwise None; see watch_editions_in_use
+        self._default = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """ Return the wrapped factors, building them once, or the factors of the active edition if it replaces them """
+        factor_set = active_factor_set()
+        if factor_set is not None:
+            factors = factor_set.factors(self._factors_class)
+            if factors is not None:
+                return factors
+        factors = self._factors
+        if factors is None:
+            with self._lock:
+                if self._factors is None:
+                    self._factors = self._factors_class()
+                factors = self._factors
+            watch_editions_in_use(self._editions_in_use)
+        return factors
+
+    def _editions_in_use(self, in_use):
+        """ Use the built factors directly unless an edition that replaces tables is in use """
+        self._default = None if in_use else self._factors
+
+    @property
+    def loaded(self) -> bool:
+        """ Whether the wrapped factors have been built """
+        return self._factors is not None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        factors = self._default
+        if factors is None:
+            factors = self.load()
+        return getattr(factors, name)
+
+    def __getitem__(self, item):
+        factors = self._default
+        if factors is None:
+            factors = self.load()
+        return factors[item]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __contains__(self, item):
+        return item in self.load()
+
+    def __repr__(self):
+        if self._factors is None:
+            return f'<LazyFactors {self._factors_class.__name__} (not loaded)>'
+        return repr(self._factors)
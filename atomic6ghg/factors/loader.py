@@ -0,0 +1,146 @@
+""" Module to load factor tables from a precompiled snapshot, falling back to the JSON in source_data """
+import contextlib
+import contextvars
+import hashlib
+import logging
+import os
+import pickle
+import pkgutil
+import threading
+
+from atomic6ghg import json_backend
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of the snapshot payload, or of any compiled table stored in it, changes
+SNAPSHOT_VERSION = 1
+SNAPSHOT_MAGIC = b'A6GHGFS'
+SNAPSHOT_FILE = 'factors.snapshot'
+SOURCE_DATA = os.path.join(os.path.dirname(__file__), 'source_data')
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+# Tables that replace those of source_data, by file name, while the factors of another edition are built; see
+# atomic6ghg.factors.factor_set
+_replaced_tables = contextvars.ContextVar('atomic6ghg_replaced_tables', default=None)
+
+
+def load_factors(file_name: str):
+    """ Parsed contents of source_data/file_name, from the snapshot when one is present and current, or the table
+    that replaces it in the edition being built """
+    if is_replaced(file_name):
+        return _replaced_tables.get()[file_name]
+    tables = get_snapshot()['tables']
+    if file_name in tables:
+        return tables[file_name]
+    return json_backend.loads(pkgutil.get_data('atomic6ghg.factors', f'source_data/{file_name}'))
+
+
+def load_compiled(name: str):
+    """ Compiled table stored in the snapshot under name, or None when there is no current snapshot """
+    return get_snapshot()['compiled'].get(name)
+
+
+def is_replaced(file_name: str) -> bool:
+    """ Whether load_factors returns a table replacing source_data/file_name in this context. Compiled tables in the
+    snapshot are made from source_data, so factors built from a replaced table must compile their own. """
+    replaced_tables = _replaced_tables.get()
+    return bool(replaced_tables) and file_name in replaced_tables
+
+
+@contextlib.contextmanager
+def replacing_tables(tables: dict):
+    """ Have load_factors return tables[file_name], for the file names in tables, within this context """
+    token = _replaced_tables.set(tables)
+    try:
+        yield
+    finally:
+        _replaced_tables.reset(token)
+
+
+def get_snapshot() -> dict:
+    """ Read and verify the snapshot once per process. A missing, corrupt or stale snapshot reads as empty. """
+    global _snapshot  # pylint: disable=global-statement
+    if _snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = read_snapshot(os.path.join(SOURCE_DATA, SNAPSHOT_FILE))
+    return _snapshot
+
+
+def reset_snapshot():
+    """ Forget the snapshot read by get_snapshot, so that the next load reads it again """
+    global _snapshot  # pylint: disable=global-statement
+    with _snapshot_lock:
+        _snapshot = None
+
+
+def source_digest() -> str:
+    """ sha256 over the names and contents of the JSON files in source_data """
+    digest = hashlib.sha256()
+    for file_name in sorted(os.listdir(SOURCE_DATA)):
+        if file_name.endswith('.json'):
+            digest.update(file_name.encode())
+            with open(os.path.join(SOURCE_DATA, file_name), 'rb') as source:
+                digest.update(source.read())
+    return digest.hexdigest()
+
+
+def read_snapshot(path: str) -> dict:
+    """ Snapshot written by build_snapshot. The payload checksum, the snapshot version and the digest of the
+    source JSON are all checked before any of it is unpickled. """
+    empty = {'tables': {}, 'compiled': {}}
+    try:
+        with open(path, 'rb') as snapshot_file:
+            magic, version, checksum, digest = snapshot_file.readline().split()
+            version = int(version)
+            payload = snapshot_file.read()
+    except FileNotFoundError:
+        return empty
+    except (OSError, ValueError) as e:
+        logger.warning('Ignoring unreadable factor snapshot %s: %s', path, e)
+        return empty
+
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        logger.warning('Ignoring factor snapshot %s: unsupported version', path)
+        return empty
+    if hashlib.sha256(payload).hexdigest() != checksum.decode():
+        logger.warning('Ignoring factor snapshot %s: checksum mismatch', path)
+        return empty
+    if digest.decode() != source_digest():
+        logger.warning('Ignoring factor snapshot %s: source_data has changed since it was built', path)
+        return empty
+    return pickle.loads(payload)
+
+
+def build_snapshot(path: str = None) -> str:
+    """ Compile every factor table in source_data, plus the compiled mobile combustion year tables, into one
+    snapshot file. Returns the path written. """
+    # pylint: disable=import-outside-toplevel
+    from atomic6ghg.factors.mobile_combustion_ch4_and_n2o_emission_factors import \
+        MobileCombustionCh4AndN2oEmissionFactors
+
+    path = path or os.path.join(SOURCE_DATA, SNAPSHOT_FILE)
+    tables = {}
+    for file_name in sorted(os.listdir(SOURCE_DATA)):
+        if file_name.endswith('.json'):
+            with open(os.path.join(SOURCE_DATA, file_name), 'rb') as source:
+                tables[file_name] = json_backend.loads(source.read())
+
+    compiled = {'mobile_combustion_ch4_and_n2o_dense_year_tables':
+                MobileCombustionCh4AndN2oEmissionFactors().compile_dense_year_tables()}
+
+    payload = pickle.dumps({'tables': tables, 'compiled': compiled}, protocol=pickle.HIGHEST_PROTOCOL)
+    header = b' '.join([SNAPSHOT_MAGIC, str(SNAPSHOT_VERSION).encode(), hashlib.sha256(payload).hexdigest().encode(),
+                        source_digest().encode()])
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as snapshot_file:
+        snapshot_file.write(header + b'\n')
+        snapshot_file.write(payload)
+    os.replace(temp_path, path)
+    return path
+
+
+if __name__ == '__main__':
+    print(build_snapshot())
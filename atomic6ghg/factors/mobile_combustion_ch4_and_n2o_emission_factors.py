@@ -1,17 +1,23 @@
 """ Module to wrap factors in class """
-import json
-import pkgutil
+from array import array
 from atomic6ghg import YearValueException, YearMapException
+from atomic6ghg.factors.loader import is_replaced, load_factors, load_compiled
+from atomic6ghg.optional import require_numpy
+
 
 class MobileCombustionCh4AndN2oEmissionFactors:
     """ Wrapper class for mobile_combustion_emission_factors.json """
+    source_file = 'mobile_combustion_ch4_and_n2o_emission_factors.json'
+
     def __init__(self):
-        self.factors = json.loads(pkgutil.get_data('atomic6ghg.factors',
-            'source_data/mobile_combustion_ch4_and_n2o_emission_factors.json'))
+        self.factors = load_factors(self.source_file)
 
         self._factors = {}
         self.make_factors()
 
+        # The snapshot is compiled from source_data, so factors of an edition that replaces it compile their own
+        self._dense_year_tables = self.compile_dense_year_tables() if is_replaced(self.source_file) else None
+
     def __getitem__(self, vehicle_type):
         return self._factors.get(vehicle_type)
 
@@ -76,6 +82,121 @@ class MobileCombustionCh4AndN2oEmissionFactors:
         def __iter__(self):
             return iter(self.factors_by_year)
 
+    class DenseYearTables:
+        """ Compiled form of the factors. Each (vehicle type, fuel type) pair owns a contiguous run of the flat
+        ch4_factors, n2o_factors and year_display_codes arrays indexed by year offset, so that a lookup is index
+        arithmetic with the boundary clamping of YearHandler built in. Fuel types with no time dependency own a run of
+        length one and ignore year. Years missing inside a run have year_display_code -1. """
+        def __init__(self, factors):
+            self.pairs = []
+            self.pair_codes = {}
+            self.first_years = array('q')
+            self.offsets = array('q')
+            self.lengths = array('q')
+
+            self.ch4_factors = array('d')
+            self.n2o_factors = array('d')
+            self.year_display_codes = array('q')
+            self.year_displays = []
+            self.year_displays_by_pair = []
+
+            year_display_codes = {}
+            for vehicle_type in factors:
+                for fuel_type, year_handler in factors[vehicle_type].items():
+                    factors_by_year = year_handler.factors_by_year
+                    if year_handler.year_boundaries:
+                        first_year, last_year = year_handler.year_boundaries
+                        years = range(first_year, last_year + 1)
+                    else:
+                        first_year = 0
+                        years = list(factors_by_year)
+
+                    self.pair_codes[(vehicle_type, fuel_type)] = len(self.pairs)
+                    self.pairs.append((vehicle_type, fuel_type))
+                    self.first_years.append(first_year)
+                    self.offsets.append(len(self.ch4_factors))
+                    self.lengths.append(len(years))
+                    for year in years:
+                        factor = factors_by_year.get(year)
+                        if factor is None:
+                            self.ch4_factors.append(float('nan'))
+                            self.n2o_factors.append(float('nan'))
+                            self.year_display_codes.append(-1)
+                            continue
+                        year_display = factor['year_display']
+                        if year_display not in year_display_codes:
+                            year_display_codes[year_display] = len(self.year_displays)
+                            self.year_displays.append(year_display)
+                        self.ch4_factors.append(factor['ch4_factor'])
+                        self.n2o_factors.append(factor['n2o_factor'])
+                        self.year_display_codes.append(year_display_codes[year_display])
+                    self.year_displays_by_pair.append(
+                        list(dict.fromkeys(factors_by_year[year]['year_display'] for year in factors_by_year)))
+
+        def index(self, pair_code, year):
+            """ Position of the factors for a pair code and a user input year in the flat arrays """
+            offset = self.offsets[pair_code]
+            length = self.lengths[pair_code]
+            if length == 1:
+                return offset
+            if year.__class__ is not int:
+                # pylint: disable=protected-access
+                year = MobileCombustionCh4AndN2oEmissionFactors.YearHandler._int_year(year)
+            year -= self.first_years[pair_code]
+            if year < 0:
+                year = 0
+            elif year >= length:
+                year = length - 1
+            return offset + year
+
+        def lookup(self, vehicle_type, fuel_type, year):
+            """ Return (ch4_factor, n2o_factor, year_display) for a vehicle type, fuel type and user input year """
+            i = self.index(self.pair_codes[(vehicle_type, fuel_type)], year)
+            year_display_code = self.year_display_codes[i]
+            if year_display_code < 0:
+                raise YearMapException
+            return self.ch4_factors[i], self.n2o_factors[i], self.year_displays[year_display_code]
+
+        def gather_index(self, pair_codes, years):
+            """ Vectorized index over arrays of pair codes and integer years (requires numpy). Years of pairs with no
+            time dependency are ignored. Index ch4_array, n2o_array and year_display_code_array with the result. """
+            np = require_numpy('DenseYearTables.gather_index')
+            pair_codes = np.asarray(pair_codes, dtype=np.intp)
+            first_years = np.frombuffer(self.first_years, dtype=np.int64)[pair_codes]
+            lengths = np.frombuffer(self.lengths, dtype=np.int64)[pair_codes]
+            offsets = np.frombuffer(self.offsets, dtype=np.int64)[pair_codes]
+            return offsets + np.clip(np.asarray(years, dtype=np.int64) - first_years, 0, lengths - 1)
+
+        @property
+        def ch4_array(self):
+            """ ch4_factors as a numpy array sharing memory with the flat array """
+            np = require_numpy('DenseYearTables.ch4_array')
+            return np.frombuffer(self.ch4_factors, dtype=np.float64)
+
+        @property
+        def n2o_array(self):
+            """ n2o_factors as a numpy array sharing memory with the flat array """
+            np = require_numpy('DenseYearTables.n2o_array')
+            return np.frombuffer(self.n2o_factors, dtype=np.float64)
+
+        @property
+        def year_display_code_array(self):
+            """ year_display_codes as a numpy array sharing memory with the flat array """
+            np = require_numpy('DenseYearTables.year_display_code_array')
+            return np.frombuffer(self.year_display_codes, dtype=np.int64)
+
+    @property
+    def dense_year_tables(self):
+        """ DenseYearTables from the factor snapshot, or compiled from the factors on first use """
+        if self._dense_year_tables is None:
+            self._dense_year_tables = load_compiled('mobile_combustion_ch4_and_n2o_dense_year_tables') or \
+                self.compile_dense_year_tables()
+        return self._dense_year_tables
+
+    def compile_dense_year_tables(self):
+        """ Compile DenseYearTables from the YearHandler tree """
+        return self.DenseYearTables(self._factors)
+
     def __repr__(self):
         return repr(self._factors)
 
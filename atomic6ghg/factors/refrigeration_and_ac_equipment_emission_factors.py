@@ -1,13 +1,13 @@
 """ Module to wrap factors in class """
-import json
-import pkgutil
+from atomic6ghg.factors.loader import load_factors
 
 
 class RefrigerationAndAcEquipmentEmissionFactors:
     """ Wrapper class for refrigeration_and_ac_equipment_emission_factors.json """
+    source_file = 'refrigeration_and_ac_equipment_emission_factors.json'
+
     def __init__(self):
-        self.factors = json.loads(pkgutil.get_data('atomic6ghg.factors',
-            'source_data/refrigeration_and_ac_equipment_emission_factors.json'))
+        self.factors = load_factors(self.source_file)
 
     def __getitem__(self, item):
         return self.factors.get(item)
@@ -1,13 +1,30 @@
 """ Module to wrap factors in class """
-import json
-import pkgutil
+from atomic6ghg.factors.loader import load_factors
+from atomic6ghg.optional import require_numpy
 
 
 class StationaryCombustionEmissionFactors:
     """ Wrapper class for stationary_combustion_emission_factors.json """
+    source_file = 'stationary_combustion_emission_factors.json'
+    mmbtu_factor_keys = ('CO2 Factor (kg / mmBtu)', 'CH4 Factor (g / mmBtu)', 'N2O Factor (g / mmBtu)')
+
     def __init__(self):
-        self.factors = json.loads(pkgutil.get_data('atomic6ghg.factors',
-            'source_data/stationary_combustion_emission_factors.json'))
+        self.factors = load_factors(self.source_file)
+
+        # (co2, ch4, n2o) factors per mmBtu of each fuel type, so that a row looks up all three gases at once
+        self.mmbtu_factor_vectors = {fuel_type: tuple(factors.get(key) for key in self.mmbtu_factor_keys)
+                                     for fuel_type, factors in self.factors.items()}
+        self.fuel_type_codes = {fuel_type: code for code, fuel_type in enumerate(self.mmbtu_factor_vectors)}
+        self._mmbtu_factor_array = None
 
     def __getitem__(self, item):
         return self.factors.get(item)
+
+    @property
+    def mmbtu_factor_array(self):
+        """ mmbtu_factor_vectors as a (fuel types, gases) numpy array, with rows in the order of fuel_type_codes """
+        if self._mmbtu_factor_array is None:
+            np = require_numpy('StationaryCombustionEmissionFactors.mmbtu_factor_array')
+            self._mmbtu_factor_array = np.array(list(self.mmbtu_factor_vectors.values()),
+                                                dtype=float).reshape(-1, len(self.mmbtu_factor_keys))
+        return self._mmbtu_factor_array
@@ -10,14 +10,20 @@ logger = logging.getLogger(__name__)
 
 class BusinessTravel(Formula):
     """ Calculate emissions from business travel """
+
+    wks_type = 'business-travel'
+    row_tables = ('personalVehicleRentalCarOrTaxiBusinessTravel', 'railOrBusBusinessTravel', 'airBusinessTravel')
+    stages = ('make_personal_vehicle_rental_car_or_taxi', 'make_personal_vehicle_total', 'make_rail_or_bus',
+              'make_rail_or_bus_total', 'make_air_business_travel', 'make_air_total',
+              'make_co2_emissions_by_travel_type', 'make_co2_equivalent_emissions')
     personal_vehicles = ['passengerCars', 'lightDutyTruck', 'motorcycle']
     rail_or_bus = ['intercityRailNortheastCorridor', 'intercityRailOtherRoutes', 'intercityRailNationalAverage',
                       'commuterRail', 'transitRail', 'bus']
     flight_length = ['shortHaul', 'mediumHaul', 'longHaul']
     vehicle_types_all = personal_vehicles + rail_or_bus + flight_length
 
-    def __init__(self, wks_data=None):
-        super().__init__(wks_data=wks_data)
+    def __init__(self, wks_data=None, factor_set=None):
+        super().__init__(wks_data=wks_data, factor_set=factor_set)
 
         self._total_emissions_by_vehicle = {}
         self._total_emissions_by_rail_or_bus = {}
@@ -38,11 +44,11 @@ class BusinessTravel(Formula):
         self.make_co2_emissions_by_travel_type()
         self.make_co2_equivalent_emissions()
 
-        return self.to_dict()
+        return self.checked_output()
 
     def make_personal_vehicle_rental_car_or_taxi(self):
         """Calculate CO2 equivalent emissions for each input row in Personal Vehicle, Rental Car or Taxi table"""
-        personal_vehicle = []
+        personal_vehicle = self.output_rows()
         self._total_emissions = {
             'personalVehicleRentalCarOrTaxiBusinessTravel': {
                 'CO2': 0.,
@@ -99,7 +105,7 @@ class BusinessTravel(Formula):
 
     def make_rail_or_bus(self):
         """Calculate CO2 equivalent emissions for each input row in Rail or Bus table"""
-        rail_or_bus_vehicle = []
+        rail_or_bus_vehicle = self.output_rows()
         self._total_emissions = {
             'railOrBusBusinessTravel': {
                 'CO2': 0.,
@@ -157,7 +163,7 @@ class BusinessTravel(Formula):
 
     def make_air_business_travel(self):
         """Calculate CO2 equivalent emissions for each input row in Air table"""
-        air_vehicle = []
+        air_vehicle = self.output_rows()
         self._total_emissions = {
             'airBusinessTravel': {
                 'CO2': 0.,
@@ -11,13 +11,19 @@ logger = logging.getLogger(__name__)
 class Commuting(Formula):
     """ Calculate emissions from commuting equipment """
 
+    wks_type = 'commuting'
+    row_tables = ('personalVehicle', 'publicTransportation')
+    stages = ('make_personal_vehicle', 'make_total_for_all_personal_vehicle', 'make_public_transportation',
+              'make_total_for_all_public_transportation', 'make_emissions_by_commuting_type',
+              'make_co2_equivalent_emissions')
+
     personal_vehicles = ['passengerCars', 'lightDutyTruck', 'motorcycle']
     public_transit = ['intercityRailNortheastCorridor', 'intercityRailOtherRoutes', 'intercityRailNationalAverage',
                       'commuterRail', 'transitRail', 'bus']
     all_vehicles = personal_vehicles + public_transit
 
-    def __init__(self, wks_data=None):
-        super().__init__(wks_data=wks_data)
+    def __init__(self, wks_data=None, factor_set=None):
+        super().__init__(wks_data=wks_data, factor_set=factor_set)
         self._total_emissions_by_vehicle = {}
         self._total_emissions_by_transit = {}
         self.recalc(self.wks_data)
@@ -33,11 +39,11 @@ class Commuting(Formula):
         self.make_emissions_by_commuting_type()
         self.make_co2_equivalent_emissions()
 
-        return self.to_dict()
+        return self.checked_output()
 
     def make_personal_vehicle(self):
         """Calculate CO2 equivalent emissions for each input row in Personal Vehicle table"""
-        personal_vehicle = []
+        personal_vehicle = self.output_rows()
         self._total_emissions = {
             'personalVehicle': {
                 'CO2': 0.,
@@ -97,7 +103,7 @@ class Commuting(Formula):
 
     def make_public_transportation(self):
         """Calculate emissions for each input row in Public Transportation table"""
-        public_transportation = []
+        public_transportation = self.output_rows()
         self._total_emissions.update({
             'publicTransportation': {
                 'CO2': 0.,
@@ -4,6 +4,7 @@ import logging
 
 from atomic6ghg.formulas import Formula
 from atomic6ghg.factors import electricity_emission_factors, unit_conversions_factors, refrigerants_gwp_factors
+from atomic6ghg.optional import require_numpy
 
 logger = logging.getLogger(__name__)
 
@@ -11,13 +12,25 @@ logger = logging.getLogger(__name__)
 class Electricity(Formula):
     """ Calculate emissions from purchased gases """
 
+    wks_type = 'electricity'
+    row_tables = ('totalElectricityPurchased',)
+    stages = ('make_emissions', 'tabulate_emission_columns', 'make_total_emissions_for_all_sources',
+              'make_co2_equivalent_emissions_location_based', 'make_co2_equivalent_emissions_market_based')
+
     subregions = ['akgd', 'akms', 'aznm', 'camx', 'erct', 'frcc', 'hims',
                   'hioa', 'mroe', 'mrow', 'newe', 'nwpp', 'nycw', 'nyli',
                   'nyup', 'prms', 'rfce', 'rfcm', 'rfcw', 'rmpa', 'spno',
                   'spso', 'srmv', 'srmw', 'srso', 'srtv', 'srvc']
 
-    def __init__(self, wks_data=None):
-        super().__init__(wks_data=wks_data)
+    # Input market-based factors and output emissions of each row, in (co2, ch4, n2o) order
+    market_based_factor_keys = ('marketBasedEmissionFactorsCO2Emissions', 'marketBasedEmissionFactorsCH4Emissions',
+                                'marketBasedEmissionFactorsN2OEmissions')
+    emission_keys = ('marketBasedEmissionsCO2Emissions', 'marketBasedEmissionsCH4Emissions',
+                     'marketBasedEmissionsN2OEmissions', 'locationBasedEmissionsCO2Emissions',
+                     'locationBasedEmissionsCH4Emissions', 'locationBasedEmissionsN2OEmissions')
+
+    def __init__(self, wks_data=None, factor_set=None):
+        super().__init__(wks_data=wks_data, factor_set=factor_set)
         self.recalc(self.wks_data)
 
     def recalc(self, wks_data: dict) -> dict:
@@ -29,82 +42,137 @@ class Electricity(Formula):
         self.make_co2_equivalent_emissions_location_based()
         self.make_co2_equivalent_emissions_market_based()
 
-        return self.to_dict()
+        return self.checked_output()
+
+    def recalc_columns(self, wks_columns: dict) -> dict:
+        """ Execute recalc procedure for Electricity over column arrays instead of row dicts (requires numpy).
+
+        wks_columns has the same shape as wks_data, except that totalElectricityPurchased is a dict of equal length
+        arrays keyed by eGridSubregion, electricityPurchased and, optionally, the three
+        marketBasedEmissionFactors columns. totalElectricityPurchased in _output holds the input columns plus the six
+        emission columns; rows with no eGridSubregion have zero emissions and are left out of the totals. """
+        require_numpy('Electricity.recalc_columns')
+        self.wks_data = wks_columns
+
+        columns = self.wks_data.get('totalElectricityPurchased', {})
+        self._output['totalElectricityPurchased'] = {**columns, **self.tabulate_emission_columns(columns)}
+        self.make_total_emissions_for_all_sources()
+        self.make_co2_equivalent_emissions_location_based()
+        self.make_co2_equivalent_emissions_market_based()
+
+        return self.checked_output()
+
+    def recalc_readings(self, readings: dict, sites: dict = None) -> dict:
+        """ Execute recalc procedure for Electricity over interval meter readings (requires numpy).
+
+        readings is a dict of equal length arrays keyed by sourceId, eGridSubregion and electricityPurchased, one
+        entry per reading. Readings are summed into one totalElectricityPurchased row per sourceId and eGridSubregion
+        by aggregate_readings, which then go through recalc. sites optionally maps a sourceId to the other fields of
+        its rows, e.g. sourceDescription or the market-based factors. """
+        return self.recalc({'totalElectricityPurchased': self.aggregate_readings(readings, sites)})
 
-    def make_emissions(self):
-        """Calculate emissions for all fuels burned"""
-        self._total_emissions = {'electricityPurchased': 0.,
-                                 'marketBasedEmissionsCO2Emissions': 0.,
-                                 'marketBasedEmissionsCH4Emissions': 0.,
-                                 'marketBasedEmissionsN2OEmissions': 0.,
-                                 'locationBasedEmissionsCO2Emissions': 0.,
-                                 'locationBasedEmissionsCH4Emissions': 0.,
-                                 'locationBasedEmissionsN2OEmissions': 0.}
-        emissions = []
+    def recalc_hourly(self, readings: dict, hourly_factors, sites: dict = None) -> dict:
+        """ Execute recalc procedure for Electricity over interval meter readings with time-resolved factors (requires
+        numpy).
 
-        for row in self.wks_data.get('totalElectricityPurchased', []):
+        readings is as for recalc_readings plus a time column, given like the times of
+        HourlyElectricityFactors.from_columns. Each reading is joined to the hourly_factors period of its subregion and
+        time in a single vectorized search, and its location-based emissions are summed into the rows of
+        aggregate_readings. Market-based emissions use the market-based factors of sites where given, and otherwise
+        fall back to the location-based emissions as in recalc. """
+        np = require_numpy('Electricity.recalc_hourly')
+        group_codes, site_ids, subregion_codes = _group_readings(readings)
+        groups, rows = _reading_rows(readings, sites, group_codes, site_ids)
+
+        # Factor rows of hourly_factors for each factor_array row + 1 (0 for no subregion), -1 where there are none
+        hourly_codes = np.array([-1] + [hourly_factors.subregion_codes.get(subregion, -1)
+                                        for subregion in electricity_emission_factors.subregion_codes])
+        reading_hourly_codes = hourly_codes[subregion_codes]
+        has_subregion = subregion_codes > 0
+        if (reading_hourly_codes[has_subregion] < 0).any():
+            missing = sorted({row['eGridSubregion'] for row in rows if row['eGridSubregion']
+                              and row['eGridSubregion'] not in hourly_factors.subregion_codes})
+            raise ValueError(f'No hourly factors for eGridSubregion: {", ".join(missing)}')
+
+        megawatt_hours = np.where(has_subregion, np.asarray(readings['electricityPurchased'], dtype=float), 0.) / 1000
+        factors = hourly_factors.gather(np.maximum(reading_hourly_codes, 0), readings['time'])
+        location_based = np.maximum(0., megawatt_hours[:, np.newaxis] * factors)
+        location_based_emissions = np.column_stack([np.bincount(group_codes, weights=location_based[:, gas])[groups]
+                                                    for gas in range(location_based.shape[1])]).tolist()
+
+        self.wks_data = {'totalElectricityPurchased': rows}
+        self.make_emissions(location_based_emissions)
+        self.make_total_emissions_for_all_sources()
+        self.make_co2_equivalent_emissions_location_based()
+        self.make_co2_equivalent_emissions_market_based()
+
+        return self.checked_output()
+
+    def make_emissions(self, location_based_emissions=None):
+        """Calculate emissions for all fuels burned. location_based_emissions optionally gives the (co2, ch4, n2o)
+        location-based emissions of every row, e.g. from hourly factors, in place of those of the annual factors."""
+        factor_vectors = electricity_emission_factors.factor_vectors
+        electricity_purchased_total = 0.
+        emissions_totals = [0.] * len(self.emission_keys)
+        emissions = self.output_rows()
+
+        for i, row in enumerate(self.wks_data.get('totalElectricityPurchased', [])):
             subregion = row['eGridSubregion']
-            source_id = row.get('sourceId')
             if not subregion:
                 emissions.append(row)
                 continue
 
             electricity_purchased = row['electricityPurchased']
-            market_based_emissions_factor_co2 = row["marketBasedEmissionFactorsCO2Emissions"]
-            market_based_emissions_factor_ch4 = row["marketBasedEmissionFactorsCH4Emissions"]
-            market_based_emissions_factor_n2o = row["marketBasedEmissionFactorsN2OEmissions"]
-
-            market_based_emissions_co2_emissions = \
-                Electricity.calculate_market_based_emissions_electricity(electricity_purchased,
-                                                                         market_based_emissions_factor_co2,
-                                                                         subregion,
-                                                                         'co2')
-            market_based_emissions_ch4_emissions = \
-                Electricity.calculate_market_based_emissions_electricity(electricity_purchased,
-                                                                         market_based_emissions_factor_ch4,
-                                                                         subregion,
-                                                                         'ch4')
-            market_based_emissions_n2o_emissions = \
-                Electricity.calculate_market_based_emissions_electricity(electricity_purchased,
-                                                                         market_based_emissions_factor_n2o,
-                                                                         subregion,
-                                                                         'n2o')
-            location_based_emissions_co2_emissions = \
-                Electricity.calculate_location_based_emissions_electricity(electricity_purchased,
-                                                                           subregion,
-                                                                           'co2')
-            location_based_emissions_ch4_emissions = \
-                Electricity.calculate_location_based_emissions_electricity(electricity_purchased,
-                                                                           subregion,
-                                                                           'ch4')
-            location_based_emissions_n2o_emissions = \
-                Electricity.calculate_location_based_emissions_electricity(electricity_purchased,
-                                                                           subregion,
-                                                                           'n2o')
-
-            self._total_emissions['electricityPurchased'] += electricity_purchased
-            self._total_emissions['marketBasedEmissionsCO2Emissions'] += market_based_emissions_co2_emissions
-            self._total_emissions['marketBasedEmissionsCH4Emissions'] += market_based_emissions_ch4_emissions
-            self._total_emissions['marketBasedEmissionsN2OEmissions'] += market_based_emissions_n2o_emissions
-            self._total_emissions['locationBasedEmissionsCO2Emissions'] += location_based_emissions_co2_emissions
-            self._total_emissions['locationBasedEmissionsCH4Emissions'] += location_based_emissions_ch4_emissions
-            self._total_emissions['locationBasedEmissionsN2OEmissions'] += location_based_emissions_n2o_emissions
-
-            emissions.append({'sourceId': source_id, 'sourceDescription': row.get('sourceDescription'),
-                              'sourceArea': row.get('sourceArea'), 'eGridSubregion': subregion,
-                              'electricityPurchased': row['electricityPurchased'],
-                              'marketBasedEmissionFactorsCO2Emissions': row['marketBasedEmissionFactorsCO2Emissions'],
-                              'marketBasedEmissionFactorsCH4Emissions': row['marketBasedEmissionFactorsCH4Emissions'],
-                              'marketBasedEmissionFactorsN2OEmissions': row['marketBasedEmissionFactorsN2OEmissions'],
-                              'marketBasedEmissionsCO2Emissions': market_based_emissions_co2_emissions,
-                              'marketBasedEmissionsCH4Emissions': market_based_emissions_ch4_emissions,
-                              'marketBasedEmissionsN2OEmissions': market_based_emissions_n2o_emissions,
-                              'locationBasedEmissionsCO2Emissions': location_based_emissions_co2_emissions,
-                              'locationBasedEmissionsCH4Emissions': location_based_emissions_ch4_emissions,
-                              'locationBasedEmissionsN2OEmissions': location_based_emissions_n2o_emissions})
+            market_based_factors = [row[key] for key in self.market_based_factor_keys]
+            if location_based_emissions is None:
+                row_emissions = Electricity.calculate_row_emissions(electricity_purchased, market_based_factors,
+                                                                    factor_vectors[subregion])
+            else:
+                row_emissions = Electricity.calculate_market_based_row_emissions(
+                    electricity_purchased, market_based_factors, location_based_emissions[i])
+
+            electricity_purchased_total += electricity_purchased
+            emissions_totals = [total + value for total, value in zip(emissions_totals, row_emissions)]
 
+            emissions_row = {'sourceId': row.get('sourceId'), 'sourceDescription': row.get('sourceDescription'),
+                             'sourceArea': row.get('sourceArea'), 'eGridSubregion': subregion,
+                             'electricityPurchased': electricity_purchased}
+            emissions_row.update(zip(self.market_based_factor_keys, market_based_factors))
+            emissions_row.update(zip(self.emission_keys, row_emissions))
+            emissions.append(emissions_row)
+
+        self._total_emissions = {'electricityPurchased': electricity_purchased_total,
+                                 **dict(zip(self.emission_keys, emissions_totals))}
         self._output['totalElectricityPurchased'] = emissions
 
+    def tabulate_emission_columns(self, columns):
+        """ Vectorized counterpart of make_emissions. Factors are gathered for every row from
+        ElectricityFactors.factor_array in one pass. Sets the totals and returns the six emission columns as arrays. """
+        np = require_numpy('Electricity.recalc_columns')
+        codes = _encode_subregions(columns.get('eGridSubregion', []))
+        has_subregion = codes >= 0
+        n_rows = len(codes)
+
+        electricity_purchased = np.asarray(columns.get('electricityPurchased', [0.] * n_rows), dtype=float)
+        electricity_purchased = np.where(has_subregion, electricity_purchased, 0.)
+        megawatt_hours = electricity_purchased / 1000
+        location_based_factors = electricity_emission_factors.factor_array[np.where(has_subregion, codes, 0)]
+
+        market_based, location_based = [], []
+        for gas, key in enumerate(self.market_based_factor_keys):
+            location = np.maximum(0., megawatt_hours * location_based_factors[:, gas])
+            market_factors = np.asarray(columns.get(key, [None] * n_rows), dtype=float)
+            # A market-based factor that is not given (null or zero) falls back to the location-based emissions
+            market = np.where(np.nan_to_num(market_factors) != 0., np.maximum(0., megawatt_hours * market_factors),
+                              location)
+            location_based.append(np.where(has_subregion, location, 0.))
+            market_based.append(np.where(has_subregion, market, 0.))
+
+        row_emissions = dict(zip(self.emission_keys, market_based + location_based))
+        self._total_emissions = {'electricityPurchased': float(electricity_purchased.sum()),
+                                 **{key: float(column.sum()) for key, column in row_emissions.items()}}
+        return row_emissions
+
     def make_total_emissions_for_all_sources(self):
         """ Make total row """
         total_emissions_for_all_sources = {
@@ -118,6 +186,32 @@ class Electricity(Formula):
 
         self._output['totalEmissionsForAllSources'] = total_emissions_for_all_sources
 
+    @staticmethod
+    def aggregate_readings(readings: dict, sites: dict = None) -> list:
+        """ Sum interval readings into totalElectricityPurchased rows, one per sourceId and eGridSubregion, ordered by
+        the first reading of each sourceId (requires numpy). Readings are grouped by integer codes and summed with
+        np.bincount, so that no dict is made per reading. """
+        group_codes, site_ids, _ = _group_readings(readings)
+        return _reading_rows(readings, sites, group_codes, site_ids)[1]
+
+    @staticmethod
+    def calculate_market_based_row_emissions(purchased_amount, market_based_factors, location_based_emissions):
+        """ Calculate market-based then location-based CO2, CH4 and N2O emissions of one row, given (co2, ch4, n2o)
+        market-based factors and location-based emissions """
+        megawatt_hours = purchased_amount / 1000
+        market_based = [max(0., megawatt_hours * market_factor) if market_factor else location
+                        for market_factor, location in zip(market_based_factors, location_based_emissions)]
+        return market_based + list(location_based_emissions)
+
+    @staticmethod
+    def calculate_row_emissions(purchased_amount, market_based_factors, location_based_factors):
+        """ Calculate market-based then location-based CO2, CH4 and N2O emissions of one row in one pass, given
+        (co2, ch4, n2o) market-based factors and the factor vector of the row's subregion. Gives the same values as
+        calculate_market_based_emissions_electricity and calculate_location_based_emissions_electricity. """
+        megawatt_hours = purchased_amount / 1000
+        location_based = [max(0., megawatt_hours * factor) for factor in location_based_factors]
+        return Electricity.calculate_market_based_row_emissions(purchased_amount, market_based_factors, location_based)
+
     @staticmethod
     def calculate_market_based_emissions_electricity(purchased_amount, emissions_factor, subregion, fuel):
         """Calculate CO2 emissions for a gas given material balance inputs"""
@@ -164,3 +258,63 @@ class Electricity(Formula):
                  unit_conversions_factors['pounds']['kilogram']) / 1000
 
         self._output['CO2EquivalentEmissionsMarketBasedElectricityEmissions'] = total
+
+
+def _encode_subregions(subregions):
+    """ Map the eGridSubregion column to factor_array rows in one pass; empty subregions map to -1 """
+    np = require_numpy('Electricity.recalc_columns')
+    if isinstance(subregions, np.ndarray):
+        subregions = subregions.tolist()
+    subregion_codes = {**electricity_emission_factors.subregion_codes, None: -1, '': -1}
+    encoded = np.fromiter(map(subregion_codes.get, subregions, [-2] * len(subregions)), dtype=np.intp,
+                          count=len(subregions))
+    if (encoded < -1).any():
+        unknown = sorted({str(subregion) for subregion in subregions if subregion not in subregion_codes})
+        raise ValueError(f'Unknown eGridSubregion: {", ".join(unknown)}')
+    return encoded
+
+
+def _group_readings(readings):
+    """ Group code of every reading by sourceId and eGridSubregion, the distinct sourceIds and the eGridSubregion code
+    of every reading: its row in ElectricityFactors.factor_array + 1, or 0 for none """
+    site_codes, site_ids = _factorize(readings['sourceId'])
+    subregion_run_codes, subregion_values = _factorize(readings['eGridSubregion'])
+    subregion_codes = _encode_subregions(subregion_values)[subregion_run_codes] + 1
+    return site_codes * (len(electricity_emission_factors.subregion_codes) + 1) + subregion_codes, site_ids, \
+        subregion_codes
+
+
+def _reading_rows(readings, sites, group_codes, site_ids):
+    """ The groups that have readings, in order, and a totalElectricityPurchased row for each with their summed
+    electricityPurchased """
+    np = require_numpy('Electricity.aggregate_readings')
+    subregions = [None, *electricity_emission_factors.subregion_codes]
+    n_groups = len(site_ids) * len(subregions)
+    electricity_purchased = np.bincount(group_codes, minlength=n_groups,
+                                        weights=np.asarray(readings['electricityPurchased'], dtype=float))
+    groups = np.flatnonzero(np.bincount(group_codes, minlength=n_groups))
+
+    sites = sites or {}
+    rows = []
+    for group in groups.tolist():
+        site_code, subregion_code = divmod(group, len(subregions))
+        source_id = site_ids[site_code]
+        rows.append({'sourceDescription': None, 'sourceArea': None,
+                     **dict.fromkeys(Electricity.market_based_factor_keys), **sites.get(source_id, {}),
+                     'sourceId': source_id, 'eGridSubregion': subregions[subregion_code],
+                     'electricityPurchased': float(electricity_purchased[group])})
+    return groups, rows
+
+
+def _factorize(values):
+    """ Integer code of every value, numbered in order of first appearance, and the distinct values. Only the first
+    value of each run of equal values is looked up, so that readings grouped by site cost about one comparison each. """
+    np = require_numpy('Electricity.aggregate_readings')
+    values = np.asarray(values)
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.intp), []
+    run_starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    distinct = {}
+    run_codes = np.fromiter((distinct.setdefault(value, len(distinct)) for value in values[run_starts].tolist()),
+                            dtype=np.intp, count=len(run_starts))
+    return np.repeat(run_codes, np.diff(np.append(run_starts, len(values)))), list(distinct)
@@ -1,31 +1,220 @@
 """ Base class for all formula classes """
-import json
+import copy
+import functools
+import inspect
 import logging
-from io import StringIO
+
+from atomic6ghg import json_backend, schemas
+from atomic6ghg.columnar import arrow_table, output_columns
+from atomic6ghg.compact_table import CompactTable
+from atomic6ghg.factors.factor_set import get_factor_set, use_factor_set
+from atomic6ghg.instrumentation import instrument, timed_stage
+from atomic6ghg.result_cache import caches_result
 
 logger = logging.getLogger(__name__)
 
+JSON_SCALARS = (str, int, float, bool, type(None))
+JSON_SCALAR_TYPES = frozenset(JSON_SCALARS)
+
 
 class Formula:
     """ Base class for all formula classes """
-    def __init__(self, wks_data=None):
+    # Check in to_dict that _output is JSON serializable. The check is a walk over _output, made at most once per
+    # recalc; set to False to skip it where outputs are known to be well formed, e.g. in production
+    validate_output = True
+
+    # Validate wks_data against the worksheet schema before every recalc, raising jsonschema.ValidationError if it is
+    # invalid. The validator is built once per worksheet type; see atomic6ghg.schemas
+    validate_input = False
+
+    # Worksheet type, the prefix of the worksheet version, e.g. 'mobile-sources' for 'mobile-sources.1.0.0'
+    wks_type = None
+
+    # Keys of the row tables in wks_data. Each is echoed, or made into one output row per input row, under the same
+    # key in _output; totals are sums over rows. Used by apply_delta.
+    row_tables = ()
+
+    # Build the calculated row tables of _output as CompactTable column stores, appending each row as it is calculated,
+    # instead of lists of row dicts, to cut the memory held by the output of large worksheets. recalc returns _output
+    # with the compact tables; rows are materialized as dicts only when serialized or returned by to_dict
+    compact_rows = False
+
+    # Leave out of the summary tables the categories (fuel types, vehicle types, ...) that received no input rows,
+    # instead of listing every category with zero totals; totals are unchanged. dense_output() restores the full
+    # shape. Honoured by formulas that override expand_sparse_output
+    sparse_output = False
+
+    # ResultCache that recalc consults before calculating, e.g. Formula.result_cache = ResultCache(); see
+    # atomic6ghg.result_cache. Attributes that change the output for the same wks_data are named in cache_parameters
+    result_cache = None
+    cache_parameters = ('compact_rows', 'sparse_output')
+
+    # Names of the stage methods that recalcs run once each, which are timed while instrumented along with every
+    # recalc* method. Helpers called once per row are left out, so that they are never wrapped
+    stages = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name, method in list(vars(cls).items()):
+            if name.startswith('recalc') and callable(method):
+                setattr(cls, name, invalidates_output_cache(uses_factor_set(method)))
+        if 'recalc' in vars(cls):
+            cls.recalc = validates_input(caches_result(cls.recalc))
+        for name, method in list(vars(cls).items()):
+            if (name.startswith('recalc') or name in cls.stages) and inspect.isfunction(method):
+                setattr(cls, name, timed_stage(method))
+
+    def __init__(self, wks_data=None, factor_set=None):
         self.wks_data = wks_data or {}
 
+        # Factor edition, a FactorSet or the name of a registered one, that recalcs use instead of the active one
+        self.factor_set = get_factor_set(factor_set) if isinstance(factor_set, str) else factor_set
+
         # This variable exists for convenience of calculating totals in child classes
         self._total_emissions = {}
 
         self._output = {}
 
+        # Results of checking and encoding _output, keyed by kind; each entry holds the _output it was made from
+        self._output_cache = {}
+
+    @classmethod
+    def instrument(cls, callback=None, allocations=False, keep_records=True):
+        """ Context manager that records the wall time, input row count and, with allocations, the memory allocated
+        by every recalc and stage of formulas of this class run inside it. Yields a StageRecorder, whose records
+        (or to_dict() summary) can be read afterwards; callback is called with each record as it is made, e.g. to
+        forward it to a metrics client. Costs next to nothing when not in use. """
+        return instrument(cls, callback=callback, allocations=allocations, keep_records=keep_records)
+
     def recalc(self, wks_data):
         """ All child classes must implement this method """
         raise NotImplementedError
 
+    def apply_delta(self, inserted=None, updated=None, deleted=None, table=None) -> dict:
+        """ Apply row edits to one row table and adjust the totals in O(changed rows) instead of recalculating.
+
+        inserted is a list of rows appended to the table, updated maps row indices to replacement rows and deleted is
+        a list of row indices; indices refer to the table before the edit and may be negative, counting from its end
+        as list indices do. table may be omitted when the formula has a single row table. wks_data is edited in place.
+        The change to every total is found by running the formula over the removed and the added rows alone, which
+        gives the same totals as a full recalc (up to float rounding) because totals are sums over rows. Falls back to
+        a full recalc when the output does not have that form. Returns to_dict(). """
+        if table is None:
+            if len(self.row_tables) != 1:
+                raise ValueError(f'{self.__class__.__name__} has several row tables; pass table')
+            table = self.row_tables[0]
+        elif table not in self.row_tables:
+            raise ValueError(f'{table} is not a row table of {self.__class__.__name__}')
+        rows = self.wks_data.setdefault(table, [])
+        indices = range(len(rows))
+        inserted = list(inserted or [])
+        updated = dict(updated or {})
+        normalized = {indices[i]: row for i, row in updated.items()}
+        if len(normalized) != len(updated):
+            raise ValueError('A row cannot be updated twice')
+        updated = normalized
+        deleted = sorted({indices[i] for i in deleted or []}, reverse=True)
+        if not updated.keys().isdisjoint(deleted):
+            raise ValueError('A row cannot be both updated and deleted')
+
+        removed_rows = [rows[i] for i in updated] + [rows[i] for i in deleted]
+        added_rows = list(updated.values()) + inserted
+        before = self.delta_formula(table, removed_rows)
+        after = self.delta_formula(table, added_rows)
+
+        output_rows = self._output.get(table)
+        if output_rows is rows or not isinstance(output_rows, (list, CompactTable)) or len(output_rows) != len(rows):
+            # Output rows are either the input rows themselves or not echoed at all
+            output_rows = None
+        for i, row in updated.items():
+            rows[i] = row
+        for i in deleted:
+            del rows[i]
+        rows.extend(inserted)
+
+        self.invalidate_output_cache()
+        try:
+            totals, after_totals, before_totals = ({key: value for key, value in output.items()
+                                                    if key not in self.row_tables}
+                                                   for output in (self._output, after._output, before._output))
+            add_delta(totals, after_totals, before_totals)
+            add_delta(self._total_emissions, after._total_emissions, before._total_emissions)
+        except ValueError as e:
+            logger.info('%s.apply_delta falling back to recalc: %s', self.__class__.__name__, e)
+            self.recalc(self.wks_data)
+            return self.to_dict()
+        self._output.update(totals)
+
+        if output_rows is not None:
+            added_output_rows = after._output[table]
+            for i, row in zip(updated, added_output_rows):
+                output_rows[i] = row
+            for i in deleted:
+                del output_rows[i]
+            output_rows.extend(added_output_rows[len(updated):])
+
+        return self.to_dict()
+
+    def delta_formula(self, table, rows):
+        """ Copy of this formula, with its settings such as compact_rows, recalculated over rows alone with the scalar
+        inputs of wks_data and no other rows. The partial wks_data is neither validated nor looked up in or stored to
+        the result cache. """
+        wks_data = {**self.wks_data, **{row_table: [] for row_table in self.row_tables}, table: rows}
+        formula = copy.copy(self)
+        Formula.__init__(formula, wks_data, factor_set=self.factor_set)
+        formula.validate_input = False
+        formula.result_cache = None
+        formula.recalc(wks_data)
+        return formula
+
+    @classmethod
+    def compute_many(cls, documents, **kwargs):
+        """ Compute an iterable of worksheets with a single instance, yielding each output as it is computed.
+
+        Outputs are the same as cls(wks_data, **kwargs).to_dict() for each worksheet and remain valid after the next
+        one is computed, since every worksheet gets a fresh _output. """
+        formula = None
+        for wks_data in documents:
+            if formula is None:
+                formula = cls(wks_data, **kwargs)
+            else:
+                formula._output = {}
+                formula.recalc(wks_data)
+            yield formula.to_dict()
+
+    def output_rows(self):
+        """ Empty calculated row table for a stage to append its output rows to: a CompactTable with compact_rows,
+        otherwise a list """
+        return CompactTable() if self.compact_rows else []
+
+    def invalidate_output_cache(self):
+        """ Forget the cached check and encoding of _output. Called before every recalc; call it after changing
+        _output in place by other means. """
+        self._output_cache = {}
+
+    def cached_output(self, kind):
+        """ Cached result for kind if it was made from the current _output """
+        cached = self._output_cache.get(kind)
+        if cached is not None and cached[0] is self._output:
+            return cached
+        return None
+
     def to_dict(self):
-        """ API to expose _output """
+        """ API to expose _output. With compact_rows, the CompactTables of _output are materialized as lists of row
+        dicts in a new dict on every call, which is not kept; _output keeps the compact tables. """
+        output = self.checked_output()
+        if output is None or not any(isinstance(value, CompactTable) for value in output.values()):
+            return output
+        return {key: value.tolist() if isinstance(value, CompactTable) else value for key, value in output.items()}
+
+    def checked_output(self):
+        """ _output once it is checked to be JSON serializable, or None if it is not """
+        if not self.validate_output or any(cached[0] is self._output for cached in self._output_cache.values()):
+            return self._output
         try:
             # Check to ensure that _output is JSON serializable, otherwise TypeError is thrown
-            io = StringIO()
-            json.dump(self._output, io)
+            check_json_types(self._output)
+            self._output_cache['checked'] = (self._output, True)
             ret = self._output
         except TypeError as e:
             err_msg = f'{self.__class__.__name__}._output is not a dict. Error message: {e}'
@@ -33,16 +222,141 @@ class Formula:
             ret = None
         return ret
 
-    def to_json(self):
+    def dense_output(self):
+        """ to_dict() in the full shape, with zero rows for the categories that sparse_output left out, e.g. for UIs
+        that expect every category. Returns to_dict() itself when sparse_output is not set. """
+        output = self.to_dict()
+        if output is None or not self.sparse_output:
+            return output
+        return self.expand_sparse_output(output)
+
+    def expand_sparse_output(self, output: dict) -> dict:
+        """ Copy of a sparse output with the categories left out restored as zero rows. Formulas with sparse summary
+        tables override this. """
+        return output
+
+    def to_json(self, indent=2):
         """ API to expose _output as JSON """
+        cached = self.cached_output(('str', indent))
+        if cached:
+            return cached[1]
         try:
-            ret = json.dumps(self._output, indent=2)
+            ret = json_backend.dumps(self._output, indent=indent)
+            self._output_cache[('str', indent)] = (self._output, ret)
         except TypeError as e:
             err_msg = f'{self.__class__.__name__}._output is not a dict. Error message: {e}'
             logger.error(err_msg)
             ret = None
         return ret
 
+    def to_json_bytes(self, indent=None):
+        """ API to expose _output as UTF-8 encoded JSON, compact unless indent is given, for writing straight to a
+        socket or file """
+        cached = self.cached_output(('bytes', indent))
+        if cached:
+            return cached[1]
+        try:
+            ret = json_backend.dumpb(self._output, indent=indent)
+            self._output_cache[('bytes', indent)] = (self._output, ret)
+        except TypeError as e:
+            err_msg = f'{self.__class__.__name__}._output is not a dict. Error message: {e}'
+            logger.error(err_msg)
+            ret = None
+        return ret
+
+    def to_columns(self) -> dict:
+        """ API to expose the row tables of _output as typed columns, {table: {column: values}}, for bulk loads.
+        Numeric columns are typed arrays (or the numpy arrays of columnar recalcs) that share memory with _output
+        where they can, so they must not be modified; other columns are lists. See atomic6ghg.columnar. """
+        return output_columns(self._output)
+
+    def to_arrow(self) -> dict:
+        """ API to expose the row tables of _output as {table: pyarrow.Table} (requires pyarrow), e.g. to write with
+        pyarrow.parquet.write_table or an Arrow IPC writer. The tables do not share memory with _output, except
+        for the numpy arrays of columnar recalcs. """
+        return {table: arrow_table(columns) for table, columns in self.to_columns().items()}
+
+
+def invalidates_output_cache(method):
+    """ Wrap a recalc method of a Formula subclass so that it starts by invalidating the output cache """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.invalidate_output_cache()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+def uses_factor_set(method):
+    """ Wrap a recalc method of a Formula subclass so that it runs with the formula's factor_set, if it has one """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.factor_set is None:
+            return method(self, *args, **kwargs)
+        with use_factor_set(self.factor_set):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def validates_input(method):
+    """ Wrap the recalc method of a Formula subclass so that it validates wks_data first when validate_input is set """
+    @functools.wraps(method)
+    def wrapper(self, wks_data, *args, **kwargs):
+        if self.validate_input:
+            schemas.validate(wks_data, self.wks_type)
+        return method(self, wks_data, *args, **kwargs)
+    return wrapper
+
+
+def add_delta(current, after, before):
+    """ Add after - before to every number in current, in place. current, after and before must have the same
+    structure and the same non-numeric values, otherwise ValueError is raised and current may be partly updated. """
+    if isinstance(current, dict):
+        if not current.keys() == after.keys() == before.keys():
+            raise ValueError('output keys differ')
+        items = current.items()
+    elif isinstance(current, list):
+        if not len(current) == len(after) == len(before):
+            raise ValueError('output lists differ in length')
+        items = enumerate(current)
+    else:
+        raise ValueError(f'cannot add a delta to {current.__class__.__name__}')
+
+    for key, value in list(items):
+        if isinstance(value, (dict, list)):
+            add_delta(value, after[key], before[key])
+        elif is_number(value) and is_number(after[key]) and is_number(before[key]):
+            current[key] = value + (after[key] - before[key])
+        elif not value == after[key] == before[key]:
+            raise ValueError(f'non-numeric output {key} changed')
+
+
+def is_number(value):
+    """ Whether value is an int or float, excluding bool """
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def check_json_types(output):
+    """ Raise TypeError if output holds anything the JSON encoder cannot serialize. Array columns (e.g. numpy
+    arrays) held in _output by columnar recalcs are accepted without being expanded. """
+    stack = [output]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            for key in value:
+                if not isinstance(key, JSON_SCALARS):
+                    raise TypeError(f'keys must be str, int, float, bool or None, not {key.__class__.__name__}')
+            stack.extend(value.values())
+        elif isinstance(value, CompactTable):
+            for shape in value.shapes:
+                stack.append(dict.fromkeys(shape))
+            stack.extend(value.columns.values())
+        elif isinstance(value, (list, tuple)):
+            # Lists of plain scalars, such as echoed input columns, are checked without a Python level loop
+            if not JSON_SCALAR_TYPES.issuperset(map(type, value)):
+                stack.extend(value)
+        elif not isinstance(value, JSON_SCALARS) and not hasattr(value, 'tolist'):
+            raise TypeError(f'Object of type {value.__class__.__name__} is not JSON serializable')
+
 
 def null_replacer(value):
     """ Replaces None with 0. for user input float values to be used in equations """
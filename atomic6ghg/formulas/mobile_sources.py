@@ -1,11 +1,14 @@
 """ Mobile Sources models """
 # pylint: disable=no-name-in-module
 import logging
+from collections import defaultdict
 
 from atomic6ghg.formulas import Formula
 from atomic6ghg.factors import mobile_combustion_co2_emission_factors, mobile_combustion_ch4_and_n2o_emission_factors, \
     refrigerants_gwp_factors
+from atomic6ghg.factors.mobile_combustion_ch4_and_n2o_emission_factors import MobileCombustionCh4AndN2oEmissionFactors
 from atomic6ghg import YearMapException, YearValueException
+from atomic6ghg.optional import require_numpy
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +16,15 @@ logger = logging.getLogger(__name__)
 class MobileSources(Formula):
     """ Calculate emissions from mobile source vehicles """
 
+    wks_type = 'mobile-sources'
+    row_tables = ('mobileSourcesFuelConsumption',)
+    stages = ('tabulate_subtable_data', 'tabulate_subtable_columns', 'make_summary_tables',
+              'make_total_mobile_sources_fuel_usage_and_co2_emissions',
+              'make_total_organization_wide_on_road_gasoline_mobile_source_mileage_and_emissions',
+              'make_total_organization_wide_on_road_non_gasoline_mobile_source_mileage_and_emissions',
+              'make_total_organization_wide_non_road_mobile_source_fuel_usage_and_emissions',
+              'make_total_co2_equivalent_emissions', 'make_total_biomass_co2_equivalent_emissions')
+
     co2_fuels_units = {'gasoline': 'gallons', 'diesel': 'gallons', 'residualFuelOil': 'gallons',
                        'aviationGasoline': 'gallons', 'jetFuel': 'gallons', 'lpg': 'gallons',
                        'ethanol': 'gallons', 'biodiesel': 'gallons', 'lng': 'gallons', 'cng': 'scf'}
@@ -25,8 +37,11 @@ class MobileSources(Formula):
                         'industrialCommercialEquipment', 'lawnAndGardenEquipment', 'locomotives', 'loggingEquipment',
                         'railroadEquipment', 'recreationalEquipment', 'shipsAndBoats']
 
-    def __init__(self, wks_data=None):
-        super().__init__(wks_data=wks_data)
+    # Built on first use of recalc_columns, for each edition of the mobile combustion factors
+    _columnar_lookups = {}
+
+    def __init__(self, wks_data=None, factor_set=None):
+        super().__init__(wks_data=wks_data, factor_set=factor_set)
 
         self.biodiesel_percent = 20
         self.ethanol_percent = 80
@@ -40,26 +55,71 @@ class MobileSources(Formula):
         """ Execute recalc procedure for MobileSources """
         self.wks_data = wks_data
 
+        self.reset_totals()
+
+        self.tabulate_subtable_data()
+
+        self.make_summary_tables()
+
+        # Add user data to _output
+        self._output['mobileSourcesFuelConsumption'] = self.wks_data.get('mobileSourcesFuelConsumption', [])
+        self._output['biodieselPercent'] = self.biodiesel_percent
+        self._output['ethanolPercent'] = self.ethanol_percent
+
+        return self.checked_output()
+
+    def recalc_columns(self, wks_columns: dict) -> dict:
+        """ Execute recalc procedure for MobileSources over column arrays instead of row dicts (requires numpy).
+
+        wks_columns has the same shape as wks_data, except that mobileSourcesFuelConsumption is a dict of equal length
+        arrays keyed by vehicleType, fuelType, vehicleYear, fuelUsage and milesTraveled. The summary tables are the
+        same as those made by recalc, and mobileSourcesFuelConsumption in _output holds the input columns plus per-row
+        CO2, CH4 and N2O arrays. """
+        require_numpy('MobileSources.recalc_columns')
+        self.wks_data = wks_columns
+
+        self.reset_totals()
+
+        columns = self.wks_data.get('mobileSourcesFuelConsumption', {})
+        row_emissions = self.tabulate_subtable_columns(columns)
+
+        self.make_summary_tables()
+
+        # Add user data to _output
+        self._output['mobileSourcesFuelConsumption'] = {**columns, **row_emissions}
+        self._output['biodieselPercent'] = self.biodiesel_percent
+        self._output['ethanolPercent'] = self.ethanol_percent
+
+        return self.checked_output()
+
+    def reset_totals(self):
+        """ Zero all accumulators before tabulating user input data """
         self._total_emissions = {'CO2': 0., 'CH4': 0., 'N2O': 0.}
 
-        self.total_fuel_usage_and_co2_emissions = {fuel_type: {'fuelUsage': 0, 'CO2': 0.}
-                                                   for fuel_type in self.co2_fuels_units}
+        if self.sparse_output:
+            # Accumulators are made on first use by the categories that receive input rows; see order_sparse_totals
+            self.total_fuel_usage_and_co2_emissions = defaultdict(lambda: {'fuelUsage': 0, 'CO2': 0.})
+            self.total_useage_and_ch4_and_n2o_emissions = defaultdict(lambda: defaultdict(lambda: defaultdict(
+                lambda: {'N2O': 0., 'CH4': 0., 'mileage': 0., 'fuelUsage': 0.})))
+        else:
+            self.total_fuel_usage_and_co2_emissions = {fuel_type: {'fuelUsage': 0, 'CO2': 0.}
+                                                       for fuel_type in self.co2_fuels_units}
 
-        self.total_useage_and_ch4_and_n2o_emissions = \
-            {vehicle_type: {fuel_type: {
-                mobile_combustion_ch4_and_n2o_emission_factors[vehicle_type][fuel_type][year]['year_display']:
-                    {'N2O': 0., 'CH4': 0., 'mileage': 0., 'fuelUsage': 0.}
-                for year in mobile_combustion_ch4_and_n2o_emission_factors[vehicle_type][fuel_type]}
-                for fuel_type in mobile_combustion_ch4_and_n2o_emission_factors[vehicle_type]}
-                for vehicle_type in mobile_combustion_ch4_and_n2o_emission_factors
-            }
+            year_tables = mobile_combustion_ch4_and_n2o_emission_factors.dense_year_tables
+            self.total_useage_and_ch4_and_n2o_emissions = {}
+            for (vehicle_type, fuel_type), year_displays in zip(year_tables.pairs, year_tables.year_displays_by_pair):
+                self.total_useage_and_ch4_and_n2o_emissions.setdefault(vehicle_type, {})[fuel_type] = \
+                    {year_display: {'N2O': 0., 'CH4': 0., 'mileage': 0., 'fuelUsage': 0.}
+                     for year_display in year_displays}
 
         # If these keys aren't in wks_data then default to original wks_data values
         self.biodiesel_percent = self.wks_data.get('biodieselPercent', 20)
         self.ethanol_percent = self.wks_data.get('ethanolPercent', 80)
 
-        self.tabulate_subtable_data()
-
+    def make_summary_tables(self):
+        """ Make all output tables from the tabulated totals """
+        if self.sparse_output:
+            self.order_sparse_totals()
         self.make_total_mobile_sources_fuel_usage_and_co2_emissions()
         self.make_total_organization_wide_on_road_gasoline_mobile_source_mileage_and_emissions()
         self.make_total_organization_wide_on_road_non_gasoline_mobile_source_mileage_and_emissions()
@@ -67,13 +127,6 @@ class MobileSources(Formula):
         self.make_total_co2_equivalent_emissions()
         self.make_total_biomass_co2_equivalent_emissions()
 
-        # Add user data to _output
-        self._output['mobileSourcesFuelConsumption'] = self.wks_data.get('mobileSourcesFuelConsumption', [])
-        self._output['biodieselPercent'] = self.biodiesel_percent
-        self._output['ethanolPercent'] = self.ethanol_percent
-
-        return self.to_dict()
-
     def tabulate_subtable_data(self):
         """ Loop over user input data and make all sub-tables. """
 
@@ -126,27 +179,223 @@ class MobileSources(Formula):
             usage = fuel_usage
 
         try:
-            ch4_emissions = MobileSources.calculate_ch4_emissions(vehicle_type, fuel_type, usage, vehicle_year)
+            ch4_factor, n2o_factor, year_display = \
+                mobile_combustion_ch4_and_n2o_emission_factors.dense_year_tables.lookup(vehicle_type, fuel_type,
+                                                                                         vehicle_year)
         except (YearMapException, YearValueException) as e:
             logger.error(e)
-            ch4_emissions = 0.
+            return
+        ch4_emissions = ch4_factor * usage
+        n2o_emissions = n2o_factor * usage
 
-        try:
-            n2o_emissions = MobileSources.calculate_n2o_emissions(vehicle_type, fuel_type, usage, vehicle_year)
-        except (YearMapException, YearValueException) as e:
-            logger.error(e)
-            n2o_emissions = 0.
-
-        year_display = \
-            mobile_combustion_ch4_and_n2o_emission_factors[vehicle_type][fuel_type][vehicle_year]['year_display']
-        self.total_useage_and_ch4_and_n2o_emissions[vehicle_type][fuel_type][year_display]['CH4'] += ch4_emissions
-        self.total_useage_and_ch4_and_n2o_emissions[vehicle_type][fuel_type][year_display]['N2O'] += n2o_emissions
-        self.total_useage_and_ch4_and_n2o_emissions[vehicle_type][fuel_type][year_display]['mileage'] += miles_traveled
-        self.total_useage_and_ch4_and_n2o_emissions[vehicle_type][fuel_type][year_display]['fuelUsage'] += fuel_usage
+        totals = self.total_useage_and_ch4_and_n2o_emissions[vehicle_type][fuel_type][year_display]
+        totals['CH4'] += ch4_emissions
+        totals['N2O'] += n2o_emissions
+        totals['mileage'] += miles_traveled
+        totals['fuelUsage'] += fuel_usage
 
         self._total_emissions['CH4'] += ch4_emissions
         self._total_emissions['N2O'] += n2o_emissions
 
+    # pylint: disable=too-many-locals
+    def tabulate_subtable_columns(self, columns):
+        """ Vectorized counterpart of tabulate_subtable_data. CH4 and N2O factors are gathered from the dense year
+        tables in one pass and the sub-tables are tabulated with np.bincount. Returns the per-row CO2, CH4 and N2O
+        emissions as arrays. """
+        np = require_numpy('MobileSources.recalc_columns')
+        lookup = self.columnar_lookup_tables()
+        year_tables = mobile_combustion_ch4_and_n2o_emission_factors.dense_year_tables
+        n_rows = len(columns.get('fuelType', []))
+
+        vehicle_codes, fuel_codes = _encode_categories(columns.get('vehicleType', [None] * n_rows),
+                                                       columns.get('fuelType', []), lookup)
+        fuel_usage = np.nan_to_num(np.asarray(columns.get('fuelUsage', [0.] * n_rows), dtype=float))
+        miles_traveled = np.nan_to_num(np.asarray(columns.get('milesTraveled', [0.] * n_rows), dtype=float))
+        has_fuel = fuel_codes >= 0
+        safe_fuel_codes = np.where(has_fuel, fuel_codes, 0)
+
+        # CO2 by fuel type; the biomass share of ethanol and biodiesel is removed by a per-fuel multiplier
+        co2_factors = lookup['co2_factors'] * \
+            np.array([self.get_fuel_usage(co2_fuel_type, 1.) for co2_fuel_type in lookup['co2_fuel_types']])
+        co2_fuel_usage = np.where(has_fuel, fuel_usage, 0.)
+        co2_emissions = co2_fuel_usage * co2_factors[safe_fuel_codes]
+        co2_buckets = lookup['co2_buckets'][safe_fuel_codes]
+        co2_fuel_usage_totals = np.bincount(co2_buckets, weights=co2_fuel_usage, minlength=len(self.co2_fuels_units))
+        co2_totals = np.bincount(co2_buckets, weights=co2_emissions, minlength=len(self.co2_fuels_units))
+        # Only the fuel types of rows with fuel usage are tabulated, as in tabulate_subtable_data
+        co2_rows = np.bincount(co2_buckets[co2_fuel_usage != 0.], minlength=len(self.co2_fuels_units))
+        co2_fuel_types = list(self.co2_fuels_units)
+        for bucket in np.flatnonzero(co2_rows):
+            co2_fuel_type = co2_fuel_types[bucket]
+            self.total_fuel_usage_and_co2_emissions[co2_fuel_type]['fuelUsage'] += float(co2_fuel_usage_totals[bucket])
+            self.total_fuel_usage_and_co2_emissions[co2_fuel_type]['CO2'] += float(co2_totals[bucket])
+        self._total_emissions['CO2'] += float(co2_totals.sum())
+
+        # CH4 and N2O by vehicle type, fuel type and year_display
+        ch4_emissions = np.zeros(n_rows)
+        n2o_emissions = np.zeros(n_rows)
+        vehicle_rows = has_fuel & (vehicle_codes >= 0)
+        if vehicle_rows.any():
+            # Masking is skipped when every row has a vehicle type, the common case
+            rows = slice(None) if vehicle_rows.all() else vehicle_rows
+            vehicle_row_codes = vehicle_codes[rows]
+            pairs = lookup['pair_codes'][vehicle_row_codes * len(lookup['fuel_types']) + fuel_codes[rows]]
+            if (pairs < 0).any():
+                raise ValueError('vehicleType and fuelType combination has no CH4 and N2O emission factors')
+            years, valid_years = _vehicle_years(columns.get('vehicleYear', [None] * n_rows), rows,
+                                                lookup['pair_year_dependent'][pairs])
+            index = year_tables.gather_index(pairs, years)
+            groups = lookup['index_groups'][index]
+            # Rows with an invalid vehicleYear, or one that maps to no year display, are logged and left out of the
+            # CH4 and N2O totals, as in tabulate_subtable_data
+            kept = valid_years & (groups >= 0)
+            if not kept.all():
+                logger.error('Skipping %d rows with an invalid or unmapped vehicleYear', int((~kept).sum()))
+                rows = np.flatnonzero(vehicle_rows)[kept]
+                vehicle_row_codes, index, groups = vehicle_row_codes[kept], index[kept], groups[kept]
+
+            row_miles_traveled = miles_traveled[rows]
+            row_fuel_usage = fuel_usage[rows]
+            usage = np.where(lookup['road_vehicles'][vehicle_row_codes], row_miles_traveled, row_fuel_usage)
+            ch4_emissions[rows] = year_tables.ch4_array[index] * usage
+            n2o_emissions[rows] = year_tables.n2o_array[index] * usage
+
+            n_groups = len(lookup['groups'])
+            sums = {'CH4': np.bincount(groups, weights=ch4_emissions[rows], minlength=n_groups),
+                    'N2O': np.bincount(groups, weights=n2o_emissions[rows], minlength=n_groups),
+                    'mileage': np.bincount(groups, weights=row_miles_traveled, minlength=n_groups),
+                    'fuelUsage': np.bincount(groups, weights=row_fuel_usage, minlength=n_groups)}
+            for group in np.flatnonzero(np.bincount(groups, minlength=n_groups)):
+                vehicle_type, fuel_type, year_display = lookup['groups'][group]
+                totals = self.total_useage_and_ch4_and_n2o_emissions[vehicle_type][fuel_type][year_display]
+                for key, group_sums in sums.items():
+                    totals[key] += float(group_sums[group])
+
+            self._total_emissions['CH4'] += float(sums['CH4'].sum())
+            self._total_emissions['N2O'] += float(sums['N2O'].sum())
+
+        return {'CO2': co2_emissions, 'CH4': ch4_emissions, 'N2O': n2o_emissions}
+
+    @classmethod
+    def columnar_lookup_tables(cls):
+        """ Integer-coded lookup tables used by tabulate_subtable_columns, built once per process and factor edition """
+        np = require_numpy('MobileSources.recalc_columns')
+        edition = (mobile_combustion_co2_emission_factors.load(), mobile_combustion_ch4_and_n2o_emission_factors.load())
+        if edition not in cls._columnar_lookups:
+            vehicle_types = list(mobile_combustion_ch4_and_n2o_emission_factors)
+            fuel_types = [fuel_type for vehicle_type in vehicle_types
+                          for fuel_type in mobile_combustion_ch4_and_n2o_emission_factors[vehicle_type]]
+            fuel_types = list(dict.fromkeys(fuel_types + list(cls.co2_fuel_map) + list(cls.co2_fuels_units)))
+            empty_codes = [(-1, None), (-1, '')]
+            co2_fuel_types = [cls.co2_fuel_map.get(fuel_type, fuel_type) for fuel_type in fuel_types]
+            co2_buckets = list(cls.co2_fuels_units)
+
+            year_tables = mobile_combustion_ch4_and_n2o_emission_factors.dense_year_tables
+            pair_codes = np.full(len(vehicle_types) * len(fuel_types), -1, dtype=np.intp)
+            for (vehicle_type, fuel_type), pair_code in year_tables.pair_codes.items():
+                position = vehicle_types.index(vehicle_type) * len(fuel_types) + fuel_types.index(fuel_type)
+                pair_codes[position] = pair_code
+
+            # Accumulator group of every position in the dense year tables, -1 for unmapped years
+            groups = [(vehicle_type, fuel_type, year_display)
+                      for (vehicle_type, fuel_type), year_displays in zip(year_tables.pairs,
+                                                                          year_tables.year_displays_by_pair)
+                      for year_display in year_displays]
+            group_codes = {group: code for code, group in enumerate(groups)}
+            index_groups = np.full(len(year_tables.ch4_factors), -1, dtype=np.intp)
+            for pair_code, (vehicle_type, fuel_type) in enumerate(year_tables.pairs):
+                offset = year_tables.offsets[pair_code]
+                for i in range(offset, offset + year_tables.lengths[pair_code]):
+                    if year_tables.year_display_codes[i] >= 0:
+                        year_display = year_tables.year_displays[year_tables.year_display_codes[i]]
+                        index_groups[i] = group_codes[(vehicle_type, fuel_type, year_display)]
+
+            cls._columnar_lookups[edition] = {
+                # Combined (vehicleType, fuelType) codes; empty vehicle or fuel types decode to -1
+                'category_codes': {(vehicle_type, fuel_type): (vehicle_code + 1) * (len(fuel_types) + 1) + fuel_code + 1
+                                   for vehicle_code, vehicle_type in empty_codes + list(enumerate(vehicle_types))
+                                   for fuel_code, fuel_type in empty_codes + list(enumerate(fuel_types))},
+                'fuel_types': fuel_types,
+                'road_vehicles': np.array([vehicle_type in cls.road_vehicles for vehicle_type in vehicle_types]),
+                'co2_fuel_types': co2_fuel_types,
+                'co2_buckets': np.array([co2_buckets.index(co2_fuel_type) for co2_fuel_type in co2_fuel_types],
+                                        dtype=np.intp),
+                'co2_factors': np.array([mobile_combustion_co2_emission_factors[cls.non_biomass_co2_fuel_map.get(
+                    co2_fuel_type, co2_fuel_type)] for co2_fuel_type in co2_fuel_types]),
+                'pair_codes': pair_codes,
+                'pair_year_dependent': np.frombuffer(year_tables.lengths, dtype=np.int64) > 1,
+                'groups': groups,
+                'index_groups': index_groups,
+            }
+        return cls._columnar_lookups[edition]
+
+    def order_sparse_totals(self):
+        """ Replace the accumulators made for sparse_output with plain dicts in the order of the dense ones """
+        self.total_fuel_usage_and_co2_emissions = {fuel_type: self.total_fuel_usage_and_co2_emissions[fuel_type]
+                                                   for fuel_type in self.co2_fuels_units
+                                                   if fuel_type in self.total_fuel_usage_and_co2_emissions}
+
+        year_tables = mobile_combustion_ch4_and_n2o_emission_factors.dense_year_tables
+        totals = self.total_useage_and_ch4_and_n2o_emissions
+        ordered = {}
+        # Pairs are grouped by vehicle type, so that ordering by pair code also orders the vehicle types
+        pairs = sorted(((vehicle_type, fuel_type) for vehicle_type in totals for fuel_type in totals[vehicle_type]),
+                       key=year_tables.pair_codes.get)
+        for vehicle_type, fuel_type in pairs:
+            by_year = totals[vehicle_type][fuel_type]
+            year_displays = year_tables.year_displays_by_pair[year_tables.pair_codes[(vehicle_type, fuel_type)]]
+            ordered.setdefault(vehicle_type, {})[fuel_type] = {year_display: by_year[year_display]
+                                                               for year_display in year_displays
+                                                               if year_display in by_year}
+        self.total_useage_and_ch4_and_n2o_emissions = ordered
+
+    @staticmethod
+    def dense_categories() -> dict:
+        """ Year displays of every fuel type of every vehicle type with CH4 and N2O factors, in the order of the dense
+        accumulators """
+        year_tables = mobile_combustion_ch4_and_n2o_emission_factors.dense_year_tables
+        categories = {}
+        for (vehicle_type, fuel_type), year_displays in zip(year_tables.pairs, year_tables.year_displays_by_pair):
+            categories.setdefault(vehicle_type, {})[fuel_type] = list(dict.fromkeys(year_displays))
+        return categories
+
+    def expand_sparse_output(self, output: dict) -> dict:
+        """ Copy of a sparse output with zero rows for every fuel type, vehicle type and vehicle year that is not in
+        it """
+        categories = self.dense_categories()
+        gasoline = {row['vehicleType']: row['emissionByYear']
+                    for row in output['totalOrganizationWideOnRoadGasolineMobileSourceMileageAndEmissions']}
+        non_gasoline = {(row['vehicleType'], row['fuelType']): row['emissionByYear']
+                        for row in output['totalOrganizationWideOnRoadNonGasolineMobileSourceMileageAndEmissions']}
+        non_road = {row['vehicleType']: row['emissionByFuelType']
+                    for row in output['totalOrganizationWideNonRoadMobileSourceFuelUsageAndEmissions']}
+
+        def by_year(rows, year_displays):
+            return _dense_rows(rows, 'vehicleYear', year_displays,
+                               lambda year: {'vehicleYear': year, 'mileage': 0., 'CH4': 0., 'N2O': 0.})
+
+        return {
+            **output,
+            'totalMobileSourcesFuelUsageAndCO2Emissions': _dense_rows(
+                output['totalMobileSourcesFuelUsageAndCO2Emissions'], 'fuelType', self.co2_fuels_units,
+                lambda fuel_type: {'fuelType': fuel_type, 'fuelUsage': 0, 'units': self.co2_fuels_units[fuel_type],
+                                   'CO2': 0.}),
+            'totalOrganizationWideOnRoadGasolineMobileSourceMileageAndEmissions': [
+                {'vehicleType': vehicle_type,
+                 'emissionByYear': by_year(gasoline.get(vehicle_type, ()), year_displays)}
+                for vehicle_type, fuel_types in categories.items() for fuel_type, year_displays in fuel_types.items()
+                if vehicle_type in self.road_vehicles and fuel_type == 'gasoline'],
+            'totalOrganizationWideOnRoadNonGasolineMobileSourceMileageAndEmissions': [
+                {'vehicleType': vehicle_type, 'fuelType': fuel_type,
+                 'emissionByYear': by_year(non_gasoline.get((vehicle_type, fuel_type), ()), year_displays)}
+                for vehicle_type, fuel_types in categories.items() for fuel_type, year_displays in fuel_types.items()
+                if vehicle_type in self.road_vehicles and fuel_type != 'gasoline'],
+            'totalOrganizationWideNonRoadMobileSourceFuelUsageAndEmissions': [
+                {'vehicleType': vehicle_type, 'emissionByFuelType': _dense_rows(
+                    non_road.get(vehicle_type, ()), 'fuelType', fuel_types,
+                    lambda fuel_type: {'fuelType': fuel_type, 'fuelUsage': 0., 'CH4': 0., 'N2O': 0.})}
+                for vehicle_type, fuel_types in categories.items() if vehicle_type in self.nonroad_vehicles]}
+
     def make_total_mobile_sources_fuel_usage_and_co2_emissions(self):
         """ Format total_fuel_usage_and_co2_emissions data for schema """
         total_fuel_usage_and_co2_emissions = \
@@ -222,16 +471,18 @@ class MobileSources(Formula):
     def calculate_ch4_emissions(vehicle_type, fuel_type, usage, vehicle_year):
         """ Calculate CH4 emissions for a mobile source vehicle. usage is either fuel_usage or miles_traveled depending
         on if the vehicle_type is non-road or on road, respectively. """
-        ret = mobile_combustion_ch4_and_n2o_emission_factors[vehicle_type][fuel_type][vehicle_year]['ch4_factor'] * \
-              usage
+        year_tables = mobile_combustion_ch4_and_n2o_emission_factors.dense_year_tables
+        ch4_factor, _, _ = year_tables.lookup(vehicle_type, fuel_type, vehicle_year)
+        ret = ch4_factor * usage
         return ret
 
     @staticmethod
     def calculate_n2o_emissions(vehicle_type, fuel_type, usage, vehicle_year):
         """ Calculate CH4 emissions for a mobile source vehicle. usage is either fuel_usage or miles_traveled depending
         on if the vehicle_type is non-road or on road, respectively. """
-        ret = mobile_combustion_ch4_and_n2o_emission_factors[vehicle_type][fuel_type][vehicle_year]['n2o_factor'] * \
-              usage
+        year_tables = mobile_combustion_ch4_and_n2o_emission_factors.dense_year_tables
+        _, n2o_factor, _ = year_tables.lookup(vehicle_type, fuel_type, vehicle_year)
+        ret = n2o_factor * usage
         return ret
 
     def make_total_co2_equivalent_emissions(self):
@@ -243,9 +494,64 @@ class MobileSources(Formula):
 
     def make_total_biomass_co2_equivalent_emissions(self):
         """ Calculate total biomass CO2 equivalent emissions """
-        total = (self.total_fuel_usage_and_co2_emissions['ethanol']['fuelUsage'] * self.ethanol_percent / 100. *
+        # Fuel types left out by sparse_output have no fuel usage
+        fuel_usage = {fuel_type: totals['fuelUsage']
+                      for fuel_type, totals in self.total_fuel_usage_and_co2_emissions.items()}
+        total = (fuel_usage.get('ethanol', 0) * self.ethanol_percent / 100. *
                  mobile_combustion_co2_emission_factors['ethanol'] +
-                 self.total_fuel_usage_and_co2_emissions['biodiesel']['fuelUsage'] * self.biodiesel_percent / 100. *
+                 fuel_usage.get('biodiesel', 0) * self.biodiesel_percent / 100. *
                  mobile_combustion_co2_emission_factors['biodiesel']) / 1000.
 
         self._output['totalBiomassCO2EquivalentEmissions'] = total
+
+
+def _dense_rows(rows, key, values, zero_row) -> list:
+    """ rows in the order of values, with zero_row(value) for each of values that no row has under key """
+    by_value = {row[key]: row for row in rows}
+    return [by_value.get(value) or zero_row(value) for value in values]
+
+
+def _encode_categories(vehicle_types, fuel_types, lookup):
+    """ Map the vehicleType and fuelType columns to integer codes in one pass """
+    np = require_numpy('MobileSources.recalc_columns')
+    if isinstance(vehicle_types, np.ndarray):
+        vehicle_types = vehicle_types.tolist()
+    if isinstance(fuel_types, np.ndarray):
+        fuel_types = fuel_types.tolist()
+    category_codes = lookup['category_codes']
+    encoded = np.fromiter(map(category_codes.get, zip(vehicle_types, fuel_types), [-1] * len(fuel_types)),
+                          dtype=np.intp, count=len(fuel_types))
+    if (encoded < 0).any():
+        unknown = sorted({f'{vehicle_type}/{fuel_type}' for vehicle_type, fuel_type in zip(vehicle_types, fuel_types)
+                          if (vehicle_type, fuel_type) not in category_codes})
+        raise ValueError(f'Unknown vehicleType/fuelType: {", ".join(unknown)}')
+    vehicle_codes, fuel_codes = np.divmod(encoded, len(lookup['fuel_types']) + 1)
+    return vehicle_codes - 1, fuel_codes - 1
+
+
+def _vehicle_years(vehicle_years, rows, year_dependent):
+    """ Type the vehicleYear column for the selected rows as integers, with a mask of the rows whose year is valid.
+    Years are valid as for YearHandler: whole numbers, or strings of digits. Rows whose factors do not depend on year
+    are given year 0 and are always valid, as YearHandler ignores the year for them. """
+    np = require_numpy('MobileSources.recalc_columns')
+    if isinstance(vehicle_years, np.ndarray) and vehicle_years.dtype.kind in 'iuf':
+        years = vehicle_years.astype(float)
+    else:
+        if isinstance(vehicle_years, np.ndarray):
+            vehicle_years = vehicle_years.tolist()
+        if {int, float}.issuperset(map(type, vehicle_years)):
+            years = np.asarray(vehicle_years, dtype=float)
+        else:
+            years = np.fromiter(map(_float_year, vehicle_years), dtype=float, count=len(vehicle_years))
+    years = np.where(year_dependent, years[rows], 0.)
+    valid = ~np.isnan(years) & (years == np.floor(years))
+    return np.where(valid, years, 0.).astype(np.int64), valid
+
+
+def _float_year(year) -> float:
+    """ A vehicleYear as a float, or NaN if YearHandler does not accept it """
+    try:
+        # pylint: disable=protected-access
+        return float(MobileCombustionCh4AndN2oEmissionFactors.YearHandler._int_year(year))
+    except YearValueException:
+        return float('nan')
@@ -11,12 +11,18 @@ logger = logging.getLogger(__name__)
 class ProductTransport(Formula):
     """ Calculate emissions from vehicles used for product transport """
 
+    wks_type = 'product-transport'
+    row_tables = ('productTransportByVehicleMiles', 'productTransportByTonMiles')
+    stages = ('make_product_transport_by_vehicle_miles', 'make_total_by_vehicle_miles',
+              'make_product_transport_by_short_ton_miles', 'make_total_by_ton_miles',
+              'make_total_emissions_by_product_transport_type', 'make_co2_equivalent_emissions')
+
     vehicle_types_miles = ['mediumAndHeavyDutyTruck', 'lightDutyTruck', 'passengerCars']
     vehicle_types_short_ton = ['mediumAndHeavyDutyTruck', 'rail', 'aircraft', 'waterborneCraft']
     vehicle_types_all = set(vehicle_types_miles + vehicle_types_short_ton)
 
-    def __init__(self, wks_data=None):
-        super().__init__(wks_data=wks_data)
+    def __init__(self, wks_data=None, factor_set=None):
+        super().__init__(wks_data=wks_data, factor_set=factor_set)
         self._total_emissions_by_vehicle_type_miles = {}
         self._total_emissions_by_miles = {}
         self._total_emissions_by_vehicle_type_short_ton = {}
@@ -34,11 +40,11 @@ class ProductTransport(Formula):
         self.make_total_emissions_by_product_transport_type()
         self.make_co2_equivalent_emissions()
 
-        return self.to_dict()
+        return self.checked_output()
 
     def make_product_transport_by_vehicle_miles(self):
         """Calculate emissions (CO2, CH4, N2O) for each input row"""
-        product_transport_by_vehicle_miles = []
+        product_transport_by_vehicle_miles = self.output_rows()
         self._total_emissions_by_vehicle_type_miles = {vehicle_type: {'CO2': 0., 'CH4': 0., 'N2O': 0.}
                                                        for vehicle_type in self.vehicle_types_miles}
         self._total_emissions_by_miles = {'CO2': 0., 'CH4': 0., 'N2O': 0.}
@@ -81,7 +87,7 @@ class ProductTransport(Formula):
 
     def make_product_transport_by_short_ton_miles(self):
         """Calculate emissions (CO2, CH4, N2O) for each input row"""
-        product_transport_by_short_ton_miles = []
+        product_transport_by_short_ton_miles = self.output_rows()
         self._total_emissions_by_vehicle_type_short_ton = {vehicle_type: {'CO2': 0., 'CH4': 0., 'N2O': 0.}
                                                            for vehicle_type in self.vehicle_types_short_ton}
         self._total_emissions_by_short_ton = {'CO2': 0., 'CH4': 0., 'N2O': 0.}
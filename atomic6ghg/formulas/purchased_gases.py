@@ -11,8 +11,12 @@ logger = logging.getLogger(__name__)
 class PurchasedGases(Formula):
     """ Calculate emissions from purchased gases """
 
-    def __init__(self, wks_data=None):
-        super().__init__(wks_data=wks_data)
+    wks_type = 'purchased-gases'
+    row_tables = ('purchasedGases',)
+    stages = ('make_purchased_gases', 'make_co2_equivalent_emissions')
+
+    def __init__(self, wks_data=None, factor_set=None):
+        super().__init__(wks_data=wks_data, factor_set=factor_set)
         self.recalc(self.wks_data)
 
     def recalc(self, wks_data: dict) -> dict:
@@ -22,11 +26,11 @@ class PurchasedGases(Formula):
         self.make_purchased_gases()
         self.make_co2_equivalent_emissions()
 
-        return self.to_dict()
+        return self.checked_output()
 
     def make_purchased_gases(self):
         """Calculate CO2 equivalent emissions for each input row"""
-        purchased_gases = []
+        purchased_gases = self.output_rows()
         self._total_emissions['purchasedGases'] = 0.
         for row in self.wks_data.get('purchasedGases', []):
             gas = row['gas']
@@ -10,8 +10,12 @@ logger = logging.getLogger(__name__)
 class PurchasedOffsets(Formula):
     """ Calculate emissions savings from purchased offsets """
 
-    def __init__(self, wks_data=None):
-        super().__init__(wks_data=wks_data)
+    wks_type = 'purchased-offsets'
+    row_tables = ('purchasedOffsets',)
+    stages = ('make_purchased_offsets', 'make_co2_equivalent_emissions')
+
+    def __init__(self, wks_data=None, factor_set=None):
+        super().__init__(wks_data=wks_data, factor_set=factor_set)
         self.recalc(self.wks_data)
 
     def recalc(self, wks_data: dict) -> dict:
@@ -21,7 +25,7 @@ class PurchasedOffsets(Formula):
         self.make_purchased_offsets()
         self.make_co2_equivalent_emissions()
 
-        return self.to_dict()
+        return self.checked_output()
 
     def make_purchased_offsets(self):
         """Tabulate project level offsets across all projects into the value purchasedOffsets"""
@@ -12,8 +12,13 @@ logger = logging.getLogger(__name__)
 class RefrigerationAndAc(Formula):
     """ Calculate emissions from refrigeration and air conditioning equipment """
 
-    def __init__(self, wks_data=None):
-        super().__init__(wks_data=wks_data)
+    wks_type = 'refrigeration-and-ac'
+    row_tables = ('materialBalance', 'simplifiedMaterialBalance', 'screeningMethod')
+    stages = ('make_material_balance', 'make_simplified_material_balance', 'make_screening_method',
+              'make_co2_equivalent_emissions')
+
+    def __init__(self, wks_data=None, factor_set=None):
+        super().__init__(wks_data=wks_data, factor_set=factor_set)
         self.recalc(self.wks_data)
 
     def recalc(self, wks_data: dict) -> dict:
@@ -25,11 +30,11 @@ class RefrigerationAndAc(Formula):
         self.make_screening_method()
         self.make_co2_equivalent_emissions()
 
-        return self.to_dict()
+        return self.checked_output()
 
     def make_material_balance(self):
         """Calculate CO2 equivalent emissions for each input row"""
-        material_balance = []
+        material_balance = self.output_rows()
         self._total_emissions['materialBalance'] = 0.
         for row in self.wks_data.get('materialBalance', []):
             gas = row['gas']
@@ -57,7 +62,7 @@ class RefrigerationAndAc(Formula):
 
     def make_simplified_material_balance(self):
         """Calculate CO2 equivalent emissions for each input row"""
-        simplified_material_balance = []
+        simplified_material_balance = self.output_rows()
         self._total_emissions['simplifiedMaterialBalance'] = 0.
         for row in self.wks_data.get('simplifiedMaterialBalance', []):
             gas = row['gas']
@@ -90,7 +95,7 @@ class RefrigerationAndAc(Formula):
 
     def make_screening_method(self):
         """Calculate CO2 equivalent emissions for each input row"""
-        screening_method = []
+        screening_method = self.output_rows()
         self._total_emissions['screeningMethod'] = 0.
         for row in self.wks_data.get('screeningMethod', []):
             gas = row['gas']
@@ -11,6 +11,12 @@ logger = logging.getLogger(__name__)
 class StationaryCombustion(Formula):
     """ Stationary combustion includes fuels that are burned at stationary facilities. """
 
+    wks_type = 'stationary-combustion'
+    row_tables = ('stationarySourceFuelConsumption',)
+    stages = ('make_total_combustion', 'make_emissions', 'make_co2_equivalent_emissions',
+              'make_biomass_co2_equivalent_emissions')
+    cache_parameters = Formula.cache_parameters + ('echo_input_rows',)
+
     fossil_fuels = ['anthraciteCoal', 'bituminousCoal', 'subBituminousCoal', 'ligniteCoal', 'naturalGas',
                     'distillateFuelOilNo2', 'residualFuelOilNo6', 'kerosene', 'liquefiedPetroleumGases']
     non_fossil_fuels = ['woodAndWoodResiduals', 'landfillGas']
@@ -22,8 +28,12 @@ class StationaryCombustion(Formula):
                     'residualFuelOilNo6': 'gallons', 'subBituminousCoal': 'shortTon',
                     'woodAndWoodResiduals': 'shortTon'}
 
-    def __init__(self, wks_data=None):
-        super().__init__(wks_data=wks_data)
+    def __init__(self, wks_data=None, echo_input_rows=True, factor_set=None):
+        super().__init__(wks_data=wks_data, factor_set=factor_set)
+        # stationarySourceFuelConsumption may be any iterable of rows, e.g. a generator over metered readings. With
+        # echo_input_rows False the rows are aggregated in one pass in constant memory and are not echoed to _output.
+        self.echo_input_rows = echo_input_rows
+        self._input_rows = []
         self.recalc(self.wks_data)
 
     def recalc(self, wks_data: dict) -> dict:
@@ -36,30 +46,48 @@ class StationaryCombustion(Formula):
         self.make_biomass_co2_equivalent_emissions()
 
         # Add user data to _output
-        self._output['stationarySourceFuelConsumption'] = self.wks_data.get('stationarySourceFuelConsumption', [])
+        self._output['stationarySourceFuelConsumption'] = self._input_rows
 
-        return self.to_dict()
+        return self.checked_output()
 
     def make_total_combustion(self):
         """Calculate total combustion for all input rows"""
-        total_combustion = {fuel: 0. for fuel in self.all_fuels}
-        for row in self.wks_data.get('stationarySourceFuelConsumption', []):
+        # With sparse_output only the fuels of the input rows get an accumulator
+        total_combustion = {} if self.sparse_output else {fuel: 0. for fuel in self.all_fuels}
+        rows = self.wks_data.get('stationarySourceFuelConsumption', [])
+        if not self.echo_input_rows:
+            self._input_rows = []
+        elif isinstance(rows, list):
+            self._input_rows = rows
+        else:
+            # Rows from an iterator are kept as they are read, so that they can be echoed
+            self._input_rows = []
+            rows = echo_rows(rows, self._input_rows)
+
+        heat_contents = {}
+        for row in rows:
             fuel = row['fuelCombusted']
             quantity_combusted = row['quantityCombusted']
             units = row['units']
             if not fuel or not quantity_combusted or not units:
                 continue
-            total_combustion[fuel] += heat_content_factors[fuel][units] * quantity_combusted
+            heat_content = heat_contents.get((fuel, units))
+            if heat_content is None:
+                heat_content = heat_contents[(fuel, units)] = heat_content_factors[fuel][units]
+            if fuel not in total_combustion and fuel in self.common_units:
+                total_combustion[fuel] = 0.
+            total_combustion[fuel] += heat_content * quantity_combusted
 
-        # Flattening the dictionary
-        total_combustion = [{'fuelType': fuel, 'quantityCombusted': quantity_combusted,
-                             'units': self.common_units[fuel]} for fuel, quantity_combusted in total_combustion.items()]
+        # Flattening the dictionary, in the order of all_fuels
+        total_combustion = [{'fuelType': fuel, 'quantityCombusted': total_combustion[fuel],
+                             'units': self.common_units[fuel]} for fuel in self.all_fuels if fuel in total_combustion]
 
         self._output['totalStationarySourceCombustion'] = total_combustion
 
     def make_emissions(self):
         """Calculate emissions for all fuels burned"""
-        emissions = {fuel: {'CO2': 0., 'CH4': 0., 'N2O': 0.} for fuel in self.all_fuels}
+        emissions = {row['fuelType']: {'CO2': 0., 'CH4': 0., 'N2O': 0.}
+                     for row in self._output['totalStationarySourceCombustion']}
         emissions['totalFossilFuelEmissions'] = {'CO2': 0., 'CH4': 0., 'N2O': 0.}
         emissions['totalNonFossilFuelEmissions'] = {'CO2': 0., 'CH4': 0., 'N2O': 0.}
 
@@ -94,6 +122,20 @@ class StationaryCombustion(Formula):
         emissions = [{'fuelType': fuel, **emissions[fuel]} for fuel in emissions]
         self._output['totalGhgEmissionsFromStationarySourceFuelCombustion'] = emissions
 
+    def expand_sparse_output(self, output: dict) -> dict:
+        """ Copy of a sparse output with a zero row for every fuel of all_fuels that is not in it """
+        combustion = {row['fuelType']: row for row in output['totalStationarySourceCombustion']}
+        emissions = {row['fuelType']: row for row in output['totalGhgEmissionsFromStationarySourceFuelCombustion']}
+        total_keys = ['totalFossilFuelEmissions', 'totalNonFossilFuelEmissions', 'totalEmissionsForAllFuels']
+        return {
+            **output,
+            'totalStationarySourceCombustion': [
+                combustion.get(fuel) or {'fuelType': fuel, 'quantityCombusted': 0., 'units': self.common_units[fuel]}
+                for fuel in self.all_fuels],
+            'totalGhgEmissionsFromStationarySourceFuelCombustion': [
+                emissions.get(fuel) or {'fuelType': fuel, 'CO2': 0., 'CH4': 0., 'N2O': 0.}
+                for fuel in self.all_fuels + total_keys]}
+
     @staticmethod
     def calculate_co2_emissions(fuel, total_fuel_combustion):
         """Calculate CO2 emissions for a fuel"""
@@ -128,3 +170,10 @@ class StationaryCombustion(Formula):
         total = self._total_emissions['totalNonFossilFuelEmissions']['CO2'] / 1000.
 
         self._output['totalBiomassEquivalentEmissions'] = total
+
+
+def echo_rows(rows, echoed):
+    """ Yield rows, appending each to echoed """
+    for row in rows:
+        echoed.append(row)
+        yield row
@@ -4,6 +4,7 @@ import logging
 
 from atomic6ghg.formulas import Formula
 from atomic6ghg.factors import stationary_combustion_emission_factors, refrigerants_gwp_factors
+from atomic6ghg.optional import require_numpy
 
 logger = logging.getLogger(__name__)
 
@@ -11,13 +12,31 @@ logger = logging.getLogger(__name__)
 class Steam(Formula):
     """ Calculate emissions from purchased gases """
 
+    wks_type = 'steam'
+    row_tables = ('emissionFactorDataForSteamPurchased',)
+    stages = ('make_emission_factor_data_for_steam_purchased', 'tabulate_emission_columns',
+              'make_emissions_by_source_and_fuel_type', 'make_co2_equivalent_emissions_location_based',
+              'make_co2_equivalent_emissions_market_based')
+
     fuel_types = ['anthraciteCoal', 'bituminousCoal', 'coalCoke', 'distillateFuelOilNo2', 'kerosene', 'landfillGas',
                   'ligniteCoal', 'liquefiedPetroleumGases', 'mixedElectricPowerSector', 'naturalGas',
                   'residualFuelOilNo6', 'subBituminousCoal', 'woodAndWoodResiduals']
     default_boiler_efficiency_frac = 0.8
 
-    def __init__(self, wks_data=None):
-        super().__init__(wks_data=wks_data)
+    # Input factors and output emissions of each row, in (co2, ch4, n2o) order
+    location_based_factor_keys = ('locationBasedEmissionFactorsCO2Factor', 'locationBasedEmissionFactorsCH4Factor',
+                                  'locationBasedEmissionFactorsN2OFactor')
+    market_based_factor_keys = ('marketBasedEmissionFactorsCO2Factor', 'marketBasedEmissionFactorsCH4Factor',
+                                'marketBasedEmissionFactorsN2OFactor')
+    emission_keys = ('locationBasedEmissionsCO2Emissions', 'locationBasedEmissionsCH4Emissions',
+                     'locationBasedEmissionsN2OEmissions', 'marketBasedEmissionsCO2Emissions',
+                     'marketBasedEmissionsCH4Emissions', 'marketBasedEmissionsN2OEmissions')
+    # Keys of the same emissions in the totals by fuel type
+    total_keys = ('locationBasedCO2Emissions', 'locationBasedCH4Emissions', 'locationBasedN2OEmissions',
+                  'marketBasedCO2Emissions', 'marketBasedCH4Emissions', 'marketBasedN2OEmissions')
+
+    def __init__(self, wks_data=None, factor_set=None):
+        super().__init__(wks_data=wks_data, factor_set=factor_set)
         self._total_emissions_by_fuel_type = {}
         self.recalc(self.wks_data)
 
@@ -30,19 +49,33 @@ class Steam(Formula):
         self.make_co2_equivalent_emissions_location_based()
         self.make_co2_equivalent_emissions_market_based()
 
-        return self.to_dict()
+        return self.checked_output()
+
+    def recalc_columns(self, wks_columns: dict) -> dict:
+        """ Execute recalc procedure for Steam over column arrays instead of row dicts (requires numpy).
+
+        wks_columns has the same shape as wks_data, except that emissionFactorDataForSteamPurchased is a dict of equal
+        length arrays keyed by fuelType, steamPurchased and, optionally, boilerEfficiency and the location-based and
+        market-based factor columns. emissionFactorDataForSteamPurchased in _output holds the input columns plus the six
+        emission columns; rows with no fuelType or steamPurchased have zero emissions and are left out of the totals.
+        """
+        require_numpy('Steam.recalc_columns')
+        self.wks_data = wks_columns
+
+        columns = self.wks_data.get('emissionFactorDataForSteamPurchased', {})
+        self._output['emissionFactorDataForSteamPurchased'] = {**columns, **self.tabulate_emission_columns(columns)}
+        self.make_emissions_by_source_and_fuel_type()
+        self.make_co2_equivalent_emissions_location_based()
+        self.make_co2_equivalent_emissions_market_based()
+
+        return self.checked_output()
 
-    # pylint: disable=too-many-locals
     def make_emission_factor_data_for_steam_purchased(self):
         """Calculate emissions for each user input fuel source (each row)"""
-        self._total_emissions_by_fuel_type = {fuel_type: {'locationBasedCO2Emissions': 0.,
-                                                          'locationBasedCH4Emissions': 0.,
-                                                          'locationBasedN2OEmissions': 0.,
-                                                          'marketBasedCO2Emissions': 0.,
-                                                          'marketBasedCH4Emissions': 0.,
-                                                          'marketBasedN2OEmissions': 0.}
+        factor_vectors = stationary_combustion_emission_factors.mmbtu_factor_vectors
+        self._total_emissions_by_fuel_type = {fuel_type: dict.fromkeys(self.total_keys, 0.)
                                               for fuel_type in self.fuel_types}
-        emission_factor_data_for_steam_purchased = []
+        emission_factor_data_for_steam_purchased = self.output_rows()
 
         for row in self.wks_data.get('emissionFactorDataForSteamPurchased', []):
             fuel_type = row['fuelType']
@@ -56,72 +89,83 @@ class Steam(Formula):
             else:
                 boiler_efficiency_frac = self.default_boiler_efficiency_frac
 
-            location_based_emission_factors_co2 = row['locationBasedEmissionFactorsCO2Factor']
-            location_based_emission_factors_ch4 = row['locationBasedEmissionFactorsCH4Factor']
-            location_based_emission_factors_n2o = row['locationBasedEmissionFactorsN2OFactor']
-            market_based_emission_factors_co2 = row['marketBasedEmissionFactorsCO2Factor']
-            market_based_emission_factors_ch4 = row['marketBasedEmissionFactorsCH4Factor']
-            market_based_emission_factors_n2o = row['marketBasedEmissionFactorsN2OFactor']
-
-            location_based_emissions_co2_emissions = \
-                Steam.calculate_location_based_emissions_steam(steam_purchased, fuel_type,
-                    location_based_emission_factors_co2, boiler_efficiency_frac, 'co2')
-
-            location_based_emissions_ch4_emissions = \
-                Steam.calculate_location_based_emissions_steam(steam_purchased, fuel_type,
-                    location_based_emission_factors_ch4, boiler_efficiency_frac, 'ch4')
-
-            location_based_emissions_n2o_emissions = \
-                Steam.calculate_location_based_emissions_steam(steam_purchased, fuel_type,
-                    location_based_emission_factors_n2o, boiler_efficiency_frac, 'n2o')
-
-            market_based_emissions_co2_emissions = \
-                Steam.calculate_market_based_emissions_steam(steam_purchased, fuel_type,
-                    location_based_emission_factors_co2, market_based_emission_factors_co2, boiler_efficiency_frac,
-                    'co2')
-
-            market_based_emissions_ch4_emissions = \
-                Steam.calculate_market_based_emissions_steam(steam_purchased, fuel_type,
-                    location_based_emission_factors_ch4, market_based_emission_factors_ch4, boiler_efficiency_frac,
-                    'ch4')
-
-            market_based_emissions_n2o_emissions = \
-                Steam.calculate_market_based_emissions_steam(steam_purchased, fuel_type,
-                    location_based_emission_factors_n2o, market_based_emission_factors_n2o, boiler_efficiency_frac,
-                    'n2o')
-
-            self._total_emissions_by_fuel_type[fuel_type]['locationBasedCO2Emissions'] += \
-                location_based_emissions_co2_emissions
-            self._total_emissions_by_fuel_type[fuel_type]['locationBasedCH4Emissions'] += \
-                location_based_emissions_ch4_emissions
-            self._total_emissions_by_fuel_type[fuel_type]['locationBasedN2OEmissions'] += \
-                location_based_emissions_n2o_emissions
-            self._total_emissions_by_fuel_type[fuel_type]['marketBasedCO2Emissions'] += \
-                market_based_emissions_co2_emissions
-            self._total_emissions_by_fuel_type[fuel_type]['marketBasedCH4Emissions'] += \
-                market_based_emissions_ch4_emissions
-            self._total_emissions_by_fuel_type[fuel_type]['marketBasedN2OEmissions'] += \
-                market_based_emissions_n2o_emissions
+            location_based_factors = [row[key] for key in self.location_based_factor_keys]
+            market_based_factors = [row[key] for key in self.market_based_factor_keys]
+            row_emissions = Steam.calculate_row_emissions(steam_purchased, location_based_factors,
+                                                          market_based_factors, factor_vectors.get(fuel_type),
+                                                          boiler_efficiency_frac)
+
+            fuel_type_totals = self._total_emissions_by_fuel_type[fuel_type]
+            for key, value in zip(self.total_keys, row_emissions):
+                fuel_type_totals[key] += value
 
             calculated_row = {'sourceId': row['sourceId'], 'sourceDescription': row['sourceDescription'],
                               'sourceArea': row['sourceArea'], 'fuelType': fuel_type,
-                              'boilerEfficiency': boiler_efficiency, 'steamPurchased': steam_purchased,
-                              'locationBasedEmissionFactorsCO2Factor': location_based_emission_factors_co2,
-                              'locationBasedEmissionFactorsCH4Factor': location_based_emission_factors_ch4,
-                              'locationBasedEmissionFactorsN2OFactor': location_based_emission_factors_n2o,
-                              'locationBasedEmissionsCO2Emissions': location_based_emissions_co2_emissions,
-                              'locationBasedEmissionsCH4Emissions': location_based_emissions_ch4_emissions,
-                              'locationBasedEmissionsN2OEmissions': location_based_emissions_n2o_emissions,
-                              'marketBasedEmissionFactorsCO2Factor': market_based_emission_factors_co2,
-                              'marketBasedEmissionFactorsCH4Factor': market_based_emission_factors_ch4,
-                              'marketBasedEmissionFactorsN2OFactor': market_based_emission_factors_n2o,
-                              'marketBasedEmissionsCO2Emissions': market_based_emissions_co2_emissions,
-                              'marketBasedEmissionsCH4Emissions': market_based_emissions_ch4_emissions,
-                              'marketBasedEmissionsN2OEmissions': market_based_emissions_n2o_emissions}
+                              'boilerEfficiency': boiler_efficiency, 'steamPurchased': steam_purchased}
+            calculated_row.update(zip(self.location_based_factor_keys, location_based_factors))
+            calculated_row.update(zip(self.emission_keys[:3], row_emissions[:3]))
+            calculated_row.update(zip(self.market_based_factor_keys, market_based_factors))
+            calculated_row.update(zip(self.emission_keys[3:], row_emissions[3:]))
             emission_factor_data_for_steam_purchased.append(calculated_row)
 
         self._output['emissionFactorDataForSteamPurchased'] = emission_factor_data_for_steam_purchased
 
+    def tabulate_emission_columns(self, columns):
+        """ Vectorized counterpart of make_emission_factor_data_for_steam_purchased. Default factors are gathered for
+        every row from StationaryCombustionEmissionFactors.mmbtu_factor_array and the six emission columns are summed
+        by fuel type with np.bincount. Sets the totals by fuel type and returns the emission columns as arrays. """
+        np = require_numpy('Steam.recalc_columns')
+        codes = _encode_fuel_types(columns.get('fuelType', []))
+        n_rows = len(codes)
+
+        def float_column(key):
+            # Missing columns and null values read as 0, which selects the default as for falsy row values
+            return np.nan_to_num(np.asarray(columns.get(key, [None] * n_rows), dtype=float))
+
+        steam_purchased = float_column('steamPurchased')
+        included = (codes >= 0) & (steam_purchased != 0.)
+        steam_purchased = np.where(included, steam_purchased, 0.)
+        boiler_efficiency = float_column('boilerEfficiency')
+        boiler_efficiency_frac = np.where(boiler_efficiency != 0., boiler_efficiency / 100.,
+                                          self.default_boiler_efficiency_frac)
+        default_factors = stationary_combustion_emission_factors.mmbtu_factor_array[np.where(included, codes, 0)]
+
+        location_based, market_based = [], []
+        for gas, (location_key, market_key) in enumerate(zip(self.location_based_factor_keys,
+                                                             self.market_based_factor_keys)):
+            location_factors = float_column(location_key)
+            location_factors = np.where(location_factors != 0., location_factors, default_factors[:, gas])
+            location = np.maximum(0., steam_purchased * location_factors / boiler_efficiency_frac)
+            market_factors = float_column(market_key)
+            market = np.where(market_factors != 0.,
+                              np.maximum(0., steam_purchased * market_factors / boiler_efficiency_frac), location)
+            location_based.append(np.where(included, location, 0.))
+            market_based.append(np.where(included, market, 0.))
+
+        row_emissions = location_based + market_based
+        fuel_type_codes = stationary_combustion_emission_factors.fuel_type_codes
+        fuel_type_totals = [np.bincount(codes[included], weights=column[included], minlength=len(fuel_type_codes))
+                            for column in row_emissions]
+        self._total_emissions_by_fuel_type = {
+            fuel_type: {key: float(totals[fuel_type_codes[fuel_type]]) if fuel_type in fuel_type_codes else 0.
+                        for key, totals in zip(self.total_keys, fuel_type_totals)}
+            for fuel_type in self.fuel_types}
+        return dict(zip(self.emission_keys, row_emissions))
+
+    @staticmethod
+    # pylint: disable=too-many-arguments
+    def calculate_row_emissions(purchased_amount, location_based_factors, market_based_factors, default_factors,
+                                boiler_efficiency_frac):
+        """ Calculate location-based then market-based CO2, CH4 and N2O emissions of one row in one pass, given
+        (co2, ch4, n2o) location-based and market-based factors and the default factor vector of the row's fuel type.
+        Gives the same values as calculate_location_based_emissions_steam and calculate_market_based_emissions_steam.
+        """
+        location_based = [max(0., purchased_amount * (factor or default) / boiler_efficiency_frac)
+                          for factor, default in zip(location_based_factors, default_factors)]
+        market_based = [max(0., purchased_amount * market_factor / boiler_efficiency_frac) if market_factor
+                        else location for market_factor, location in zip(market_based_factors, location_based)]
+        return location_based + market_based
+
     @staticmethod
     # pylint: disable=too-many-arguments
     def calculate_market_based_emissions_steam(purchased_amount, fuel_type, location_based_factor, market_based_factor,
@@ -190,3 +234,17 @@ class Steam(Formula):
                  (market_based_emissions_n2o_emissions * refrigerants_gwp_factors['n2o'] / 1000)) / 1000
 
         self._output['CO2EquivalentEmissionsMarketBasedElectricityEmissions'] = total
+
+
+def _encode_fuel_types(fuel_types):
+    """ Map the fuelType column to mmbtu_factor_array rows in one pass; empty fuel types map to -1 """
+    np = require_numpy('Steam.recalc_columns')
+    if isinstance(fuel_types, np.ndarray):
+        fuel_types = fuel_types.tolist()
+    fuel_type_codes = {**stationary_combustion_emission_factors.fuel_type_codes, None: -1, '': -1}
+    encoded = np.fromiter(map(fuel_type_codes.get, fuel_types, [-2] * len(fuel_types)), dtype=np.intp,
+                          count=len(fuel_types))
+    if (encoded < -1).any():
+        unknown = sorted({str(fuel_type) for fuel_type in fuel_types if fuel_type not in fuel_type_codes})
+        raise ValueError(f'Unknown fuelType: {", ".join(unknown)}')
+    return encoded
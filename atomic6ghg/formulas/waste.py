@@ -11,11 +11,15 @@ logger = logging.getLogger(__name__)
 class Waste(Formula):
     """ Calculate emissions from waste materials """
 
+    wks_type = 'waste'
+    row_tables = ('wasteDisposal',)
+    stages = ('make_waste_disposal', 'make_total_emissions_by_disposal_method', 'make_co2_equivalent_emissions')
+
     disposal_methods = ["recycled", "landfilled", "combusted", "composted", "anaerobicallyDigestedDry",
                        "anaerobicallyDigestedWet"]
 
-    def __init__(self, wks_data=None):
-        super().__init__(wks_data=wks_data)
+    def __init__(self, wks_data=None, factor_set=None):
+        super().__init__(wks_data=wks_data, factor_set=factor_set)
         self.recalc(self.wks_data)
 
     def recalc(self, wks_data: dict) -> dict:
@@ -26,11 +30,11 @@ class Waste(Formula):
         self.make_total_emissions_by_disposal_method()
         self.make_co2_equivalent_emissions()
 
-        return self.to_dict()
+        return self.checked_output()
 
     def make_waste_disposal(self):
         """Calculate CO2 equivalent emissions for each input row"""
-        waste_disposal = []
+        waste_disposal = self.output_rows()
         self._total_emissions = {disposal_method: 0. for disposal_method in self.disposal_methods}
         for row in self.wks_data.get('wasteDisposal', []):
             waste_material = row['wasteMaterial']
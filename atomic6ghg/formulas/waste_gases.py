@@ -11,11 +11,15 @@ logger = logging.getLogger(__name__)
 class WasteGases(Formula):
     """ Calculate emission from combustion of waste gases """
 
+    wks_type = 'waste-gases'
+    row_tables = ('emissionFactorForGasWasteStream',)
+    stages = ('make_emission_factor_for_gas_waste_stream', 'make_total_all_components', 'make_co2_equivalent_emissions')
+
     default_gas_total_number_of_moles_per_unit_volume = 0.00255
     default_oxidation_factor = 100.
 
-    def __init__(self, wks_data=None):
-        super().__init__(wks_data=wks_data)
+    def __init__(self, wks_data=None, factor_set=None):
+        super().__init__(wks_data=wks_data, factor_set=factor_set)
         self.gas_total_number_of_moles_per_unit_volume = None
         self.oxidation_factor = None
         self.recalc(self.wks_data)
@@ -38,11 +42,11 @@ class WasteGases(Formula):
         self._output["gasTotalNumberOfMolesPerUnitVolume"] = self.gas_total_number_of_moles_per_unit_volume
         self._output["oxidationFactor"] = self.oxidation_factor
 
-        return self.to_dict()
+        return self.checked_output()
 
     def make_emission_factor_for_gas_waste_stream(self):
         """ Calculate emission for each inputs in factor for gases waste stream table """
-        waste_gasses = []
+        waste_gasses = self.output_rows()
         self._total_emissions = {'totalCarbonContent': 0., 'totalMoles': 0., 'totalMolarFraction': 0.}
         gas_total_number_of_moles_per_unit_volume = self.gas_total_number_of_moles_per_unit_volume
         for row in self.wks_data.get('emissionFactorForGasWasteStream', []):
@@ -0,0 +1,114 @@
+""" Opt-in timing of the stages of formula recalcs.
+
+Every recalc* method of a Formula subclass and the stages named in its stages are wrapped by timed_stage. Per-row
+helpers are not wrapped, and outside of instrument the wrapper only checks a context variable, so instrumentation
+costs next to nothing when it is off. """
+import contextlib
+import contextvars
+import functools
+import time
+import tracemalloc
+
+_recorder = contextvars.ContextVar('atomic6ghg_stage_recorder', default=None)
+
+
+class StageRecorder:
+    """ Records the wall time, input row count and, optionally, allocations of every stage call of formulas of
+    formula_class. Each record is a dict with formula, stage, seconds and rows, plus allocatedBytes (net) and
+    peakBytes with allocations; it is passed to callback as it is made, e.g. to forward it to a metrics client, and
+    kept in records unless keep_records is False. """
+    def __init__(self, formula_class, callback=None, allocations=False, keep_records=True):
+        self.formula_class = formula_class
+        self.callback = callback
+        self.allocations = allocations
+        self.keep_records = keep_records
+        self.records = []
+
+        # Highest traced memory seen so far by each running stage, outermost first
+        self._open_peaks = []
+
+    def run_stage(self, formula, method, args, kwargs):
+        """ Call a stage method of formula and record it. Rows are counted after the call, once a recalc has taken
+        its wks_data. """
+        if self.allocations:
+            self._fold_peak()
+            tracemalloc.reset_peak()
+            allocated_before, _ = tracemalloc.get_traced_memory()
+            self._open_peaks.append(allocated_before)
+        start = time.perf_counter()
+        try:
+            return method(formula, *args, **kwargs)
+        finally:
+            record = {'formula': formula.__class__.__name__, 'stage': method.__name__,
+                      'seconds': time.perf_counter() - start, 'rows': row_count(formula)}
+            if self.allocations:
+                self._fold_peak()
+                peak = self._open_peaks.pop()
+                allocated_after, _ = tracemalloc.get_traced_memory()
+                record['allocatedBytes'] = allocated_after - allocated_before
+                record['peakBytes'] = peak - allocated_before
+            if self.keep_records:
+                self.records.append(record)
+            if self.callback is not None:
+                self.callback(record)
+
+    def _fold_peak(self):
+        """ Carry the traced peak into every stage still running, before an inner stage resets it """
+        _, peak = tracemalloc.get_traced_memory()
+        self._open_peaks = [max(open_peak, peak) for open_peak in self._open_peaks]
+
+    def to_dict(self) -> dict:
+        """ Records summed by formula and stage: {formula: {stage: {'calls': ..., 'seconds': ..., 'rows': ...}}},
+        plus allocatedBytes and the largest peakBytes with allocations """
+        summary = {}
+        for record in self.records:
+            stage = summary.setdefault(record['formula'], {}).setdefault(record['stage'], {'calls': 0, 'seconds': 0.,
+                                                                                          'rows': 0})
+            stage['calls'] += 1
+            stage['seconds'] += record['seconds']
+            stage['rows'] += record['rows'] or 0
+            if 'allocatedBytes' in record:
+                stage['allocatedBytes'] = stage.get('allocatedBytes', 0) + record['allocatedBytes']
+                stage['peakBytes'] = max(stage.get('peakBytes', 0), record['peakBytes'])
+        return summary
+
+
+@contextlib.contextmanager
+def instrument(formula_class=object, callback=None, allocations=False, keep_records=True):
+    """ Record the stages of formulas of formula_class run in this context, yielding the StageRecorder. With
+    allocations, tracemalloc is started for the duration unless it is already tracing. """
+    recorder = StageRecorder(formula_class, callback=callback, allocations=allocations, keep_records=keep_records)
+    start_tracing = allocations and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+        if start_tracing:
+            tracemalloc.stop()
+
+
+def timed_stage(method):
+    """ Wrap a stage method of a Formula subclass so that it is recorded while instrumented """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        recorder = _recorder.get()
+        if recorder is None or not isinstance(self, recorder.formula_class):
+            return method(self, *args, **kwargs)
+        return recorder.run_stage(self, method, args, kwargs)
+    return wrapper
+
+
+def row_count(formula):
+    """ Number of input rows in the row tables of a formula's wks_data, counting a dict of columns by its length and
+    skipping tables that are not sized, e.g. streamed rows """
+    rows = 0
+    for table in formula.row_tables:
+        value = formula.wks_data.get(table) if isinstance(formula.wks_data, dict) else None
+        if isinstance(value, dict):
+            value = next(iter(value.values()), ())
+        if hasattr(value, '__len__'):
+            rows += len(value)
+    return rows
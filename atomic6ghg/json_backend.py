@@ -0,0 +1,107 @@
+""" JSON encoding and decoding through the fastest installed backend: orjson, then ujson, then the stdlib json """
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def array_to_list(value):
+    """ JSON encoder fallback for array columns (e.g. numpy arrays) held in _output by columnar recalcs """
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f'Object of type {value.__class__.__name__} is not JSON serializable')
+
+
+class StdlibBackend:
+    """ The stdlib json module """
+    name = 'json'
+
+    @staticmethod
+    def loads(data):
+        """ Decode str or bytes """
+        return json.loads(data)
+
+    @staticmethod
+    def dumpb(obj, indent=None) -> bytes:
+        """ Encode obj to UTF-8 bytes, compact unless indent is given """
+        separators = (',', ':') if indent is None else None
+        return json.dumps(obj, indent=indent, separators=separators, default=array_to_list).encode()
+
+
+class OrjsonBackend:
+    """ orjson, which encodes straight to bytes and serializes numpy arrays natively. orjson can only indent by two
+    spaces, which is what Formula.to_json uses by default; other indents are encoded by the stdlib instead. """
+    name = 'orjson'
+
+    @staticmethod
+    def loads(data):
+        """ Decode str or bytes. Documents orjson rejects, such as the NaN literals in some factor tables, are
+        decoded by the stdlib instead. """
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return json.loads(data)
+
+    @staticmethod
+    def dumpb(obj, indent=None) -> bytes:
+        """ Encode obj to UTF-8 bytes, compact unless indent is given """
+        if indent not in (None, 2):
+            return StdlibBackend.dumpb(obj, indent=indent)
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent == 2:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=array_to_list, option=option)
+
+
+class UjsonBackend:
+    """ ujson """
+    name = 'ujson'
+
+    @staticmethod
+    def loads(data):
+        """ Decode str or bytes. Documents ujson rejects are decoded by the stdlib instead. """
+        try:
+            return ujson.loads(data)
+        except ValueError:
+            return json.loads(data)
+
+    @staticmethod
+    def dumpb(obj, indent=None) -> bytes:
+        """ Encode obj to UTF-8 bytes, compact unless indent is given """
+        return ujson.dumps(obj, indent=indent or 0, default=array_to_list, ensure_ascii=False).encode()
+
+
+BACKENDS = {'orjson': (OrjsonBackend, orjson), 'ujson': (UjsonBackend, ujson), 'json': (StdlibBackend, json)}
+
+backend = next(backend_class for backend_class, module in BACKENDS.values() if module is not None)
+
+
+def set_backend(name: str):
+    """ Select the backend by name ('orjson', 'ujson' or 'json'). Raises ImportError if it is not installed. """
+    global backend  # pylint: disable=global-statement
+    backend_class, module = BACKENDS[name]
+    if module is None:
+        raise ImportError(f'{name} is not installed')
+    backend = backend_class
+
+
+def loads(data):
+    """ Decode str or bytes with the selected backend """
+    return backend.loads(data)
+
+
+def dumpb(obj, indent=None) -> bytes:
+    """ Encode obj to UTF-8 bytes with the selected backend, compact unless indent is given """
+    return backend.dumpb(obj, indent=indent)
+
+
+def dumps(obj, indent=None) -> str:
+    """ Encode obj to str with the selected backend, compact unless indent is given """
+    return backend.dumpb(obj, indent=indent).decode()
@@ -0,0 +1,26 @@
+""" Deferred imports of optional dependencies """
+import importlib
+
+
+def require_numpy(feature: str):
+    """ Import numpy when a columnar code path first needs it, rather than on every import of atomic6ghg """
+    try:
+        return importlib.import_module('numpy')
+    except ImportError as e:
+        raise ImportError(f'numpy is required for {feature}') from e
+
+
+def require_jsonschema(feature: str):
+    """ Import jsonschema when worksheets are first validated """
+    try:
+        return importlib.import_module('jsonschema')
+    except ImportError as e:
+        raise ImportError(f'jsonschema is required for {feature}') from e
+
+
+def require_pyarrow(feature: str):
+    """ Import pyarrow when formula outputs are first exported as Arrow tables """
+    try:
+        return importlib.import_module('pyarrow')
+    except ImportError as e:
+        raise ImportError(f'pyarrow is required for {feature}') from e
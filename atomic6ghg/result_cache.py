@@ -0,0 +1,223 @@
+""" Opt-in cache of formula results, keyed by the contents of the worksheets.
+
+Set Formula.result_cache, or the attribute of one subclass, to a ResultCache and every recalc first looks up a hash
+of the formula class, the factor edition and the canonical JSON of wks_data. A hit restores _output without running
+any stage of the recalc:
+
+    Formula.result_cache = ResultCache(SqliteBackend('results.sqlite'), max_entries=10000)
+
+Entries are pickled, so backends shared between processes must be trusted like the code itself. """
+import collections
+import functools
+import hashlib
+import json
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+
+from atomic6ghg.factors.factor_set import DEFAULT_EDITION, active_factor_set, get_factor_set
+
+logger = logging.getLogger(__name__)
+
+# Bump when formulas change their results for the same worksheet and factors, so that stored entries are not reused
+CACHE_VERSION = 1
+
+
+class DictBackend:
+    """ In-process backend, an LRU ordered dict of at most max_entries entries """
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """ Entry stored under key, or None """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes):
+        """ Store an entry, evicting the least recently used ones beyond max_entries """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """ Drop every entry """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteBackend:
+    """ On-disk backend, a table of at most max_entries entries in the sqlite database at path, evicted by least
+    recent use. Several processes can share the database. Eviction is a scan of the table, so it runs once every
+    evict_every stores, which may take the table over max_entries by as many entries in between. """
+    def __init__(self, path, max_entries=100000, evict_every=64):
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self._stores = 0
+        self._connection = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS results '
+                                 '(key TEXT PRIMARY KEY, value BLOB NOT NULL, used REAL NOT NULL)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """ Entry stored under key, or None """
+        with self._lock:
+            row = self._connection.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._connection.execute('UPDATE results SET used = ? WHERE key = ?', (time.time(), key))
+            return row[0]
+
+    def set(self, key: str, value: bytes):
+        """ Store an entry, evicting the least recently used ones beyond max_entries """
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)', (key, value, time.time()))
+            self._stores += 1
+            if self._stores % self.evict_every == 0:
+                self._evict()
+
+    def _evict(self):
+        """ Delete the least recently used entries beyond max_entries """
+        self._connection.execute('DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used DESC '
+                                 'LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def clear(self):
+        """ Drop every entry """
+        with self._lock:
+            self._connection.execute('DELETE FROM results')
+
+    def close(self):
+        """ Close the database """
+        self._connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+
+class RedisBackend:
+    """ Backend on a Redis server, through a client with the redis-py API (get, set, delete, zadd, zcard, zrange,
+    zrem). Entries are stored under prefix + key and their last use in the sorted set prefix + 'lru', which evicts
+    the least recently used beyond max_entries. """
+    def __init__(self, client, max_entries=100000, prefix='atomic6ghg:result:'):
+        self.client = client
+        self.max_entries = max_entries
+        self.prefix = prefix
+
+    def get(self, key: str):
+        """ Entry stored under key, or None """
+        value = self.client.get(self.prefix + key)
+        if value is not None:
+            self.client.zadd(self.prefix + 'lru', {key: time.time()})
+        return value
+
+    def set(self, key: str, value: bytes):
+        """ Store an entry, evicting the least recently used ones beyond max_entries """
+        self.client.set(self.prefix + key, value)
+        self.client.zadd(self.prefix + 'lru', {key: time.time()})
+        excess = self.client.zcard(self.prefix + 'lru') - self.max_entries
+        if excess > 0:
+            self._delete(self.client.zrange(self.prefix + 'lru', 0, excess - 1))
+
+    def clear(self):
+        """ Drop every entry """
+        self._delete(self.client.zrange(self.prefix + 'lru', 0, -1))
+        self.client.delete(self.prefix + 'lru')
+
+    def _delete(self, keys):
+        """ Delete the entries of keys, as returned by zrange, and their last use """
+        keys = [key.decode() if isinstance(key, bytes) else key for key in keys]
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+            self.client.zrem(self.prefix + 'lru', *keys)
+
+    def __len__(self):
+        return self.client.zcard(self.prefix + 'lru')
+
+
+class ResultCache:
+    """ Results of recalcs in a backend (a DictBackend of max_entries by default), with counts of hits and misses.
+    Worksheets that are not JSON, e.g. streamed rows or column arrays, are not cached. """
+    def __init__(self, backend=None, max_entries=1024):
+        self.backend = backend if backend is not None else DictBackend(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, formula, wks_data):
+        """ Hash of the formula class and its cache_parameters, its factor edition and the canonical JSON of
+        wks_data, or None if wks_data is not JSON """
+        try:
+            canonical = json.dumps(wks_data, sort_keys=True, separators=(',', ':'))
+        except (TypeError, ValueError):
+            return None
+        factor_set = formula.factor_set or active_factor_set() or get_factor_set(DEFAULT_EDITION)
+        parameters = {name: getattr(formula, name) for name in formula.cache_parameters}
+        digest = hashlib.sha256(f'{CACHE_VERSION}|{formula.__class__.__module__}.{formula.__class__.__qualname__}|'
+                                f'{factor_set.version}|{json.dumps(parameters, sort_keys=True)}|'.encode())
+        digest.update(canonical.encode())
+        return digest.hexdigest()
+
+    def load(self, formula, key) -> bool:
+        """ Restore the _output and _total_emissions stored under key into formula. Returns whether there were
+        any. """
+        # pylint: disable=protected-access
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return False
+            self.hits += 1
+        formula._output, formula._total_emissions = pickle.loads(value)
+        return True
+
+    def store(self, formula, key):
+        """ Store the _output and _total_emissions of formula under key """
+        # pylint: disable=protected-access
+        try:
+            value = pickle.dumps((formula._output, formula._total_emissions), protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            logger.warning('Not caching the result of %s: %s', formula.__class__.__name__, e)
+            return
+        self.backend.set(key, value)
+
+    def stats(self) -> dict:
+        """ Counts of hits, misses and stored entries """
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.backend)}
+
+    def clear(self):
+        """ Drop every entry and reset the counts """
+        self.backend.clear()
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+def caches_result(method):
+    """ Wrap the recalc method of a Formula subclass so that it consults result_cache first, when one is set """
+    @functools.wraps(method)
+    def wrapper(self, wks_data, *args, **kwargs):
+        cache = self.result_cache
+        key = cache.key(self, wks_data) if cache is not None and not args and not kwargs else None
+        if key is None:
+            return method(self, wks_data, *args, **kwargs)
+        if cache.load(self, key):
+            self.wks_data = wks_data
+            self.invalidate_output_cache()
+            return self.checked_output()
+        ret = method(self, wks_data)
+        if ret is not None:
+            cache.store(self, key)
+        return ret
+    return wrapper
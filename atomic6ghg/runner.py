@@ -0,0 +1,138 @@
+""" Run organization inventories, one worksheet per formula type, and total their emissions by scope """
+import collections
+import functools
+import itertools
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from atomic6ghg import factors
+from atomic6ghg.formulas import StationaryCombustion, MobileSources, RefrigerationAndAc, FireSuppression, \
+    PurchasedGases, WasteGases, Electricity, Steam, BusinessTravel, Commuting, ProductTransport, Waste, \
+    PurchasedOffsets
+
+logger = logging.getLogger(__name__)
+
+# Chunks in flight per worker process, so that only a few chunks of the input and output are held in memory at once
+CHUNKS_PER_WORKER = 2
+# Inventories per chunk when their number is not known up front, e.g. for a generator
+ITERATOR_CHUNKSIZE = 16
+
+# Formula class for each worksheet type, the prefix of the worksheet version, e.g. 'mobile-sources.1.0.0'
+FORMULAS = {formula.wks_type: formula for formula in (StationaryCombustion, MobileSources, RefrigerationAndAc,
+                                                      FireSuppression, PurchasedGases, WasteGases, Electricity, Steam,
+                                                      BusinessTravel, Commuting, ProductTransport, Waste,
+                                                      PurchasedOffsets)}
+
+# Output key of each worksheet type's CO2 equivalent emissions (metric tons) that counts towards each scope total
+SCOPE_TOTALS = {'stationary-combustion': {'scope1': 'totalCO2EquivalentEmissions'},
+                'mobile-sources': {'scope1': 'totalCO2EquivalentEmissions'},
+                'refrigeration-and-ac': {'scope1': 'totalCO2EquivalentEmissions'},
+                'fire-suppression': {'scope1': 'totalCO2EquivalentEmissions'},
+                'purchased-gases': {'scope1': 'totalCO2EquivalentEmissions'},
+                'waste-gases': {'scope1': 'totalCO2EquivalentEmissions'},
+                'electricity': {'scope2LocationBased': 'CO2EquivalentEmissionsLocationBasedElectricityEmissions',
+                                'scope2MarketBased': 'CO2EquivalentEmissionsMarketBasedElectricityEmissions'},
+                'steam': {'scope2LocationBased': 'CO2EquivalentEmissionsLocationBasedElectricityEmissions',
+                          'scope2MarketBased': 'CO2EquivalentEmissionsMarketBasedElectricityEmissions'},
+                'business-travel': {'scope3': 'totalCO2EquivalentEmissions'},
+                'commuting': {'scope3': 'totalCO2EquivalentEmissions'},
+                'product-transport': {'scope3': 'totalCO2EquivalentEmissions'},
+                'waste': {'scope3': 'totalCO2EquivalentEmissions'},
+                'purchased-offsets': {'offsets': 'totalPurchasedOffsets'}}
+
+
+def document_type(wks_data: dict) -> str:
+    """ Worksheet type of a document from its version, e.g. 'mobile-sources' for 'mobile-sources.1.0.0' """
+    version = wks_data.get('version') or ''
+    wks_type = version.split('.', 1)[0]
+    if wks_type not in FORMULAS:
+        raise ValueError(f'Unknown worksheet version {version!r}')
+    return wks_type
+
+
+def zero_scope_totals() -> dict:
+    """ Scope totals with every scope zeroed """
+    return {'scope1': 0., 'scope2LocationBased': 0., 'scope2MarketBased': 0., 'scope3': 0., 'offsets': 0.}
+
+
+def compute_inventory(inventory, include_outputs=True) -> dict:
+    """ Compute every worksheet of one organization's inventory and total them by scope.
+
+    inventory is either a dict of worksheets keyed by worksheet type or an iterable of worksheets, each typed by its
+    version. Returns {'scopeTotals': {...}} plus, with include_outputs, 'outputs': a list of
+    {'type': ..., 'output': ...} in inventory order. """
+    if isinstance(inventory, dict):
+        typed_documents = list(inventory.items())
+    else:
+        typed_documents = [(document_type(wks_data), wks_data) for wks_data in inventory]
+
+    scope_totals = zero_scope_totals()
+    outputs = []
+    for wks_type, wks_data in typed_documents:
+        output = FORMULAS[wks_type](wks_data).to_dict()
+        for scope, key in SCOPE_TOTALS[wks_type].items():
+            scope_totals[scope] += output[key]
+        if include_outputs:
+            outputs.append({'type': wks_type, 'output': output})
+
+    ret = {'scopeTotals': scope_totals}
+    if include_outputs:
+        ret['outputs'] = outputs
+    return ret
+
+
+def sum_scope_totals(results) -> dict:
+    """ Sum the scopeTotals of results from compute_inventory or run_inventories """
+    scope_totals = zero_scope_totals()
+    for result in results:
+        for scope, total in result['scopeTotals'].items():
+            scope_totals[scope] += total
+    return scope_totals
+
+
+def initialize_worker():
+    """ Load every factor table once when a worker process starts, rather than in its first inventory """
+    for value in vars(factors).values():
+        if isinstance(value, factors.LazyFactors):
+            value.load()
+    _ = factors.mobile_combustion_ch4_and_n2o_emission_factors.dense_year_tables
+
+
+def compute_inventories(inventories, include_outputs=True) -> list:
+    """ compute_inventory of each of a chunk of inventories """
+    return [compute_inventory(inventory, include_outputs=include_outputs) for inventory in inventories]
+
+
+def run_inventories(inventories, workers=None, chunksize=None, include_outputs=True):
+    """ Compute many inventories across a pool of worker processes, yielding compute_inventory results in input
+    order.
+
+    workers defaults to the number of CPUs; with workers=1 inventories are computed in this process. Inventories are
+    sent to workers in chunks of chunksize, by default enough for about four chunks per worker, or ITERATOR_CHUNKSIZE
+    when inventories has no length. A new chunk is only taken from inventories as results are yielded, at most
+    CHUNKS_PER_WORKER chunks per worker in flight, so a generator of inventories is never read ahead of that. Leaving
+    the outputs out with include_outputs=False avoids sending them back from the workers when only scope totals are
+    needed. """
+    compute = functools.partial(compute_inventory, include_outputs=include_outputs)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        initialize_worker()
+        yield from map(compute, inventories)
+        return
+
+    if chunksize is None:
+        if hasattr(inventories, '__len__'):
+            chunksize = max(1, len(inventories) // (workers * 4))
+        else:
+            chunksize = ITERATOR_CHUNKSIZE
+    iterator = iter(inventories)
+    chunks = iter(lambda: list(itertools.islice(iterator, chunksize)), [])
+    with ProcessPoolExecutor(max_workers=workers, initializer=initialize_worker) as executor:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(executor.submit(compute_inventories, chunk, include_outputs))
+            if len(pending) >= workers * CHUNKS_PER_WORKER:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
@@ -0,0 +1,79 @@
+""" JSON schemas of the worksheets, and validators built from them once per process """
+import functools
+import pkgutil
+
+from atomic6ghg import json_backend
+from atomic6ghg.optional import require_jsonschema
+
+
+def schema_file(wks_type: str) -> str:
+    """ Schema file of a worksheet type, e.g. 'mobile_sources.json' for 'mobile-sources' """
+    return f"{wks_type.replace('-', '_')}.json"
+
+
+def version_type(wks_data: dict) -> str:
+    """ Worksheet type named by the version of a document, e.g. 'mobile-sources' for 'mobile-sources.1.0.0' """
+    return (wks_data.get('version') or '').split('.', 1)[0]
+
+
+@functools.lru_cache(maxsize=None)
+def load_schema(wks_type: str) -> dict:
+    """ Parsed schema of a worksheet type. Raises ValueError if there is no schema for it. """
+    try:
+        contents = pkgutil.get_data(__name__, schema_file(wks_type))
+    except FileNotFoundError as e:
+        raise ValueError(f'No schema for worksheet type {wks_type!r}') from e
+    return json_backend.loads(contents)
+
+
+@functools.lru_cache(maxsize=None)
+def get_validator(wks_type: str):
+    """ Draft 7 validator of a worksheet type. The schema is read once and the validator shared by every later
+    call, so that validating a document costs only the walk over it. """
+    jsonschema = require_jsonschema('worksheet validation')
+    return jsonschema.Draft7Validator(load_schema(wks_type))
+
+
+@functools.lru_cache(maxsize=None)
+def get_row_validator(wks_type: str, table: str):
+    """ Draft 7 validator of the rows of one row table of a worksheet type, for rows that arrive on their own, e.g.
+    from CSV. Raises ValueError if the schema does not describe the table. """
+    jsonschema = require_jsonschema('worksheet validation')
+    rows_schema = load_schema(wks_type).get('properties', {}).get(table)
+    if not rows_schema or 'items' not in rows_schema:
+        raise ValueError(f'The schema of {wks_type!r} has no row table {table!r}')
+    return jsonschema.Draft7Validator(rows_schema['items'])
+
+
+@functools.lru_cache(maxsize=None)
+def get_field_validator(wks_type: str, field: str):
+    """ Draft 7 validator of one top level field of a worksheet type, for fields given on their own, e.g. alongside
+    CSV rows. Raises ValueError if the schema does not describe the field. """
+    jsonschema = require_jsonschema('worksheet validation')
+    field_schema = load_schema(wks_type).get('properties', {}).get(field)
+    if not field_schema:
+        raise ValueError(f'The schema of {wks_type!r} has no field {field!r}')
+    return jsonschema.Draft7Validator(field_schema)
+
+
+def validate(wks_data: dict, wks_type: str = None):
+    """ Validate a worksheet against the schema of wks_type, by default the type named by its version. Raises
+    jsonschema.ValidationError for the most relevant error if it is invalid. """
+    get_validator(wks_type or version_type(wks_data)).validate(wks_data)
+
+
+def is_valid(wks_data: dict, wks_type: str = None) -> bool:
+    """ Whether a worksheet is valid against the schema of wks_type, by default the type named by its version """
+    return get_validator(wks_type or version_type(wks_data)).is_valid(wks_data)
+
+
+def validate_row(row: dict, wks_type: str, table: str):
+    """ Validate one row of a row table against the schema of wks_type. Raises jsonschema.ValidationError for the
+    most relevant error if it is invalid. """
+    get_row_validator(wks_type, table).validate(row)
+
+
+def validate_field(value, wks_type: str, field: str):
+    """ Validate the value of one top level field against the schema of wks_type. Raises jsonschema.ValidationError
+    for the most relevant error if it is invalid. """
+    get_field_validator(wks_type, field).validate(value)
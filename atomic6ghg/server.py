@@ -0,0 +1,249 @@
+""" HTTP/JSON calculation service, one endpoint per formula, using only the standard library.
+
+POST a worksheet document to /stationary_combustion, /electricity, ... (the worksheet type with underscores) and the
+response is the formula output. GET /metrics gives request latency histograms per formula in the Prometheus text
+format, and GET /health answers once the service is up:
+
+    python -m atomic6ghg.server --port 8080 --workers 4
+    curl -d @worksheet.json http://127.0.0.1:8080/electricity
+
+The factor tables are loaded before workers are forked, so that they are shared by every worker. Each worker handles
+keep-alive connections in threads. """
+import argparse
+import bisect
+import http
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from atomic6ghg import json_backend
+from atomic6ghg.runner import FORMULAS, initialize_worker
+
+logger = logging.getLogger(__name__)
+
+# Formula type of each endpoint
+ENDPOINTS = {'/' + wks_type.replace('-', '_'): wks_type for wks_type in FORMULAS}
+
+# Upper bounds of the latency histogram buckets, in seconds; slower requests fall in the +Inf bucket
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+
+# Largest request body accepted, in bytes
+MAX_BODY_BYTES = 16 * 2 ** 20
+
+# Seconds an idle keep-alive connection is held open
+KEEP_ALIVE_TIMEOUT = 30
+
+
+class Metrics:
+    """ Request latency histograms and error counts by formula, in memory shared by the worker processes. Each worker
+    writes only its own slot, so that no lock is shared between processes, and every worker renders the sum over all
+    slots. """
+    def __init__(self, workers=1):
+        self.wks_types = sorted(FORMULAS)
+        # Per formula: one count per bucket and the +Inf bucket, then the latency sum and the error count
+        self.stride = len(LATENCY_BUCKETS) + 3
+        self.slot_size = len(self.wks_types) * self.stride
+        self.values = multiprocessing.RawArray('d', workers * self.slot_size)
+        self.workers = workers
+        self.worker = 0
+        self._lock = threading.Lock()
+
+    def observe(self, wks_type: str, seconds: float, error=False):
+        """ Record a request of this worker """
+        offset = self.worker * self.slot_size + self.wks_types.index(wks_type) * self.stride
+        with self._lock:
+            self.values[offset + bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.values[offset + len(LATENCY_BUCKETS) + 1] += seconds
+            if error:
+                self.values[offset + len(LATENCY_BUCKETS) + 2] += 1
+
+    def totals(self, wks_type: str) -> list:
+        """ Bucket counts, latency sum and error count of a formula, summed over the workers """
+        offset = self.wks_types.index(wks_type) * self.stride
+        return [sum(self.values[worker * self.slot_size + offset + i] for worker in range(self.workers))
+                for i in range(self.stride)]
+
+    def render(self) -> bytes:
+        """ Prometheus text exposition of the histograms """
+        lines = ['# HELP atomic6ghg_request_seconds Latency of formula requests',
+                 '# TYPE atomic6ghg_request_seconds histogram']
+        errors = ['# HELP atomic6ghg_request_errors_total Formula requests that failed',
+                  '# TYPE atomic6ghg_request_errors_total counter']
+        for wks_type in self.wks_types:
+            totals = self.totals(wks_type)
+            count = 0
+            for bound, bucket_count in zip([*LATENCY_BUCKETS, '+Inf'], totals):
+                count += bucket_count
+                lines.append(f'atomic6ghg_request_seconds_bucket{{formula="{wks_type}",le="{bound}"}} {count:.0f}')
+            lines.append(f'atomic6ghg_request_seconds_sum{{formula="{wks_type}"}} {totals[-2]}')
+            lines.append(f'atomic6ghg_request_seconds_count{{formula="{wks_type}"}} {count:.0f}')
+            errors.append(f'atomic6ghg_request_errors_total{{formula="{wks_type}"}} {totals[-1]:.0f}')
+        return ('\n'.join(lines + errors) + '\n').encode()
+
+
+class CalculationServer(ThreadingHTTPServer):
+    """ HTTP server of the formula endpoints, with its metrics and request size limit """
+    daemon_threads = True
+
+    def __init__(self, address, metrics=None, max_body_bytes=MAX_BODY_BYTES):
+        super().__init__(address, FormulaRequestHandler)
+        self.metrics = metrics or Metrics()
+        self.max_body_bytes = max_body_bytes
+
+
+class FormulaRequestHandler(BaseHTTPRequestHandler):
+    """ Serves POST /<formula>, GET /metrics and GET /health over keep-alive HTTP/1.1 connections """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'atomic6ghg'
+    timeout = KEEP_ALIVE_TIMEOUT
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """ Metrics and health """
+        if self.path == '/metrics':
+            self.respond(http.HTTPStatus.OK, self.server.metrics.render(), 'text/plain; version=0.0.4')
+        elif self.path == '/health':
+            self.respond(http.HTTPStatus.OK, b'{"status":"ok"}')
+        else:
+            self.respond_error(http.HTTPStatus.NOT_FOUND, f'No endpoint {self.path}')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """ Compute the posted worksheet with the formula of the endpoint """
+        body = self.read_body()
+        if body is None:
+            return
+        wks_type = ENDPOINTS.get(self.path)
+        if wks_type is None:
+            self.respond_error(http.HTTPStatus.NOT_FOUND, f'No formula at {self.path}')
+            return
+
+        start = time.perf_counter()
+        try:
+            wks_data = json_backend.loads(body)
+            if not isinstance(wks_data, dict):
+                raise ValueError('the worksheet must be a JSON object')
+        except ValueError as e:
+            self.server.metrics.observe(wks_type, time.perf_counter() - start, error=True)
+            self.respond_error(http.HTTPStatus.BAD_REQUEST, f'Invalid worksheet: {e}')
+            return
+        try:
+            encoded = FORMULAS[wks_type](wks_data).to_json_bytes()
+            if encoded is None:
+                raise TypeError('output is not JSON serializable')
+        except Exception as e:  # pylint: disable=broad-except
+            self.server.metrics.observe(wks_type, time.perf_counter() - start, error=True)
+            self.respond_error(http.HTTPStatus.UNPROCESSABLE_ENTITY, f'{e.__class__.__name__}: {e}')
+            return
+        self.server.metrics.observe(wks_type, time.perf_counter() - start)
+        self.respond(http.HTTPStatus.OK, encoded)
+
+    def read_body(self):
+        """ Request body, or None after responding with an error if it is missing or too large """
+        length = self.headers.get('Content-Length')
+        if length is None or not length.isdigit():
+            self.close_connection = True
+            self.respond_error(http.HTTPStatus.LENGTH_REQUIRED, 'Content-Length is required')
+            return None
+        if int(length) > self.server.max_body_bytes:
+            # The body is not read, so the connection cannot be reused
+            self.close_connection = True
+            self.respond_error(http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                               f'Request body exceeds {self.server.max_body_bytes} bytes')
+            return None
+        return self.rfile.read(int(length))
+
+    def respond(self, status, body: bytes, content_type='application/json'):
+        """ Send a complete response """
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def respond_error(self, status, message: str):
+        """ Send a JSON error response """
+        self.respond(status, json_backend.dumpb({'error': message}))
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.debug('%s %s', self.address_string(), format % args)
+
+
+def serve(host='127.0.0.1', port=8080, workers=1, max_body_bytes=MAX_BODY_BYTES, ready=None):
+    """ Serve the formula endpoints until interrupted or terminated. With several workers, worker processes are
+    forked after the factor tables are loaded, all accepting on the same socket, and any that dies is replaced.
+    ready, if given, is called with the bound (host, port) before serving, e.g. to learn the port when it is 0. """
+    if workers > 1 and not hasattr(os, 'fork'):
+        logger.warning('Worker processes need os.fork; serving in a single process')
+        workers = 1
+    initialize_worker()
+    metrics = Metrics(workers)
+    server = CalculationServer((host, port), metrics=metrics, max_body_bytes=max_body_bytes)
+    if ready is not None:
+        ready(server.server_address[:2])
+
+    if workers == 1:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    def fork_worker(slot):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            metrics.worker = slot
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)  # pylint: disable=protected-access
+        children[pid] = slot
+
+    children = {}
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for slot in range(workers):
+            fork_worker(slot)
+        while children:
+            pid, status = os.wait()
+            slot = children.pop(pid, None)
+            if slot is not None:
+                logger.warning('Worker %d exited with status %d; replacing it', pid, status)
+                fork_worker(slot)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+        for pid in children:
+            os.waitpid(pid, 0)
+        server.server_close()
+
+
+def main(argv=None) -> int:
+    """ Run the service from the command line """
+    parser = argparse.ArgumentParser(prog='python -m atomic6ghg.server', description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on, 0 for any free port (default 8080)')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes, 0 for one per CPU (default 1)')
+    parser.add_argument('--max-body-bytes', type=int, default=MAX_BODY_BYTES,
+                        help=f'largest request body accepted (default {MAX_BODY_BYTES})')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    workers = args.workers or os.cpu_count() or 1
+    serve(args.host, args.port, workers=workers, max_body_bytes=args.max_body_bytes,
+          ready=lambda address: print(f'Serving on http://{address[0]}:{address[1]}', flush=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
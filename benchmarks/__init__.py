@@ -0,0 +1 @@
+""" Benchmarks of the formulas over synthetic worksheets """
@@ -0,0 +1,152 @@
+""" Benchmarks of every formula over synthetic worksheets of growing size.
+
+FormulaSuite follows the asv conventions (params, setup, time_* and peakmem_* methods). Running this module measures
+recalc throughput, peak memory and to_json time without asv, and appends them as one JSON line per run to a results
+file, so that runs on different commits can be compared:
+
+    python -m benchmarks.formulas --sizes 100 10000 1000000 --output benchmark_results.jsonl
+    python -m benchmarks.formulas --compare benchmark_results.jsonl
+"""
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from atomic6ghg import json_backend
+from atomic6ghg.runner import FORMULAS, initialize_worker
+from benchmarks.synthetic import synthetic_worksheet
+
+SIZES = [100, 1000, 10000, 100000, 1000000]
+
+# Ratio of recalc times between two runs above which --compare reports a regression
+REGRESSION_RATIO = 1.1
+
+
+class FormulaSuite:
+    """ recalc, to_json and peak memory of each formula by number of input rows """
+    params = (sorted(FORMULAS), SIZES)
+    param_names = ['wks_type', 'rows']
+    timeout = 600
+
+    def setup(self, wks_type, rows):
+        """ Build the worksheet and a formula over it, outside of the timings """
+        initialize_worker()
+        self.wks_data = synthetic_worksheet(wks_type, rows)  # pylint: disable=attribute-defined-outside-init
+        self.formula = FORMULAS[wks_type](self.wks_data)  # pylint: disable=attribute-defined-outside-init
+
+    def time_recalc(self, wks_type, rows):  # pylint: disable=unused-argument
+        """ Recalculate the worksheet """
+        self.formula.recalc(self.wks_data)
+
+    def time_to_json(self, wks_type, rows):  # pylint: disable=unused-argument
+        """ Encode the output, without the cached encoding """
+        self.formula.invalidate_output_cache()
+        self.formula.to_json()
+
+    def peakmem_recalc(self, wks_type, rows):  # pylint: disable=unused-argument
+        """ Construct and calculate a formula over the worksheet """
+        FORMULAS[wks_type](self.wks_data)
+
+
+def best_time(function, repeat) -> float:
+    """ Fastest of repeat calls of function, in seconds """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def measure(wks_type: str, rows: int, repeat: int = 3) -> dict:
+    """ recalc and to_json times and the peak memory traced while calculating one synthetic worksheet """
+    suite = FormulaSuite()
+    suite.setup(wks_type, rows)
+    recalc_seconds = best_time(lambda: suite.time_recalc(wks_type, rows), repeat)
+    to_json_seconds = best_time(lambda: suite.time_to_json(wks_type, rows), repeat)
+
+    tracemalloc.start()
+    try:
+        suite.peakmem_recalc(wks_type, rows)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'type': wks_type, 'rows': rows, 'recalcSeconds': recalc_seconds,
+            'rowsPerSecond': rows / recalc_seconds if recalc_seconds else None, 'toJsonSeconds': to_json_seconds,
+            'peakMemoryBytes': peak_memory}
+
+
+def current_commit():
+    """ Hash of the checked out commit, or None outside of a git checkout """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, check=True,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(wks_types, sizes, repeat=3, output=None) -> dict:
+    """ Measure every type at every size, printing each result as it is made. The run is appended to output as one
+    JSON line if given, and returned. """
+    results = []
+    for wks_type in wks_types:
+        for rows in sizes:
+            result = measure(wks_type, rows, repeat=repeat)
+            print(f"{wks_type:22} {rows:>9} rows  recalc {result['recalcSeconds']:9.4f}s  "
+                  f"to_json {result['toJsonSeconds']:9.4f}s  peak {result['peakMemoryBytes'] / 2 ** 20:9.1f} MiB",
+                  flush=True)
+            results.append(result)
+
+    record = {'commit': current_commit(), 'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+              'python': platform.python_version(), 'jsonBackend': json_backend.backend.name, 'results': results}
+    if output:
+        with open(output, 'a', encoding='utf-8') as results_file:
+            results_file.write(json.dumps(record) + '\n')
+    return record
+
+
+def compare(baseline: dict, current: dict) -> list:
+    """ (type, rows, recalc time ratio) of every result measured in both runs whose recalc time grew by more than
+    REGRESSION_RATIO """
+    baseline_times = {(result['type'], result['rows']): result['recalcSeconds'] for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        baseline_time = baseline_times.get((result['type'], result['rows']))
+        if baseline_time and result['recalcSeconds'] / baseline_time > REGRESSION_RATIO:
+            regressions.append((result['type'], result['rows'], result['recalcSeconds'] / baseline_time))
+    return regressions
+
+
+def main(argv=None) -> int:
+    """ Run the benchmarks, or compare the last two runs in a results file. Returns 1 if --compare finds a
+    regression. """
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.formulas', description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--types', nargs='+', choices=sorted(FORMULAS), default=sorted(FORMULAS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES[:3], help='input rows (default 100 1000 10000)')
+    parser.add_argument('--repeat', type=int, default=3, help='timings per measurement, of which the best is kept')
+    parser.add_argument('--output', help='JSON lines file to append the run to')
+    parser.add_argument('--compare', metavar='RESULTS', help='compare the last two runs in a results file')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as results_file:
+            runs = [json.loads(line) for line in results_file if line.strip()]
+        if len(runs) < 2:
+            parser.error(f'{args.compare} has fewer than two runs')
+        regressions = compare(runs[-2], runs[-1])
+        for wks_type, rows, ratio in regressions:
+            print(f'{wks_type:22} {rows:>9} rows  recalc {ratio:.2f}x slower')
+        print(f"{len(regressions)} regressions from {runs[-2]['commit']} to {runs[-1]['commit']}")
+        return 1 if regressions else 0
+
+    run(args.types, args.sizes, repeat=args.repeat, output=args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+""" Load test of a running calculation service (atomic6ghg.server) from keep-alive client threads.
+
+Each client posts the same synthetic worksheet over one connection, and the throughput and latency percentiles of the
+successful requests are printed:
+
+    python -m atomic6ghg.server --port 8080 --workers 4 &
+    python -m benchmarks.server --url http://127.0.0.1:8080 --type electricity --rows 100 --clients 8 --requests 200
+"""
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+import urllib.parse
+
+from atomic6ghg.runner import FORMULAS
+from benchmarks.synthetic import synthetic_worksheet
+
+
+def client(url, path, body, n_requests, latencies, errors):
+    """ Post body n_requests times over one connection, appending each latency, or a failed status, to the lists """
+    parsed = urllib.parse.urlsplit(url)
+    connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80)
+    try:
+        for _ in range(n_requests):
+            start = time.perf_counter()
+            connection.request('POST', path, body, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            if response.status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(response.status)
+    finally:
+        connection.close()
+
+
+def percentile(values, fraction) -> float:
+    """ Value at fraction of the sorted values """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else float('nan')
+
+
+def load_test(url, wks_type, rows, clients, requests) -> dict:
+    """ Run the clients to completion and summarize them """
+    body = json.dumps(synthetic_worksheet(wks_type, rows)).encode()
+    path = '/' + wks_type.replace('-', '_')
+    latencies, errors = [], []
+    threads = [threading.Thread(target=client, args=(url, path, body, requests, latencies, errors))
+               for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    return {'type': wks_type, 'rows': rows, 'requests': len(latencies), 'errors': len(errors),
+            'requestsPerSecond': len(latencies) / seconds, 'p50Seconds': percentile(latencies, .5),
+            'p99Seconds': percentile(latencies, .99)}
+
+
+def main(argv=None) -> int:
+    """ Load test the service and print the summary as JSON. Returns 1 if any request failed. """
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.server', description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    parser.add_argument('--type', dest='wks_type', choices=sorted(FORMULAS), default='electricity')
+    parser.add_argument('--rows', type=int, default=100, help='input rows per worksheet (default 100)')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent connections (default 8)')
+    parser.add_argument('--requests', type=int, default=100, help='requests per connection (default 100)')
+    args = parser.parse_args(argv)
+
+    summary = load_test(args.url, args.wks_type, args.rows, args.clients, args.requests)
+    print(json.dumps(summary, indent=2))
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
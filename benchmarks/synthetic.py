@@ -0,0 +1,42 @@
+""" Synthetic worksheets of any size, built by repeating the input rows of the canonical test fixtures """
+import functools
+import json
+import os
+import random
+
+from atomic6ghg.runner import FORMULAS, document_type
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'fixtures')
+
+
+@functools.lru_cache(maxsize=None)
+def canonical_worksheets() -> dict:
+    """ Canonical fixture of each worksheet type, keyed by type """
+    worksheets = {}
+    for file_name in sorted(os.listdir(FIXTURES)):
+        if file_name.endswith('_canonical_instance.json'):
+            with open(os.path.join(FIXTURES, file_name), 'r', encoding='utf-8') as canonical_instance:
+                wks_data = json.load(canonical_instance)
+            worksheets[document_type(wks_data)] = wks_data
+    return worksheets
+
+
+def synthetic_worksheet(wks_type: str, n_rows: int, seed: int = 0) -> dict:
+    """ Worksheet of wks_type with n_rows input rows spread evenly over the row tables of its canonical fixture.
+    Rows are drawn from the canonical rows in a seeded random order, and given distinct sourceIds where they have
+    one, so that the worksheet stays schema-valid at any size. """
+    canonical = canonical_worksheets()[wks_type]
+    tables = [table for table in FORMULAS[wks_type].row_tables if canonical.get(table)]
+    rng = random.Random(seed)
+
+    wks_data = {key: value for key, value in canonical.items() if key not in FORMULAS[wks_type].row_tables}
+    for i, table in enumerate(tables):
+        rows = canonical[table]
+        table_rows = []
+        for j in range(n_rows // len(tables) + (i < n_rows % len(tables))):
+            row = dict(rows[rng.randrange(len(rows))])
+            if row.get('sourceId') is not None:
+                row['sourceId'] = f"{row['sourceId']}-{j}"
+            table_rows.append(row)
+        wks_data[table] = table_rows
+    return wks_data
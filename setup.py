@@ -24,7 +24,14 @@ setup(name="atomic6ghg",
       package_data={
           'atomic6ghg': ['schemas/*.json',
                          'factors/source_data/*.json',
+                         'factors/source_data/*.snapshot',
                          'formulas/*.json'],
       },
-      install_requires=[]
+      install_requires=[],
+      extras_require={
+          "numpy": ["numpy"],
+          "orjson": ["orjson"],
+          "jsonschema": ["jsonschema"],
+          "pyarrow": ["pyarrow"],
+      }
       )
@@ -1,11 +1,28 @@
 # pylint: disable=all
 """Configuration for testing"""
 import json
+import os
 import pkgutil
 
 from jsonschema import Draft7Validator
 import pytest
 
+from atomic6ghg.runner import document_type
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+@pytest.fixture
+def documents():
+    """Canonical fixture of each worksheet type, keyed by type, in file name order"""
+    documents = {}
+    for file_name in sorted(os.listdir(FIXTURES)):
+        if file_name.endswith('_canonical_instance.json'):
+            with open(os.path.join(FIXTURES, file_name), 'r', encoding='utf-8') as canonical_instance:
+                document = json.load(canonical_instance)
+                documents[document_type(document)] = document
+    return documents
+
 
 @pytest.fixture
 def stationary_combustion_schema():
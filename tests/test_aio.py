@@ -0,0 +1,98 @@
+import asyncio
+import copy
+import json
+import os
+
+import pytest
+
+from atomic6ghg import aio
+from atomic6ghg.aio import FormulaPool, compute
+from atomic6ghg.formulas import BusinessTravel
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+@pytest.fixture
+def business_travel_data():
+    with open(os.path.join(FIXTURES, 'business_travel_canonical_instance.json'), 'r', encoding='utf-8') as instance:
+        return json.load(instance)
+
+
+@pytest.fixture
+def worksheets(business_travel_data):
+    return [{**business_travel_data, 'airBusinessTravel': business_travel_data['airBusinessTravel'][i:]}
+            for i in range(8)]
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    batches = []
+    compute_batch = aio.compute_batch
+
+    def recording_compute_batch(formula_cls, documents, kwargs):
+        batches.append(len(documents))
+        return compute_batch(formula_cls, documents, kwargs)
+    monkeypatch.setattr(aio, 'compute_batch', recording_compute_batch)
+    return batches
+
+
+def test_compute_batches(worksheets, batches):
+    async def compute_all():
+        async with FormulaPool(max_workers=2, batch_delay=0.05) as pool:
+            return await asyncio.gather(*[pool.compute(BusinessTravel, copy.deepcopy(wks_data))
+                                          for wks_data in worksheets])
+
+    outputs = asyncio.run(compute_all())
+    assert outputs == [BusinessTravel(copy.deepcopy(wks_data)).to_dict() for wks_data in worksheets]
+    assert batches == [len(worksheets)]
+
+
+def test_compute_errors(worksheets):
+    async def compute_all():
+        requests = [compute('business-travel', copy.deepcopy(worksheets[0])),
+                    compute(BusinessTravel, {'airBusinessTravel': [{'flightLength': 'shortHaul',
+                                                                    'passengerMiles': 'many'}]}),
+                    compute(BusinessTravel, copy.deepcopy(worksheets[1]))]
+        return await asyncio.gather(*requests, return_exceptions=True)
+
+    first, failed, last = asyncio.run(compute_all())
+    assert first == BusinessTravel(copy.deepcopy(worksheets[0])).to_dict()
+    assert isinstance(failed, Exception)
+    assert last == BusinessTravel(copy.deepcopy(worksheets[1])).to_dict()
+
+
+def test_cancellation(worksheets, batches):
+    async def cancel_one():
+        async with FormulaPool(max_workers=1, batch_delay=0.05) as pool:
+            cancelled = asyncio.ensure_future(pool.compute(BusinessTravel, copy.deepcopy(worksheets[0])))
+            kept = asyncio.ensure_future(pool.compute(BusinessTravel, copy.deepcopy(worksheets[1])))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await cancelled
+            return await kept
+
+    assert asyncio.run(cancel_one()) == BusinessTravel(copy.deepcopy(worksheets[1])).to_dict()
+    assert batches == [1]
+
+
+def test_backpressure(worksheets):
+    async def saturate():
+        async with FormulaPool(max_workers=1, max_pending=2, batch_delay=0.05) as pool:
+            tasks = [asyncio.ensure_future(pool.compute(BusinessTravel, copy.deepcopy(wks_data)))
+                     for wks_data in worksheets[:4]]
+            await asyncio.sleep(0.01)
+            pending = pool.pending
+            await asyncio.gather(*tasks)
+            return pending, pool.pending
+
+    assert asyncio.run(saturate()) == (2, 0)
+
+
+def test_process_pool(worksheets):
+    async def compute_all():
+        async with FormulaPool(max_workers=2, processes=True) as pool:
+            return await asyncio.gather(*[pool.compute(BusinessTravel, wks_data) for wks_data in worksheets[:2]])
+
+    assert asyncio.run(compute_all()) == [BusinessTravel(copy.deepcopy(wks_data)).to_dict()
+                                          for wks_data in worksheets[:2]]
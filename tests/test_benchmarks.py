@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+from atomic6ghg import schemas
+from atomic6ghg.runner import FORMULAS
+from benchmarks.formulas import compare, main, run
+from benchmarks.synthetic import synthetic_worksheet
+
+
+@pytest.mark.parametrize('wks_type', sorted(FORMULAS))
+def test_synthetic_worksheet(wks_type):
+    wks_data = synthetic_worksheet(wks_type, 250)
+
+    assert sum(len(wks_data.get(table, [])) for table in FORMULAS[wks_type].row_tables) == 250
+    schemas.validate(wks_data, wks_type)
+    assert synthetic_worksheet(wks_type, 250) == wks_data
+    assert FORMULAS[wks_type](wks_data).to_json() is not None
+
+
+def test_run_and_compare(tmp_path):
+    output = tmp_path / 'results.jsonl'
+    record = run(['electricity', 'waste'], [10, 20], repeat=1, output=output)
+
+    assert [(result['type'], result['rows']) for result in record['results']] == \
+        [('electricity', 10), ('electricity', 20), ('waste', 10), ('waste', 20)]
+    assert all(result['peakMemoryBytes'] > 0 for result in record['results'])
+    assert json.loads(output.read_text(encoding='utf-8')) == record
+
+    slower = json.loads(json.dumps(record))
+    slower['results'][0]['recalcSeconds'] *= 2
+    assert compare(record, slower) == [('electricity', 10, pytest.approx(2.))]
+    with open(output, 'a', encoding='utf-8') as results_file:
+        results_file.write(json.dumps(slower) + '\n')
+    assert main(['--compare', str(output)]) == 1
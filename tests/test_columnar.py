@@ -0,0 +1,90 @@
+import math
+from array import array
+
+import pytest
+
+from atomic6ghg.columnar import arrow_table, table_columns
+from atomic6ghg.compact_table import CompactTable
+from atomic6ghg.formulas import Electricity
+from atomic6ghg.runner import FORMULAS
+
+
+def column_rows(columns):
+    """ Rows of {column: values}, leaving out the None of rows without a column """
+    n_rows = len(next(iter(columns.values()), ()))
+    return [{key: column[i] for key, column in columns.items() if column[i] is not None} for i in range(n_rows)]
+
+
+def same_rows(actual, expected):
+    """ Whether two lists of row dicts are equal, counting NaN as equal to NaN """
+    def normalize(value):
+        return 'NaN' if isinstance(value, float) and math.isnan(value) else value
+    return [{key: normalize(value) for key, value in row.items()} for row in actual] == \
+        [{key: normalize(value) for key, value in row.items() if value is not None} for row in expected]
+
+
+@pytest.mark.parametrize('compact_rows', [False, True])
+def test_to_columns(monkeypatch, documents, compact_rows):
+    for wks_type, document in documents.items():
+        monkeypatch.setattr(FORMULAS[wks_type], 'compact_rows', compact_rows)
+        output = FORMULAS[wks_type](document).to_dict()
+        tables = FORMULAS[wks_type](document).to_columns()
+
+        assert list(tables) == [key for key, value in output.items() if isinstance(value, (list, CompactTable))]
+        for table, columns in tables.items():
+            assert same_rows(column_rows(columns), output[table])
+
+
+def test_typed_columns():
+    columns = table_columns([{'sourceId': 'a', 'quantity': 1.5, 'count': 2},
+                             {'sourceId': 'b', 'quantity': 2.5, 'count': 3, 'note': 'estimated'}])
+    assert columns['quantity'] == array('d', [1.5, 2.5]) and columns['count'] == array('q', [2, 3])
+    assert columns['sourceId'] == ['a', 'b'] and columns['note'] == [None, 'estimated']
+    assert table_columns({'co2': 1.5}) is None and table_columns({'a': [1.], 'b': [1., 2.]}) is None
+
+
+def test_recalc_columns_to_columns():
+    np = pytest.importorskip('numpy')
+    formula = Electricity()
+    formula.recalc_columns({'totalElectricityPurchased': {
+        'eGridSubregion': np.array(['akgd', 'camx']), 'electricityPurchased': np.array([1000., 2000.])}})
+    columns = formula.to_columns()['totalElectricityPurchased']
+    assert columns['electricityPurchased'] is formula.to_dict()['totalElectricityPurchased']['electricityPurchased']
+
+
+@pytest.mark.parametrize('compact_rows', [False, True])
+def test_to_arrow(monkeypatch, documents, compact_rows):
+    pytest.importorskip('pyarrow')
+    monkeypatch.setattr(Electricity, 'compact_rows', compact_rows)
+    formula = Electricity(documents['electricity'])
+
+    tables = formula.to_arrow()
+    assert list(tables) == ['totalElectricityPurchased']
+    assert same_rows([{key: value for key, value in row.items() if value is not None}
+                      for row in tables['totalElectricityPurchased'].to_pylist()],
+                     formula.to_dict()['totalElectricityPurchased'])
+
+
+def test_arrow_table():
+    pa = pytest.importorskip('pyarrow')
+    table = arrow_table({'quantity': array('d', [1.5, 2.5]), 'unit': ['kWh', 1000]})
+    assert table.schema.types == [pa.float64(), pa.string()]
+    assert table.to_pydict() == {'quantity': [1.5, 2.5], 'unit': ['kWh', '1000']}
+
+
+@pytest.mark.parametrize('formula_class', [FORMULAS[wks_type] for wks_type in (
+    'electricity', 'fire-suppression', 'purchased-gases', 'refrigeration-and-ac', 'waste-gases')])
+def test_to_arrow_then_apply_delta(monkeypatch, documents, formula_class):
+    pytest.importorskip('pyarrow')
+    monkeypatch.setattr(formula_class, 'compact_rows', True)
+    document = documents[formula_class.wks_type]
+    table = formula_class.row_tables[0]
+    rows = list(document[table])
+    expected = formula_class({**document, table: rows + rows[:1]}).to_dict()
+
+    formula = formula_class(document)
+    tables = formula.to_arrow()
+    output = formula.apply_delta(inserted=[dict(rows[0])], table=table)
+
+    assert len(output[table]) == len(expected[table])
+    assert tables[table].num_rows == len(rows)
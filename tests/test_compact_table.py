@@ -0,0 +1,84 @@
+import copy
+import json
+
+import pytest
+
+from atomic6ghg import json_backend
+from atomic6ghg.compact_table import CompactTable
+from atomic6ghg.formulas import Electricity
+from atomic6ghg.runner import FORMULAS
+
+
+@pytest.fixture
+def compact_rows(monkeypatch):
+    for formula_class in FORMULAS.values():
+        monkeypatch.setattr(formula_class, 'compact_rows', True)
+
+
+def test_compact_table():
+    rows = [{'sourceId': 'a', 'quantity': 1.5, 'count': 2, 'flag': True},
+            {'sourceId': 'b', 'quantity': 2.5, 'count': 3, 'flag': False},
+            {'note': 'no emissions', 'sourceId': 'c'}]
+    table = CompactTable(rows)
+
+    assert table == rows and len(table) == 3
+    assert list(table[2]) == ['note', 'sourceId']
+    assert table[-1] == rows[2] and table[1:] == rows[1:]
+    assert table.columns['quantity'].typecode == 'd' and table.columns['count'].typecode == 'q'
+    assert isinstance(table.columns['flag'], list)
+
+    table[0] = {'sourceId': 'a', 'quantity': None, 'count': 2, 'flag': True}
+    del table[1]
+    assert json.loads(json_backend.dumps({'rows': table})) == {'rows': [table[0], rows[2]]}
+    table.append({'sourceId': 'd', 'quantity': 4.0, 'count': 10 ** 30, 'extra': 'x'})
+    expected = [{'sourceId': 'a', 'quantity': None, 'count': 2, 'flag': True}, rows[2],
+                {'sourceId': 'd', 'quantity': 4.0, 'count': 10 ** 30, 'extra': 'x'}]
+    assert table == expected
+    with pytest.raises(IndexError):
+        table[3]  # pylint: disable=pointless-statement
+
+
+def test_compact_output_matches(documents, compact_rows):
+    for wks_type, document in documents.items():
+        formula_class = FORMULAS[wks_type]
+        formula = formula_class(copy.deepcopy(document))
+        if wks_type not in ('mobile-sources', 'purchased-offsets', 'stationary-combustion'):
+            # The others only echo their input rows, which are not copied
+            assert any(isinstance(value, CompactTable) for value in formula._output.values()), wks_type
+
+        formula_class.compact_rows = False
+        expected = formula_class(copy.deepcopy(document))
+        formula_class.compact_rows = True
+        output = formula.to_dict()
+        assert output == expected.to_dict(), wks_type
+        assert not any(isinstance(value, CompactTable) for value in output.values()), wks_type
+        assert formula.to_dict() == output
+        assert json.loads(json.dumps(output)) == json.loads(json.dumps(expected.to_dict())), wks_type
+        assert json.loads(formula.to_json()) == json.loads(expected.to_json()), wks_type
+
+
+def test_compact_apply_delta(documents, compact_rows):
+    document = documents['electricity']
+    rows = document['totalElectricityPurchased']
+    electricity = Electricity(copy.deepcopy(document))
+    output = electricity.apply_delta(inserted=[copy.deepcopy(rows[2])], updated={0: copy.deepcopy(rows[3])},
+                                     deleted=[5])
+    assert isinstance(output['totalElectricityPurchased'], list)
+    assert isinstance(electricity._output['totalElectricityPurchased'], CompactTable)
+
+    expected = Electricity(copy.deepcopy(electricity.wks_data)).to_dict()
+    assert output['totalElectricityPurchased'] == expected['totalElectricityPurchased']
+
+
+def test_compact_recalc_output_is_not_changed(documents, compact_rows):
+    document = documents['electricity']
+    electricity = Electricity(copy.deepcopy(document))
+    ret = electricity.recalc(copy.deepcopy(document))
+    assert ret is electricity._output
+    table = ret['totalElectricityPurchased']
+    assert isinstance(table, CompactTable)
+    assert table.columns['locationBasedEmissionsCO2Emissions'].typecode == 'd'
+
+    electricity.to_dict()
+    electricity.to_json()
+    assert ret['totalElectricityPurchased'] is table
@@ -1,8 +1,11 @@
 import pytest
+import copy
 import json
+import logging
 import os
 
 from atomic6ghg.formulas import Electricity, null_replacer
+from atomic6ghg.result_cache import ResultCache
 
 @pytest.fixture
 def canonical_data():
@@ -100,3 +103,224 @@ def test_output_schema_compliance(calculated_data, canonical_data, electricity_s
     output = calculated_data.to_dict()
     output['version'] = canonical_data['version']
     electricity_schema.validate(output)
+
+
+def test_apply_delta(canonical_data):
+    rows = canonical_data['totalElectricityPurchased']
+    expected_data = copy.deepcopy(canonical_data)
+    expected_rows = expected_data['totalElectricityPurchased']
+    expected_rows[0] = copy.deepcopy(rows[3])
+    del expected_rows[5]
+    expected_rows.append(copy.deepcopy(rows[2]))
+    expected = Electricity(expected_data).to_dict()
+
+    electricity = Electricity(canonical_data)
+    electricity.to_json()
+    output = electricity.apply_delta(inserted=[copy.deepcopy(rows[2])], updated={0: copy.deepcopy(rows[3])},
+                                     deleted=[5])
+
+    assert output['totalElectricityPurchased'] == expected['totalElectricityPurchased']
+    for key, value in expected['totalEmissionsForAllSources'].items():
+        assert output['totalEmissionsForAllSources'][key] == pytest.approx(value)
+    for key in ('CO2EquivalentEmissionsLocationBasedElectricityEmissions',
+                'CO2EquivalentEmissionsMarketBasedElectricityEmissions'):
+        assert output[key] == pytest.approx(expected[key])
+    assert json.loads(electricity.to_json()) == json.loads(json.dumps(output))
+
+
+def test_apply_delta_partial_documents(canonical_data, monkeypatch, caplog):
+    monkeypatch.setattr(Electricity, 'validate_input', True)
+    monkeypatch.setattr(Electricity, 'result_cache', ResultCache())
+    rows = canonical_data['totalElectricityPurchased']
+    expected = Electricity(copy.deepcopy({**canonical_data, 'totalElectricityPurchased': rows[1:-1]})).to_dict()
+    Electricity.result_cache.clear()
+
+    electricity = Electricity(copy.deepcopy(canonical_data))
+    electricity.compact_rows = True
+    with caplog.at_level(logging.INFO):
+        output = electricity.apply_delta(deleted=[-1, 0, len(rows) - 1])
+
+    assert 'falling back' not in caplog.text
+    assert output['totalElectricityPurchased'] == expected['totalElectricityPurchased']
+    assert output['totalEmissionsForAllSources'] == pytest.approx(expected['totalEmissionsForAllSources'])
+    assert Electricity.result_cache.stats() == {'hits': 0, 'misses': 1, 'entries': 1}
+
+    delta = electricity.delta_formula('totalElectricityPurchased', rows[:2])
+    assert delta.compact_rows and delta.result_cache is None and not delta.validate_input
+    assert Electricity.result_cache is not None and Electricity.validate_input
+    with pytest.raises(ValueError):
+        electricity.apply_delta(updated={0: rows[0], -len(electricity.wks_data['totalElectricityPurchased']): rows[1]})
+
+
+def test_compute_many(canonical_data):
+    rows = canonical_data['totalElectricityPurchased']
+    documents = [{**canonical_data, 'totalElectricityPurchased': rows[i:i + 5]} for i in range(0, len(rows), 5)]
+
+    outputs = list(Electricity.compute_many(iter(documents)))
+
+    assert outputs == [Electricity(document).to_dict() for document in documents]
+    assert len({id(output) for output in outputs}) == len(documents)
+
+
+def test_compute_many_compact_rows(canonical_data, monkeypatch):
+    monkeypatch.setattr(Electricity, 'compact_rows', True)
+    rows = canonical_data['totalElectricityPurchased']
+    documents = [{**canonical_data, 'totalElectricityPurchased': rows[i:i + 5]} for i in range(0, len(rows), 5)]
+
+    outputs = list(Electricity.compute_many(documents))
+
+    assert all(isinstance(output['totalElectricityPurchased'], list) for output in outputs)
+    assert outputs == [Electricity(document).to_dict() for document in documents]
+
+
+@pytest.fixture
+def canonical_columns(canonical_data):
+    rows = canonical_data['totalElectricityPurchased']
+    columns = {key: [row.get(key) for row in rows] for key in ('sourceId', 'eGridSubregion', 'electricityPurchased',
+                                                               *Electricity.market_based_factor_keys)}
+    return {**canonical_data, 'totalElectricityPurchased': columns}
+
+
+def test_calculate_row_emissions():
+    factor_vector = (1114.4, 0.098, 0.013)
+    row_emissions = Electricity.calculate_row_emissions(2500, (800., None, 0.), factor_vector)
+
+    assert row_emissions == [Electricity.calculate_market_based_emissions_electricity(2500, 800., 'akgd', 'co2'),
+                             Electricity.calculate_market_based_emissions_electricity(2500, None, 'akgd', 'ch4'),
+                             Electricity.calculate_market_based_emissions_electricity(2500, 0., 'akgd', 'n2o'),
+                             Electricity.calculate_location_based_emissions_electricity(2500, 'akgd', 'co2'),
+                             Electricity.calculate_location_based_emissions_electricity(2500, 'akgd', 'ch4'),
+                             Electricity.calculate_location_based_emissions_electricity(2500, 'akgd', 'n2o')]
+
+
+def test_recalc_columns(calculated_data, canonical_columns):
+    np = pytest.importorskip('numpy')
+    columns = canonical_columns['totalElectricityPurchased']
+    columns['marketBasedEmissionFactorsCO2Emissions'][1] = 900.
+    columns['eGridSubregion'][2] = None
+    rows = copy.deepcopy(calculated_data.wks_data['totalElectricityPurchased'])
+    rows[1]['marketBasedEmissionFactorsCO2Emissions'] = 900.
+    rows[2]['eGridSubregion'] = None
+    expected = Electricity({'totalElectricityPurchased': rows}).to_dict()
+
+    columnar = Electricity()
+    output = columnar.recalc_columns(canonical_columns)
+
+    for key, value in expected['totalEmissionsForAllSources'].items():
+        assert output['totalEmissionsForAllSources'][key] == pytest.approx(value)
+    for key in ('CO2EquivalentEmissionsLocationBasedElectricityEmissions',
+                'CO2EquivalentEmissionsMarketBasedElectricityEmissions'):
+        assert output[key] == pytest.approx(expected[key])
+    row_emissions = output['totalElectricityPurchased']
+    for key in Electricity.emission_keys:
+        assert isinstance(row_emissions[key], np.ndarray)
+        assert row_emissions[key][2] == 0.
+        assert row_emissions[key][1] == pytest.approx(expected['totalElectricityPurchased'][1][key])
+    assert isinstance(columnar.to_json(), str)
+
+    columns['eGridSubregion'][0] = 'atlantis'
+    with pytest.raises(ValueError):
+        Electricity().recalc_columns(canonical_columns)
+
+
+def test_recalc_readings():
+    np = pytest.importorskip('numpy')
+    rng = np.random.default_rng(0)
+    source_ids = np.array(['Bldg-1'] * 96 + ['Bldg-2'] * 96 + ['Bldg-1'] * 96 + ['Bldg-3'] * 96)
+    subregions = ['akgd'] * 96 + ['camx'] * 96 + ['akgd'] * 48 + ['newe'] * 48 + [None] * 96
+    readings = {'sourceId': source_ids, 'eGridSubregion': subregions, 'electricityPurchased': rng.random(384) * 25}
+    sites = {'Bldg-2': {'sourceDescription': 'Warehouse', 'marketBasedEmissionFactorsCO2Emissions': 800.}}
+
+    output = Electricity().recalc_readings(readings, sites=sites)
+
+    expected_rows = []
+    for source_id, subregion, selected in [('Bldg-1', 'akgd', slice(0, 96)), ('Bldg-1', 'newe', slice(240, 288)),
+                                           ('Bldg-2', 'camx', slice(96, 192)), ('Bldg-3', None, slice(288, 384))]:
+        if source_id == 'Bldg-1' and subregion == 'akgd':
+            electricity_purchased = readings['electricityPurchased'][np.r_[0:96, 192:240]].sum()
+        else:
+            electricity_purchased = readings['electricityPurchased'][selected].sum()
+        expected_rows.append({'sourceId': source_id, 'sourceDescription': None, 'sourceArea': None,
+                              'eGridSubregion': subregion, 'electricityPurchased': float(electricity_purchased),
+                              **dict.fromkeys(Electricity.market_based_factor_keys), **sites.get(source_id, {})})
+    expected = Electricity({'totalElectricityPurchased': expected_rows}).to_dict()
+
+    rows = output['totalElectricityPurchased']
+    assert [(row['sourceId'], row['eGridSubregion']) for row in rows] == \
+        [(row['sourceId'], row['eGridSubregion']) for row in expected_rows]
+    assert rows[2]['sourceDescription'] == 'Warehouse'
+    for row, expected_row in zip(rows, expected['totalElectricityPurchased']):
+        for key, value in expected_row.items():
+            assert row[key] == pytest.approx(value)
+    for key, value in expected['totalEmissionsForAllSources'].items():
+        assert output['totalEmissionsForAllSources'][key] == pytest.approx(value)
+
+
+@pytest.fixture
+def hourly_factors():
+    np = pytest.importorskip('numpy')
+    from atomic6ghg.factors import HourlyElectricityFactors
+    # Synthetic hourly factors for two days, with camx hours listed in reverse
+    hours = np.arange('2023-01-01T00', '2023-01-03T00', dtype='datetime64[h]')
+    subregions = ['akgd'] * len(hours) + ['camx'] * len(hours)
+    times = np.concatenate([hours, hours[::-1]])
+    co2 = np.concatenate([1000. + np.arange(len(hours)), 500. - np.arange(len(hours))[::-1]])
+    return HourlyElectricityFactors.from_columns(subregions, times, co2, co2 / 10000, co2 / 100000)
+
+
+def test_hourly_factors_lookup(hourly_factors):
+    np = pytest.importorskip('numpy')
+    assert hourly_factors.lookup('akgd', '2023-01-01T05:00') == (1005., 0.1005, 0.01005)
+    assert hourly_factors.lookup('akgd', np.datetime64('2023-01-01T05:59')) == (1005., 0.1005, 0.01005)
+    assert hourly_factors.lookup('camx', '2023-01-02T23:00')[0] == 453.
+    # Times outside the table take the first or last period
+    assert hourly_factors.lookup('akgd', '2022-06-01T00:00')[0] == 1000.
+    assert hourly_factors.lookup('camx', '2024-01-01T00:00')[0] == 453.
+
+    times = np.array(['2022-06-01T00:00', '2023-01-01T05:30', '2023-01-02T12:00', '2024-01-01T00:00'],
+                     dtype='datetime64[s]')
+    subregion_codes = [hourly_factors.subregion_codes[subregion] for subregion in ('camx', 'akgd', 'camx', 'akgd')]
+    gathered = hourly_factors.gather(subregion_codes, times)
+    assert gathered.tolist() == [list(hourly_factors.lookup(subregion, time)) for subregion, time in
+                                 zip(('camx', 'akgd', 'camx', 'akgd'), times)]
+
+    from atomic6ghg.factors import HourlyElectricityFactors
+    with pytest.raises(ValueError):
+        HourlyElectricityFactors.from_columns(['akgd', 'akgd'], [0, 0], [1., 2.], [0., 0.], [0., 0.])
+
+
+def test_recalc_hourly(hourly_factors):
+    np = pytest.importorskip('numpy')
+    times = np.arange('2023-01-01T00:00', '2023-01-03T00:00', 15, dtype='datetime64[m]')
+    n_readings = len(times)
+    readings = {'sourceId': ['Bldg-1'] * n_readings + ['Bldg-2'] * n_readings + ['Bldg-3'] * n_readings,
+                'eGridSubregion': ['akgd'] * n_readings + ['camx'] * n_readings + [None] * n_readings,
+                'electricityPurchased': np.linspace(1., 50., 3 * n_readings),
+                'time': np.concatenate([times] * 3)}
+    sites = {'Bldg-2': {'marketBasedEmissionFactorsCO2Emissions': 800.}}
+
+    output = Electricity().recalc_hourly(readings, hourly_factors, sites=sites)
+
+    rows = output['totalElectricityPurchased']
+    assert [row['sourceId'] for row in rows] == ['Bldg-1', 'Bldg-2', 'Bldg-3']
+    for row, selected in zip(rows[:2], (slice(0, n_readings), slice(n_readings, 2 * n_readings))):
+        expected = [0., 0., 0.]
+        for subregion, time, kwh in zip(readings['eGridSubregion'][selected], readings['time'][selected],
+                                        readings['electricityPurchased'][selected]):
+            for gas, factor in enumerate(hourly_factors.lookup(subregion, time)):
+                expected[gas] += max(0., kwh / 1000 * factor)
+        assert row['electricityPurchased'] == pytest.approx(readings['electricityPurchased'][selected].sum())
+        assert row['locationBasedEmissionsCO2Emissions'] == pytest.approx(expected[0])
+        assert row['locationBasedEmissionsCH4Emissions'] == pytest.approx(expected[1])
+        assert row['locationBasedEmissionsN2OEmissions'] == pytest.approx(expected[2])
+    assert rows[0]['marketBasedEmissionsCO2Emissions'] == rows[0]['locationBasedEmissionsCO2Emissions']
+    assert rows[1]['marketBasedEmissionsCO2Emissions'] == pytest.approx(rows[1]['electricityPurchased'] / 1000 * 800.)
+    assert 'locationBasedEmissionsCO2Emissions' not in rows[2]
+
+    totals = output['totalEmissionsForAllSources']
+    assert totals['locationBasedEmissionsCO2Emissions'] == pytest.approx(sum(
+        row['locationBasedEmissionsCO2Emissions'] for row in rows[:2]))
+
+    readings['eGridSubregion'][0] = 'newe'
+    with pytest.raises(ValueError):
+        Electricity().recalc_hourly(readings, hourly_factors)
@@ -0,0 +1,96 @@
+import json
+import os
+import pkgutil
+
+import pytest
+
+from atomic6ghg.factors import HeatContentFactors, MobileCombustionCh4AndN2oEmissionFactors, RefrigerantsGwpFactors, \
+    get_factor_set, heat_content_factors, refrigerants_gwp_factors, register_edition, unregister_edition, use_factor_set
+from atomic6ghg.formulas import MobileSources, StationaryCombustion
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def source_table(file_name):
+    return json.loads(pkgutil.get_data('atomic6ghg.factors', f'source_data/{file_name}'))
+
+
+def canonical_instance(name):
+    with open(os.path.join(FIXTURES, f'{name}_canonical_instance.json'), 'r', encoding='utf-8') as instance:
+        return json.load(instance)
+
+
+@pytest.fixture
+def ar5_gwp():
+    gwp = {**source_table('refrigerants_gwp_factors.json'), 'ch4': 28, 'n2o': 265}
+    factor_set = register_edition('test-ar5', tables={'refrigerants_gwp_factors.json': gwp})
+    yield factor_set
+    unregister_edition('test-ar5')
+
+
+def test_formulas_with_editions(ar5_gwp):
+    data = canonical_instance('stationary_combustion')
+    default = StationaryCombustion(json.loads(json.dumps(data))).to_dict()
+    restated = StationaryCombustion(json.loads(json.dumps(data)), factor_set='test-ar5')
+
+    assert restated.to_dict()['totalCO2EquivalentEmissions'] != default['totalCO2EquivalentEmissions']
+    assert StationaryCombustion(json.loads(json.dumps(data))).to_dict() == default
+    assert restated.recalc(restated.wks_data) == restated.to_dict()
+
+    with use_factor_set(ar5_gwp):
+        assert refrigerants_gwp_factors['ch4'] == 28
+        assert StationaryCombustion(json.loads(json.dumps(data))).to_dict() == restated.to_dict()
+    assert refrigerants_gwp_factors['ch4'] == 25
+
+
+def test_default_factors_skip_edition_lookup(ar5_gwp):
+    default = refrigerants_gwp_factors.load()
+    assert refrigerants_gwp_factors._default is default
+
+    with use_factor_set(ar5_gwp):
+        assert refrigerants_gwp_factors._default is None
+        with use_factor_set(ar5_gwp):
+            assert refrigerants_gwp_factors['ch4'] == 28
+        assert refrigerants_gwp_factors['ch4'] == 28
+        with use_factor_set('default'):
+            assert refrigerants_gwp_factors['ch4'] == 25
+    assert refrigerants_gwp_factors._default is default
+    assert refrigerants_gwp_factors['ch4'] == 25
+
+
+def test_editions_share_factors(ar5_gwp, tmp_path):
+    gwp = ar5_gwp.sources['refrigerants_gwp_factors.json']
+    (tmp_path / 'refrigerants_gwp_factors.json').write_text(json.dumps(gwp), encoding='utf-8')
+    from_directory = register_edition('test-ar5-directory', directory=str(tmp_path))
+    try:
+        assert from_directory.factors(RefrigerantsGwpFactors)['ch4'] == 28
+        assert from_directory.factors(RefrigerantsGwpFactors) is ar5_gwp.factors(RefrigerantsGwpFactors)
+    finally:
+        unregister_edition('test-ar5-directory')
+
+    assert ar5_gwp.factors(HeatContentFactors) is None
+    default_heat_content_factors = heat_content_factors.load()
+    with use_factor_set('test-ar5'):
+        assert heat_content_factors.load() is default_heat_content_factors
+
+
+def test_replaced_compiled_tables():
+    file_name = 'mobile_combustion_ch4_and_n2o_emission_factors.json'
+    register_edition('test-mobile', tables={file_name: source_table(file_name)})
+    try:
+        factors = get_factor_set('test-mobile').factors(MobileCombustionCh4AndN2oEmissionFactors)
+        assert factors.dense_year_tables.pairs == \
+            MobileCombustionCh4AndN2oEmissionFactors().compile_dense_year_tables().pairs
+
+        data = canonical_instance('mobile_sources')
+        assert MobileSources(json.loads(json.dumps(data)), factor_set='test-mobile').to_dict() == \
+            MobileSources(json.loads(json.dumps(data))).to_dict()
+    finally:
+        unregister_edition('test-mobile')
+
+
+def test_unknown_edition():
+    with pytest.raises(ValueError):
+        StationaryCombustion({}, factor_set='no-such-edition')
+    with pytest.raises(ValueError):
+        register_edition('default')
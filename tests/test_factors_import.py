@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+
+from atomic6ghg.factors import LazyFactors, HeatContentFactors
+
+# Wall clock budget for a cold `import atomic6ghg.formulas`, generous enough for slow CI machines
+IMPORT_TIME_BUDGET = 0.5
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import atomic6ghg.formulas
+elapsed = time.perf_counter() - start
+import atomic6ghg.factors as factors
+print(json.dumps({
+    'elapsed': elapsed,
+    'loaded': sorted(name for name, value in vars(factors).items()
+                     if isinstance(value, factors.LazyFactors) and value.loaded),
+    'numpy': 'numpy' in sys.modules,
+}))
+"""
+
+
+def test_import_time_budget():
+    result = subprocess.run([sys.executable, '-c', IMPORT_PROBE], capture_output=True, check=True, text=True,
+                            cwd=os.path.join(os.path.dirname(__file__), '..'))
+    probe = json.loads(result.stdout)
+    assert probe['loaded'] == []
+    assert not probe['numpy']
+    assert probe['elapsed'] < IMPORT_TIME_BUDGET
+
+
+def test_lazy_factors_load_on_first_access():
+    factors = LazyFactors(HeatContentFactors)
+    assert not factors.loaded
+    assert 'not loaded' in repr(factors)
+
+    assert factors['anthraciteCoal'] == HeatContentFactors()['anthraciteCoal']
+    assert factors.loaded
+    assert factors.load() is factors.load()
+    assert factors.factors == factors.load().factors
@@ -0,0 +1,42 @@
+import json
+import pkgutil
+
+from atomic6ghg.factors import loader
+from atomic6ghg.factors import MobileCombustionCh4AndN2oEmissionFactors
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = loader.build_snapshot(str(tmp_path / 'factors.snapshot'))
+    snapshot = loader.read_snapshot(path)
+
+    for file_name in ('heat_content_factors.json', 'mobile_combustion_ch4_and_n2o_emission_factors.json'):
+        assert snapshot['tables'][file_name] == json.loads(pkgutil.get_data('atomic6ghg.factors',
+                                                                             f'source_data/{file_name}'))
+    dense_year_tables = snapshot['compiled']['mobile_combustion_ch4_and_n2o_dense_year_tables']
+    compiled = MobileCombustionCh4AndN2oEmissionFactors().compile_dense_year_tables()
+    assert dense_year_tables.pairs == compiled.pairs
+    assert dense_year_tables.ch4_factors == compiled.ch4_factors
+    assert dense_year_tables.lookup('passengerCars', 'gasoline', 2010) == \
+        compiled.lookup('passengerCars', 'gasoline', 2010)
+
+
+def test_snapshot_missing(tmp_path):
+    assert loader.read_snapshot(str(tmp_path / 'factors.snapshot')) == {'tables': {}, 'compiled': {}}
+
+
+def test_snapshot_corrupt(tmp_path):
+    path = loader.build_snapshot(str(tmp_path / 'factors.snapshot'))
+    with open(path, 'r+b') as snapshot_file:
+        snapshot_file.seek(-1, 2)
+        snapshot_file.write(b'\x00')
+    assert loader.read_snapshot(path) == {'tables': {}, 'compiled': {}}
+
+    with open(path, 'wb') as snapshot_file:
+        snapshot_file.write(b'not a snapshot')
+    assert loader.read_snapshot(path) == {'tables': {}, 'compiled': {}}
+
+
+def test_snapshot_stale(tmp_path, monkeypatch):
+    path = loader.build_snapshot(str(tmp_path / 'factors.snapshot'))
+    monkeypatch.setattr(loader, 'source_digest', lambda: '0' * 64)
+    assert loader.read_snapshot(path) == {'tables': {}, 'compiled': {}}
@@ -1,4 +1,5 @@
 import pytest
+import copy
 import json
 import os
 
@@ -145,3 +146,19 @@ def test_output_schema_compliance(calculated_data, canonical_data, fire_suppress
     output = calculated_data.to_dict()
     output['version'] = canonical_data['version']
     fire_suppression_schema.validate(output)
+
+
+def test_apply_delta(canonical_data):
+    rows = canonical_data['screeningMethod']
+    expected_data = copy.deepcopy(canonical_data)
+    del expected_data['screeningMethod'][0]
+    expected = FireSuppression(expected_data).to_dict()
+
+    fire_suppression = FireSuppression(canonical_data)
+    with pytest.raises(ValueError):
+        fire_suppression.apply_delta(deleted=[0])
+    output = fire_suppression.apply_delta(deleted=[0], table='screeningMethod')
+
+    assert output['screeningMethod'] == expected['screeningMethod']
+    assert len(rows) == len(expected['screeningMethod'])
+    assert output['totalCO2EquivalentEmissions'] == pytest.approx(expected['totalCO2EquivalentEmissions'])
@@ -0,0 +1,73 @@
+import json
+import os
+
+import pytest
+
+from atomic6ghg.formulas import BusinessTravel, Electricity, Formula, MobileSources
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def load_fixture(file_name):
+    with open(os.path.join(FIXTURES, file_name), 'r', encoding='utf-8') as canonical_instance:
+        return json.load(canonical_instance)
+
+
+@pytest.fixture
+def business_travel_data():
+    return load_fixture('business_travel_canonical_instance.json')
+
+
+def test_records_every_stage(business_travel_data):
+    forwarded = []
+    with Formula.instrument(callback=forwarded.append) as recorder:
+        BusinessTravel(business_travel_data)
+
+    stages = [record['stage'] for record in recorder.records]
+    assert stages[-1] == 'recalc'
+    assert stages[:-1] == ['make_personal_vehicle_rental_car_or_taxi', 'make_personal_vehicle_total',
+                           'make_rail_or_bus', 'make_rail_or_bus_total', 'make_air_business_travel', 'make_air_total',
+                           'make_co2_emissions_by_travel_type', 'make_co2_equivalent_emissions']
+    assert forwarded == recorder.records
+    n_rows = sum(len(business_travel_data[table]) for table in BusinessTravel.row_tables)
+    assert all(record['rows'] == n_rows and record['formula'] == 'BusinessTravel' for record in recorder.records)
+    assert recorder.records[-1]['seconds'] >= sum(record['seconds'] for record in recorder.records[:-1])
+
+    summary = recorder.to_dict()['BusinessTravel']
+    assert summary['recalc']['calls'] == 1
+    assert 'allocatedBytes' not in summary['recalc']
+
+
+def test_only_instrumented_class_and_context(business_travel_data):
+    electricity_data = load_fixture('electricity_canonical_instance.json')
+    with Electricity.instrument() as recorder:
+        BusinessTravel(business_travel_data)
+        list(Electricity.compute_many([electricity_data, {'totalElectricityPurchased': []}]))
+    Electricity(electricity_data)
+
+    assert {record['formula'] for record in recorder.records} == {'Electricity'}
+    assert [record['rows'] for record in recorder.records if record['stage'] == 'recalc'] == \
+        [len(electricity_data['totalElectricityPurchased']), 0]
+
+
+def test_allocations(business_travel_data):
+    with Formula.instrument(allocations=True, keep_records=False) as recorder:
+        formula = BusinessTravel(business_travel_data)
+    assert recorder.records == []
+
+    with Formula.instrument(allocations=True) as recorder:
+        formula.recalc(business_travel_data)
+    recalc = recorder.records[-1]
+    assert recalc['peakBytes'] >= max(record['peakBytes'] for record in recorder.records[:-1]) > 0
+    assert recorder.to_dict()['BusinessTravel']['make_air_business_travel']['allocatedBytes'] > 0
+
+
+def test_per_row_helpers_are_not_timed():
+    mobile_sources_data = load_fixture('mobile_sources_canonical_instance.json')
+    with MobileSources.instrument() as recorder:
+        MobileSources(mobile_sources_data)
+
+    stages = [record['stage'] for record in recorder.records]
+    assert len(stages) == len(set(stages))
+    assert set(stages) <= {'recalc', *MobileSources.stages}
+    assert not hasattr(MobileSources.tabulate_total_mobile_sources_fuel_usage_and_co2_emissions, '__wrapped__')
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from atomic6ghg import json_backend
+from atomic6ghg.formulas import MobileSources
+
+INSTALLED_BACKENDS = [name for name, (_, module) in json_backend.BACKENDS.items() if module is not None]
+
+
+@pytest.fixture(params=INSTALLED_BACKENDS)
+def backend(request):
+    previous = json_backend.backend
+    json_backend.set_backend(request.param)
+    yield request.param
+    json_backend.backend = previous
+
+
+def test_round_trip(backend):
+    document = {'a': [1, 2.5, None, True], 'b': {'c': 'ü'}}
+    encoded = json_backend.dumpb(document)
+    assert isinstance(encoded, bytes)
+    assert b'\n' not in encoded and b', ' not in encoded
+    assert json_backend.loads(encoded) == document
+    assert json.loads(json_backend.dumps(document, indent=2)) == document
+
+
+def test_loads_nan_literals(backend):
+    assert json_backend.loads(b'{"a": NaN}')['a'] != 0.
+
+
+def test_formula_output(backend):
+    formula = MobileSources()
+    formula._output = {'a': [1.1, 2.2], 'b': {'c': 'd'}}
+    assert json.loads(formula.to_json()) == formula._output
+    assert json.loads(formula.to_json_bytes()) == formula._output
+
+
+def test_array_columns(backend):
+    np = pytest.importorskip('numpy')
+    assert json.loads(json_backend.dumpb({'a': np.arange(3.)})) == {'a': [0., 1., 2.]}
+
+
+def test_set_backend_not_installed(monkeypatch):
+    monkeypatch.setitem(json_backend.BACKENDS, 'ujson', (json_backend.UjsonBackend, None))
+    with pytest.raises(ImportError):
+        json_backend.set_backend('ujson')
+
+
+def test_orjson_indent():
+    pytest.importorskip('orjson')
+    assert json_backend.OrjsonBackend.dumpb({'a': 1}, indent=2) == b'{\n  "a": 1\n}'
+    for indent in (0, 4, '\t'):
+        assert json_backend.OrjsonBackend.dumpb({'a': [1]}, indent=indent) == \
+            json.dumps({'a': [1]}, indent=indent).encode()
+
+
+def test_to_json_indent(backend):
+    formula = MobileSources()
+    formula._output = {'a': [1.1, 2.2], 'b': {'c': 'd'}}
+    assert formula.to_json(indent=4) == json.dumps(formula._output, indent=4)
@@ -0,0 +1,170 @@
+import csv
+import json
+import subprocess
+import sys
+
+import pytest
+
+from atomic6ghg.__main__ import column_types, main, parse_value
+from atomic6ghg.formulas import StationaryCombustion, WasteGases
+from atomic6ghg.runner import FORMULAS
+
+ELECTRICITY_CSV_HEADER = 'sourceId,sourceDescription,sourceArea,eGridSubregion,electricityPurchased,' \
+    'marketBasedEmissionFactorsCO2Emissions,marketBasedEmissionFactorsCH4Emissions,' \
+    'marketBasedEmissionFactorsN2OEmissions\n'
+
+
+@pytest.fixture
+def jsonl_input(tmp_path, documents):
+    path = tmp_path / 'input.jsonl'
+    lines = [json.dumps(document) for document in documents.values()]
+    lines.insert(3, json.dumps({'version': 'unknown.1.0.0'}))
+    path.write_text('\n'.join(lines) + '\n\n', encoding='utf-8')
+    return path
+
+
+def write_csv(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def read_outputs(path):
+    with open(path, 'r', encoding='utf-8') as output:
+        return [json.loads(line) for line in output]
+
+
+def expected_output(document):
+    wks_type = document['version'].split('.', 1)[0]
+    return json.loads(json.dumps(FORMULAS[wks_type](json.loads(json.dumps(document))).to_dict()))
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_jsonl(tmp_path, jsonl_input, documents, workers):
+    output_path = tmp_path / 'output.jsonl'
+    assert main([str(jsonl_input), '-o', str(output_path), '--workers', str(workers)]) == 1
+
+    outputs = read_outputs(output_path)
+    assert len(outputs) == len(documents) + 1
+    assert 'unknown.1.0.0' in outputs.pop(3)['error']
+    for document, output in zip(documents.values(), outputs):
+        assert output == expected_output(document)
+
+
+def test_type_and_validate(tmp_path, documents):
+    electricity = documents['electricity']
+    invalid = json.loads(json.dumps(electricity))
+    invalid['totalElectricityPurchased'][0]['electricityPurchased'] = 'a lot'
+    input_path = tmp_path / 'input.jsonl'
+    input_path.write_text(json.dumps(electricity) + '\n' + json.dumps(invalid) + '\n', encoding='utf-8')
+    output_path = tmp_path / 'output.jsonl'
+
+    assert main([str(input_path), '-o', str(output_path), '--type', 'electricity', '--validate']) == 1
+    valid_output, invalid_output = read_outputs(output_path)
+    assert valid_output == expected_output(electricity)
+    assert invalid_output['error'].startswith('ValidationError')
+
+
+def test_csv(tmp_path, documents):
+    stationary = documents['stationary-combustion']
+    rows = stationary['stationarySourceFuelConsumption']
+    input_path = tmp_path / 'input.csv'
+    write_csv(input_path, rows)
+    output_path = tmp_path / 'output.jsonl'
+
+    assert main([str(input_path), '-o', str(output_path), '--type', 'stationary-combustion']) == 0
+    outputs = read_outputs(output_path)
+    assert len(outputs) == 1
+    expected = StationaryCombustion({'stationarySourceFuelConsumption': rows}).to_dict()
+    assert outputs[0]['totalCO2EquivalentEmissions'] == pytest.approx(expected['totalCO2EquivalentEmissions'])
+
+
+def test_csv_group_by_and_set(tmp_path, documents):
+    waste_gases = documents['waste-gases']
+    rows = waste_gases['emissionFactorForGasWasteStream']
+    fields = {key: waste_gases[key] for key in ('wasteStreamGasCombusted', 'gasTotalNumberOfMolesPerUnitVolume',
+                                                'oxidationFactor')}
+    groups = [rows[:2], rows[2:]]
+    input_path = tmp_path / 'input.csv'
+    write_csv(input_path, [{'stream': f'stream-{i}', **row} for i, group in enumerate(groups) for row in group])
+    output_path = tmp_path / 'output.jsonl'
+    settings = [f'--set={key}={value}' for key, value in fields.items()]
+
+    assert main([str(input_path), '-o', str(output_path), '--type', 'waste-gases', '--group-by', 'stream',
+                 '--set', 'version=waste-gases.1.0.0', *settings]) == 0
+    outputs = read_outputs(output_path)
+    assert len(outputs) == len(groups)
+    for group, output in zip(groups, outputs):
+        expected = WasteGases({**fields, 'emissionFactorForGasWasteStream': group}).to_dict()
+        assert output['totalCO2EquivalentEmissions'] == pytest.approx(expected['totalCO2EquivalentEmissions'])
+        assert all('stream' not in row for row in output['emissionFactorForGasWasteStream'])
+
+
+def test_csv_numeric_looking_strings(tmp_path):
+    input_path = tmp_path / 'input.csv'
+    input_path.write_text(ELECTRICITY_CSV_HEADER + '1001,007,,akgd,2500,,,\n', encoding='utf-8')
+    output_path = tmp_path / 'output.jsonl'
+
+    assert main([str(input_path), '-o', str(output_path), '--type', 'electricity', '--validate']) == 0
+    row = read_outputs(output_path)[0]['totalElectricityPurchased'][0]
+    assert row['sourceId'] == '1001' and row['sourceDescription'] == '007'
+    assert row['sourceArea'] is None and row['electricityPurchased'] == 2500
+
+
+def test_csv_requires_type(tmp_path):
+    with pytest.raises(SystemExit):
+        main([str(tmp_path / 'input.csv')])
+    with pytest.raises(SystemExit):
+        main(['--format', 'csv', '--type', 'commuting'])
+    with pytest.raises(SystemExit):
+        main(['--format', 'csv', '--type', 'commuting', '--set', 'version'])
+    with pytest.raises(SystemExit):
+        main(['--format', 'csv', '--type', 'electricity', '--set', 'totalElectricityPurchased=1'])
+    with pytest.raises(SystemExit):
+        main([str(tmp_path / 'input.jsonl'), '--group-by', 'sourceId'])
+
+
+def test_column_types():
+    types = column_types('stationary-combustion', 'stationarySourceFuelConsumption')
+    assert types['sourceId'] == ('string',) and types['quantityCombusted'] == ('number', 'null')
+    assert column_types('stationary-combustion', 'noSuchTable') == {}
+
+
+def test_parse_value():
+    assert parse_value('') is None
+    assert parse_value('12') == 12
+    assert parse_value('1.5') == 1.5
+    assert parse_value('nan') == 'nan'
+    assert parse_value('gallons') == 'gallons'
+    assert parse_value('007', ('string',)) == '007'
+    assert parse_value('', ('string',)) == ''
+    assert parse_value('', ('string', 'null')) is None
+    assert parse_value('12', ('number', 'null')) == 12
+
+
+def test_stdin(jsonl_input, documents):
+    with open(jsonl_input, 'rb') as stdin:
+        completed = subprocess.run([sys.executable, '-m', 'atomic6ghg'], stdin=stdin, capture_output=True, check=False)
+    assert completed.returncode == 1
+    outputs = [json.loads(line) for line in completed.stdout.splitlines()]
+    assert len(outputs) == len(documents) + 1
+    assert outputs[0] == expected_output(next(iter(documents.values())))
+
+
+def test_csv_validate_rows(tmp_path):
+    input_path = tmp_path / 'input.csv'
+    input_path.write_text(ELECTRICITY_CSV_HEADER + 'Bldg-1,,,akgd,2500,,,\nBldg-2,,,akgd,a lot,,,\n',
+                          encoding='utf-8')
+    output_path = tmp_path / 'output.jsonl'
+
+    assert main([str(input_path), '-o', str(output_path), '--type', 'electricity', '--group-by', 'sourceId',
+                 '--validate']) == 1
+    valid_output, invalid_output = read_outputs(output_path)
+    assert valid_output['totalElectricityPurchased'][0]['sourceId'] == 'Bldg-1'
+    assert invalid_output['error'].startswith('ValidationError')
+
+    input_path.write_text(ELECTRICITY_CSV_HEADER + 'Bldg-1,,,akgd,2500,,,\n', encoding='utf-8')
+    assert main([str(input_path), '-o', str(output_path), '--type', 'electricity', '--set', 'version=1',
+                 '--validate']) == 1
+    assert read_outputs(output_path)[0]['error'].startswith('ValidationError')
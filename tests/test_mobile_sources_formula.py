@@ -2,6 +2,7 @@ import pytest
 import json
 import os
 
+from atomic6ghg import json_backend
 from atomic6ghg.formulas import MobileSources
 
 
@@ -252,3 +253,170 @@ def test_output_schema_compliance(calculated_data, canonical_data, mobile_source
     output = calculated_data.to_dict()
     output['version'] = canonical_data['version']
     mobile_sources_schema.validate(output)
+
+
+@pytest.fixture
+def canonical_columns(canonical_data):
+    rows = canonical_data['mobileSourcesFuelConsumption']
+    columns = {key: [row[key] for row in rows]
+               for key in ('vehicleType', 'fuelType', 'vehicleYear', 'fuelUsage', 'milesTraveled')}
+    return {'biodieselPercent': canonical_data['biodieselPercent'],
+            'ethanolPercent': canonical_data['ethanolPercent'],
+            'mobileSourcesFuelConsumption': columns}
+
+
+def assert_same_output(expected, actual):
+    if isinstance(expected, dict):
+        assert expected.keys() == actual.keys()
+        for key in expected:
+            assert_same_output(expected[key], actual[key])
+    elif isinstance(expected, list):
+        assert len(expected) == len(actual)
+        for expected_item, actual_item in zip(expected, actual):
+            assert_same_output(expected_item, actual_item)
+    elif isinstance(expected, (int, float)):
+        assert actual == pytest.approx(expected)
+    else:
+        assert expected == actual
+
+
+def test_recalc_columns(calculated_data, canonical_columns):
+    np = pytest.importorskip('numpy')
+    columnar = MobileSources()
+    output = columnar.recalc_columns(canonical_columns)
+
+    expected = calculated_data.to_dict()
+    for key in expected:
+        if key != 'mobileSourcesFuelConsumption':
+            assert_same_output(expected[key], output[key])
+
+    row_emissions = output['mobileSourcesFuelConsumption']
+    n_rows = len(canonical_columns['mobileSourcesFuelConsumption']['fuelType'])
+    for gas in ('CO2', 'CH4', 'N2O'):
+        assert isinstance(row_emissions[gas], np.ndarray)
+        assert len(row_emissions[gas]) == n_rows
+        assert row_emissions[gas].sum() == pytest.approx(columnar._total_emissions[gas])
+        assert columnar._total_emissions[gas] == pytest.approx(calculated_data._total_emissions[gas])
+
+    assert isinstance(columnar.to_json(), str)
+
+
+def test_recalc_columns_skips_rows_without_fuel_or_vehicle(canonical_columns):
+    pytest.importorskip('numpy')
+    columns = canonical_columns['mobileSourcesFuelConsumption']
+    columns['fuelType'][0] = None
+    columns['vehicleType'][1] = ''
+    output = MobileSources().recalc_columns(canonical_columns)
+
+    row_emissions = output['mobileSourcesFuelConsumption']
+    assert row_emissions['CO2'][0] == 0. and row_emissions['CH4'][0] == 0. and row_emissions['N2O'][0] == 0.
+    assert row_emissions['CO2'][1] > 0. and row_emissions['CH4'][1] == 0. and row_emissions['N2O'][1] == 0.
+
+
+def test_recalc_columns_invalid_input(canonical_columns):
+    pytest.importorskip('numpy')
+    columns = canonical_columns['mobileSourcesFuelConsumption']
+
+    columns['vehicleType'][0] = 'hovercraft'
+    with pytest.raises(ValueError):
+        MobileSources().recalc_columns(canonical_columns)
+
+
+@pytest.mark.parametrize('vehicle_year', [None, 'new', 2010.5, '2010'])
+def test_recalc_columns_skips_invalid_vehicle_years(canonical_data, canonical_columns, vehicle_year):
+    pytest.importorskip('numpy')
+    canonical_data['mobileSourcesFuelConsumption'][0]['vehicleYear'] = vehicle_year
+    canonical_columns['mobileSourcesFuelConsumption']['vehicleYear'][0] = vehicle_year
+    expected = MobileSources(canonical_data)
+
+    columnar = MobileSources()
+    output = columnar.recalc_columns(canonical_columns)
+
+    for key, value in expected.to_dict().items():
+        if key != 'mobileSourcesFuelConsumption':
+            assert_same_output(value, output[key])
+    for gas in ('CO2', 'CH4', 'N2O'):
+        assert columnar._total_emissions[gas] == pytest.approx(expected._total_emissions[gas])
+    if vehicle_year != '2010':
+        assert output['mobileSourcesFuelConsumption']['CH4'][0] == 0.
+
+
+def test_dense_year_tables_match_year_handler():
+    from atomic6ghg.factors import mobile_combustion_ch4_and_n2o_emission_factors as factors
+    from atomic6ghg import YearMapException
+    dense_year_tables = factors.dense_year_tables
+    for vehicle_type, fuel_type in dense_year_tables.pairs:
+        for year in list(range(1950, 2040)) + ['2010', 2010.0]:
+            try:
+                expected = factors[vehicle_type][fuel_type][year]
+            except YearMapException:
+                with pytest.raises(YearMapException):
+                    dense_year_tables.lookup(vehicle_type, fuel_type, year)
+                continue
+            assert dense_year_tables.lookup(vehicle_type, fuel_type, year) == \
+                (expected['ch4_factor'], expected['n2o_factor'], expected['year_display'])
+
+
+def test_unmappable_vehicle_year_is_skipped(canonical_data):
+    canonical_data['mobileSourcesFuelConsumption'][0]['vehicleYear'] = 'new'
+    output = MobileSources(canonical_data).to_dict()
+    assert output['totalCO2EquivalentEmissions'] > 0
+
+
+def test_output_encoded_once_per_recalc(canonical_data, calculated_data):
+    encoded = calculated_data.to_json()
+    assert calculated_data.to_json() is encoded
+    assert calculated_data.to_dict() is calculated_data._output
+
+    canonical_data['mobileSourcesFuelConsumption'][0]['fuelUsage'] *= 2
+    calculated_data.recalc(canonical_data)
+    assert calculated_data.to_json() is not encoded
+    assert calculated_data.to_json() != encoded
+
+
+def test_to_json_encodes_once_without_keeping_bytes(canonical_data, monkeypatch):
+    encodings = []
+    monkeypatch.setattr(json_backend, 'dumpb', lambda *args, **kwargs: encodings.append(args) or b'')
+    dumps = json_backend.dumps
+    monkeypatch.setattr(json_backend, 'dumps', lambda *args, **kwargs: encodings.append(args) or dumps(*args, **kwargs))
+    formula = MobileSources(canonical_data)
+    formula.to_dict()
+    formula.to_json()
+    formula.to_json()
+
+    assert len(encodings) == 1
+    assert not any(isinstance(kind, tuple) and kind[0] == 'bytes' for kind in formula._output_cache)
+
+
+def test_output_validation_can_be_disabled(calculated_data, monkeypatch):
+    calculated_data._output = {'a': object()}
+    assert calculated_data.to_dict() is None
+
+    monkeypatch.setattr(MobileSources, 'validate_output', False)
+    assert calculated_data.to_dict() is calculated_data._output
+
+
+def test_sparse_output(canonical_data, calculated_data, canonical_columns, monkeypatch, mobile_sources_schema):
+    expected = calculated_data.to_dict()
+    monkeypatch.setattr(MobileSources, 'sparse_output', True)
+    sparse = MobileSources(canonical_data)
+    output = sparse.to_dict()
+
+    rows = canonical_data['mobileSourcesFuelConsumption']
+    fuel_types = {MobileSources.co2_fuel_map.get(row['fuelType'], row['fuelType']) for row in rows
+                  if row['fuelType'] and row['fuelUsage']}
+    assert {row['fuelType'] for row in output['totalMobileSourcesFuelUsageAndCO2Emissions']} == fuel_types
+    key = 'totalOrganizationWideNonRoadMobileSourceFuelUsageAndEmissions'
+    assert sum(len(row['emissionByFuelType']) for row in output[key]) < \
+        sum(len(row['emissionByFuelType']) for row in expected[key])
+    for key in ('totalCO2EquivalentEmissions', 'totalBiomassCO2EquivalentEmissions'):
+        assert output[key] == pytest.approx(expected[key])
+    assert sparse.dense_output() == expected
+    mobile_sources_schema.validate({**output, 'version': canonical_data['version']})
+
+    pytest.importorskip('numpy')
+    columnar = MobileSources()
+    assert_same_output(output, {**columnar.recalc_columns(canonical_columns),
+                                'mobileSourcesFuelConsumption': output['mobileSourcesFuelConsumption']})
+    assert_same_output(expected, {**columnar.dense_output(),
+                                  'mobileSourcesFuelConsumption': expected['mobileSourcesFuelConsumption']})
@@ -0,0 +1,132 @@
+import copy
+import json
+import os
+
+import pytest
+
+from atomic6ghg.factors import register_edition, unregister_edition
+from atomic6ghg.formulas import BusinessTravel, Formula, StationaryCombustion
+from atomic6ghg.result_cache import DictBackend, RedisBackend, ResultCache, SqliteBackend
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+class LocalRedis:
+    """ In-memory stand-in for the redis-py client commands used by RedisBackend """
+    def __init__(self):
+        self.values = {}
+        self.sorted_sets = {}
+
+    def get(self, name):
+        return self.values.get(name)
+
+    def set(self, name, value):
+        self.values[name] = value
+
+    def delete(self, *names):
+        for name in names:
+            self.values.pop(name, None)
+            self.sorted_sets.pop(name, None)
+
+    def zadd(self, name, mapping):
+        self.sorted_sets.setdefault(name, {}).update(mapping)
+
+    def zcard(self, name):
+        return len(self.sorted_sets.get(name, {}))
+
+    def zrange(self, name, start, end):
+        members = sorted(self.sorted_sets.get(name, {}).items(), key=lambda item: item[1])
+        return [member.encode() for member, _ in members[start:None if end == -1 else end + 1]]
+
+    def zrem(self, name, *members):
+        for member in members:
+            self.sorted_sets.get(name, {}).pop(member, None)
+
+
+@pytest.fixture
+def business_travel_data():
+    with open(os.path.join(FIXTURES, 'business_travel_canonical_instance.json'), 'r', encoding='utf-8') as instance:
+        return json.load(instance)
+
+
+@pytest.fixture(params=['dict', 'sqlite', 'redis'])
+def backend(request, tmp_path):
+    if request.param == 'dict':
+        return DictBackend(max_entries=2)
+    if request.param == 'sqlite':
+        return SqliteBackend(tmp_path / 'results.sqlite', max_entries=2, evict_every=1)
+    return RedisBackend(LocalRedis(), max_entries=2)
+
+
+def test_cache_hits(monkeypatch, business_travel_data, backend):
+    cache = ResultCache(backend)
+    monkeypatch.setattr(Formula, 'result_cache', cache)
+    expected = BusinessTravel(copy.deepcopy(business_travel_data)).to_dict()
+    assert cache.stats() == {'hits': 0, 'misses': 1, 'entries': 1}
+
+    with Formula.instrument() as recorder:
+        formula = BusinessTravel(copy.deepcopy(business_travel_data))
+    assert formula.to_dict() == expected
+    assert [record['stage'] for record in recorder.records] == ['recalc']
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'entries': 1}
+
+    formula.to_dict()['totalCO2EquivalentEmissions'] = 0.
+    assert BusinessTravel(copy.deepcopy(business_travel_data)).to_dict() == expected
+
+    changed = copy.deepcopy(business_travel_data)
+    changed['airBusinessTravel'] = changed['airBusinessTravel'][1:]
+    assert BusinessTravel(changed).to_dict() != expected
+    assert cache.stats()['misses'] == 2
+
+
+def test_cache_eviction(monkeypatch, business_travel_data, backend):
+    cache = ResultCache(backend)
+    monkeypatch.setattr(Formula, 'result_cache', cache)
+    worksheets = [{**business_travel_data, 'airBusinessTravel': business_travel_data['airBusinessTravel'][i:]}
+                  for i in range(3)]
+    for wks_data in [worksheets[0], worksheets[1], worksheets[0], worksheets[2]]:
+        BusinessTravel(copy.deepcopy(wks_data))
+    assert cache.stats() == {'hits': 1, 'misses': 3, 'entries': 2}
+
+    BusinessTravel(copy.deepcopy(worksheets[0]))
+    BusinessTravel(copy.deepcopy(worksheets[1]))
+    assert cache.stats()['hits'] == 2 and cache.stats()['misses'] == 4
+
+    cache.clear()
+    assert cache.stats() == {'hits': 0, 'misses': 0, 'entries': 0}
+
+
+def test_cache_keys(monkeypatch, business_travel_data):
+    cache = ResultCache()
+    monkeypatch.setattr(Formula, 'result_cache', cache)
+    gwp = {'co2': 1, 'ch4': 28, 'n2o': 265}
+    register_edition('test-cache-ar5', tables={'refrigerants_gwp_factors.json': gwp})
+    try:
+        default = BusinessTravel(copy.deepcopy(business_travel_data))
+        restated = BusinessTravel(copy.deepcopy(business_travel_data), factor_set='test-cache-ar5')
+        assert cache.key(default, default.wks_data) != cache.key(restated, restated.wks_data)
+        assert restated.to_dict() != default.to_dict()
+        assert cache.stats()['misses'] == 2
+    finally:
+        unregister_edition('test-cache-ar5')
+
+    stationary = {'stationarySourceFuelConsumption': []}
+    echoed = StationaryCombustion(copy.deepcopy(stationary))
+    not_echoed = StationaryCombustion(copy.deepcopy(stationary), echo_input_rows=False)
+    assert cache.key(echoed, stationary) != cache.key(not_echoed, stationary)
+    assert cache.key(echoed, {'stationarySourceFuelConsumption': iter([])}) is None
+
+
+def test_cache_hit_validates_input(monkeypatch, business_travel_data):
+    pytest.importorskip('jsonschema')
+    from jsonschema import ValidationError
+    cache = ResultCache()
+    monkeypatch.setattr(Formula, 'result_cache', cache)
+    invalid = copy.deepcopy(business_travel_data)
+    invalid['airBusinessTravel'][0]['sourceId'] = 1001
+    BusinessTravel(copy.deepcopy(invalid))
+
+    monkeypatch.setattr(BusinessTravel, 'validate_input', True)
+    with pytest.raises(ValidationError):
+        BusinessTravel(copy.deepcopy(invalid))
+    assert cache.stats()['hits'] == 0
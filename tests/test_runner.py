@@ -0,0 +1,53 @@
+import pytest
+
+from atomic6ghg.formulas import Electricity, MobileSources, PurchasedOffsets
+from atomic6ghg.runner import CHUNKS_PER_WORKER, FORMULAS, compute_inventory, run_inventories, sum_scope_totals
+
+
+@pytest.fixture
+def inventory(documents):
+    return list(documents.values())
+
+
+def test_compute_inventory(inventory, documents):
+    result = compute_inventory(inventory)
+
+    assert sorted(output['type'] for output in result['outputs']) == sorted(FORMULAS)
+    electricity = Electricity(documents['electricity']).to_dict()
+    scope_totals = result['scopeTotals']
+    assert scope_totals['scope2LocationBased'] > electricity['CO2EquivalentEmissionsLocationBasedElectricityEmissions']
+    assert scope_totals['scope1'] > MobileSources(documents['mobile-sources']).to_dict()['totalCO2EquivalentEmissions']
+    assert scope_totals['offsets'] == \
+        PurchasedOffsets(documents['purchased-offsets']).to_dict()['totalPurchasedOffsets']
+    assert compute_inventory(documents, include_outputs=False) == {'scopeTotals': scope_totals}
+
+
+def test_unknown_document_type(inventory):
+    with pytest.raises(ValueError):
+        compute_inventory([{'version': 'unknown.1.0.0'}])
+
+
+def test_run_inventories(inventory):
+    inventories = [inventory, inventory[:3], inventory[5:]]
+    expected = [compute_inventory(documents, include_outputs=False) for documents in inventories]
+
+    assert list(run_inventories(inventories, workers=2, include_outputs=False)) == expected
+    assert list(run_inventories(iter(inventories), workers=1, include_outputs=False)) == expected
+    assert sum_scope_totals(expected)['scope3'] == pytest.approx(sum(result['scopeTotals']['scope3']
+                                                                     for result in expected))
+
+
+def test_run_inventories_reads_generator_lazily(inventory):
+    taken = []
+
+    def inventories():
+        for i in range(100):
+            taken.append(i)
+            yield inventory[:2]
+
+    results = run_inventories(inventories(), workers=2, chunksize=3, include_outputs=False)
+    first = next(results)
+    # two workers with CHUNKS_PER_WORKER chunks of three in flight, rather than the whole generator
+    assert len(taken) <= 2 * CHUNKS_PER_WORKER * 3 + 1
+    assert first == compute_inventory(inventory[:2], include_outputs=False)
+    assert len(list(results)) == 99
@@ -0,0 +1,55 @@
+import copy
+import json
+import os
+
+import pytest
+from jsonschema import ValidationError
+
+from atomic6ghg import schemas
+from atomic6ghg.formulas import Electricity
+from atomic6ghg.runner import FORMULAS
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+@pytest.fixture
+def electricity_data():
+    with open(os.path.join(FIXTURES, 'electricity_canonical_instance.json'), 'r', encoding='utf-8') as canonical:
+        return json.load(canonical)
+
+
+def test_validator_cached_per_type():
+    for wks_type in FORMULAS:
+        assert schemas.get_validator(wks_type) is schemas.get_validator(wks_type)
+    assert schemas.get_validator('electricity') is not schemas.get_validator('steam')
+
+
+def test_unknown_type():
+    with pytest.raises(ValueError):
+        schemas.get_validator('unknown')
+    with pytest.raises(ValueError):
+        schemas.validate({'version': 'unknown.1.0.0'})
+
+
+def test_validate_by_version(electricity_data):
+    schemas.validate(electricity_data)
+    assert schemas.is_valid(electricity_data)
+    assert not schemas.is_valid(electricity_data, 'steam')
+
+    electricity_data['totalElectricityPurchased'][0]['electricityPurchased'] = 'a lot'
+    assert not schemas.is_valid(electricity_data)
+    with pytest.raises(ValidationError):
+        schemas.validate(electricity_data)
+
+
+def test_validate_input_before_recalc(electricity_data, monkeypatch):
+    invalid = copy.deepcopy(electricity_data)
+    invalid['totalElectricityPurchased'][0]['electricityPurchased'] = 'a lot'
+    formula = Electricity(electricity_data)
+
+    monkeypatch.setattr(Electricity, 'validate_input', True)
+    assert Electricity(electricity_data).to_dict() == formula.to_dict()
+    with pytest.raises(ValidationError):
+        Electricity(invalid)
+    with pytest.raises(ValidationError):
+        formula.recalc(invalid)
@@ -0,0 +1,88 @@
+import http.client
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from atomic6ghg.formulas import Electricity
+from atomic6ghg.server import CalculationServer, Metrics
+from benchmarks.server import load_test
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+@pytest.fixture
+def electricity_data():
+    with open(os.path.join(FIXTURES, 'electricity_canonical_instance.json'), 'r', encoding='utf-8') as instance:
+        return json.load(instance)
+
+
+@pytest.fixture
+def server():
+    server = CalculationServer(('127.0.0.1', 0), metrics=Metrics(), max_body_bytes=64 * 1024)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(connection, path, body):
+    connection.request('POST', path, body, {'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_formula_endpoints(server, electricity_data):
+    connection = http.client.HTTPConnection(*server.server_address[:2])
+    expected = json.loads(json.dumps(Electricity(json.loads(json.dumps(electricity_data))).to_dict()))
+
+    # Both requests go over the same keep-alive connection
+    assert post(connection, '/electricity', json.dumps(electricity_data)) == (200, expected)
+    sock = connection.sock
+    assert post(connection, '/electricity', json.dumps(electricity_data)) == (200, expected)
+    assert connection.sock is sock
+
+    assert post(connection, '/electricity', '[1]')[0] == 400
+    assert post(connection, '/no_such_formula', '{}')[0] == 404
+    status, error = post(connection, '/electricity', json.dumps({'totalElectricityPurchased': [{
+        'eGridSubregion': 'akgd', 'electricityPurchased': 'a lot'}]}))
+    assert status == 422 and 'error' in error
+
+    connection.request('GET', '/metrics')
+    metrics = connection.getresponse().read().decode()
+    assert 'atomic6ghg_request_seconds_count{formula="electricity"} 4' in metrics
+    assert 'atomic6ghg_request_seconds_bucket{formula="electricity",le="+Inf"} 4' in metrics
+    assert 'atomic6ghg_request_errors_total{formula="electricity"} 2' in metrics
+    connection.close()
+
+
+def test_request_size_limit(server):
+    connection = http.client.HTTPConnection(*server.server_address[:2])
+    status, error = post(connection, '/electricity', b' ' * (64 * 1024 + 1))
+    assert status == 413 and 'exceeds' in error['error']
+    connection.close()
+
+
+def test_pre_forked_workers(electricity_data):
+    process = subprocess.Popen([sys.executable, '-m', 'atomic6ghg.server', '--port', '0', '--workers', '2'],
+                               stdout=subprocess.PIPE, text=True, cwd=os.path.join(os.path.dirname(__file__), '..'))
+    try:
+        url = process.stdout.readline().split()[-1]
+        summary = load_test(url, 'electricity', 20, clients=4, requests=5)
+        assert summary['requests'] == 20 and summary['errors'] == 0
+
+        host, port = url.rsplit('/', 1)[-1].split(':')
+        connection = http.client.HTTPConnection(host, int(port))
+        connection.request('GET', '/metrics')
+        assert 'atomic6ghg_request_seconds_count{formula="electricity"} 20' in \
+            connection.getresponse().read().decode()
+        connection.close()
+    finally:
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=10) == 0
+        process.stdout.close()
@@ -85,3 +85,69 @@ def test_output_schema_compliance(calculated_data, canonical_data, stationary_co
     output = calculated_data.to_dict()
     output['version'] = canonical_data['version']
     stationary_combustion_schema.validate(output)
+
+
+def test_apply_delta(canonical_data):
+    rows = canonical_data['stationarySourceFuelConsumption']
+    inserted = [dict(rows[0]), dict(rows[1])]
+    expected = StationaryCombustion({**canonical_data, 'stationarySourceFuelConsumption': rows + inserted}).to_dict()
+
+    stationary_combustion = StationaryCombustion(canonical_data)
+    output = stationary_combustion.apply_delta(inserted=inserted)
+
+    assert output['stationarySourceFuelConsumption'] == expected['stationarySourceFuelConsumption']
+    assert output['totalCO2EquivalentEmissions'] == pytest.approx(expected['totalCO2EquivalentEmissions'])
+    for row, expected_row in zip(output['totalStationarySourceCombustion'],
+                                 expected['totalStationarySourceCombustion']):
+        assert row['quantityCombusted'] == pytest.approx(expected_row['quantityCombusted'])
+
+
+def test_streaming_input(canonical_data, calculated_data):
+    rows = canonical_data['stationarySourceFuelConsumption']
+    expected = calculated_data.to_dict()
+
+    streamed = StationaryCombustion({**canonical_data, 'stationarySourceFuelConsumption': (row for row in rows)})
+    assert streamed.to_dict() == expected
+
+    not_echoed = StationaryCombustion({**canonical_data, 'stationarySourceFuelConsumption': iter(rows)},
+                                      echo_input_rows=False).to_dict()
+    assert not_echoed['stationarySourceFuelConsumption'] == []
+    for key in ('totalStationarySourceCombustion', 'totalGhgEmissionsFromStationarySourceFuelCombustion',
+                'totalCO2EquivalentEmissions', 'totalBiomassEquivalentEmissions'):
+        assert not_echoed[key] == expected[key]
+
+
+def test_compute_many(canonical_data):
+    rows = canonical_data['stationarySourceFuelConsumption']
+    documents = [{**canonical_data, 'stationarySourceFuelConsumption': rows[:i]} for i in (5, 0, 20)]
+
+    outputs = list(StationaryCombustion.compute_many(documents, echo_input_rows=False))
+
+    assert outputs == [StationaryCombustion(document, echo_input_rows=False).to_dict() for document in documents]
+
+
+def test_sparse_output(canonical_data, calculated_data, monkeypatch, stationary_combustion_schema):
+    rows = [row for row in canonical_data['stationarySourceFuelConsumption'] if row['fuelCombusted'] == 'naturalGas']
+    document = {**canonical_data, 'stationarySourceFuelConsumption': rows}
+    expected = StationaryCombustion(document).to_dict()
+
+    monkeypatch.setattr(StationaryCombustion, 'sparse_output', True)
+    sparse = StationaryCombustion(document)
+    output = sparse.to_dict()
+
+    assert [row['fuelType'] for row in output['totalStationarySourceCombustion']] == ['naturalGas']
+    assert [row['fuelType'] for row in output['totalGhgEmissionsFromStationarySourceFuelCombustion']] == \
+        ['naturalGas', 'totalFossilFuelEmissions', 'totalNonFossilFuelEmissions', 'totalEmissionsForAllFuels']
+    assert output['totalCO2EquivalentEmissions'] == expected['totalCO2EquivalentEmissions']
+    assert sparse.dense_output() == expected
+    stationary_combustion_schema.validate({**output, 'version': canonical_data['version']})
+
+    # Edits that add fuels change the shape of a sparse output, so apply_delta falls back to a full recalc
+    inserted = canonical_data['stationarySourceFuelConsumption']
+    expected = StationaryCombustion({**canonical_data, 'stationarySourceFuelConsumption': rows + inserted}).to_dict()
+    output = sparse.apply_delta(inserted=inserted)
+    assert len(output['totalStationarySourceCombustion']) > 1
+    assert output['totalCO2EquivalentEmissions'] == pytest.approx(expected['totalCO2EquivalentEmissions'])
+    for row, expected_row in zip(output['totalStationarySourceCombustion'],
+                                 expected['totalStationarySourceCombustion']):
+        assert row['quantityCombusted'] == pytest.approx(expected_row['quantityCombusted'])
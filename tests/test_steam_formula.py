@@ -1,4 +1,5 @@
 import pytest
+import copy
 import json
 import os
 
@@ -130,3 +131,58 @@ def test_output_schema_compliance(calculated_data, canonical_data, steam_schema)
     output = calculated_data.to_dict()
     output['version'] = canonical_data['version']
     steam_schema.validate(output)
+
+
+@pytest.fixture
+def canonical_columns(canonical_data):
+    rows = canonical_data['emissionFactorDataForSteamPurchased']
+    columns = {key: [row.get(key) for row in rows]
+               for key in ('sourceId', 'fuelType', 'steamPurchased', 'boilerEfficiency',
+                           *Steam.location_based_factor_keys, *Steam.market_based_factor_keys)}
+    return {**canonical_data, 'emissionFactorDataForSteamPurchased': columns}
+
+
+def test_calculate_row_emissions():
+    default_factors = (53.06, 1.0, 0.1)
+    row_emissions = Steam.calculate_row_emissions(1000, (None, 1.2, 0.), (54., None, 0.), default_factors, 0.85)
+
+    assert row_emissions == [
+        Steam.calculate_location_based_emissions_steam(1000, 'naturalGas', None, 0.85, 'co2'),
+        Steam.calculate_location_based_emissions_steam(1000, 'naturalGas', 1.2, 0.85, 'ch4'),
+        Steam.calculate_location_based_emissions_steam(1000, 'naturalGas', 0., 0.85, 'n2o'),
+        Steam.calculate_market_based_emissions_steam(1000, 'naturalGas', None, 54., 0.85, 'co2'),
+        Steam.calculate_market_based_emissions_steam(1000, 'naturalGas', 1.2, None, 0.85, 'ch4'),
+        Steam.calculate_market_based_emissions_steam(1000, 'naturalGas', 0., 0., 0.85, 'n2o')]
+
+
+def test_recalc_columns(calculated_data, canonical_columns):
+    np = pytest.importorskip('numpy')
+    columns = canonical_columns['emissionFactorDataForSteamPurchased']
+    columns['marketBasedEmissionFactorsCO2Factor'][1] = 80.
+    columns['boilerEfficiency'][1] = None
+    columns['fuelType'][2] = None
+    rows = copy.deepcopy(calculated_data.wks_data['emissionFactorDataForSteamPurchased'])
+    rows[1]['marketBasedEmissionFactorsCO2Factor'] = 80.
+    rows[1]['boilerEfficiency'] = None
+    rows[2]['fuelType'] = None
+    expected = Steam({'emissionFactorDataForSteamPurchased': rows}).to_dict()
+
+    columnar = Steam()
+    output = columnar.recalc_columns(canonical_columns)
+
+    for row, expected_row in zip(output['emissionsBySourceAndFuelType'], expected['emissionsBySourceAndFuelType']):
+        assert row == pytest.approx(expected_row)
+    for key in ('CO2EquivalentEmissionsLocationBasedElectricityEmissions',
+                'CO2EquivalentEmissionsMarketBasedElectricityEmissions'):
+        assert output[key] == pytest.approx(expected[key])
+    row_emissions = output['emissionFactorDataForSteamPurchased']
+    for key in Steam.emission_keys:
+        assert isinstance(row_emissions[key], np.ndarray)
+        assert row_emissions[key][2] == 0.
+        for i in (0, 1):
+            assert row_emissions[key][i] == pytest.approx(expected['emissionFactorDataForSteamPurchased'][i][key])
+    assert isinstance(columnar.to_json(), str)
+
+    columns['fuelType'][0] = 'peat'
+    with pytest.raises(ValueError):
+        Steam().recalc_columns(canonical_columns)